@@ -0,0 +1,120 @@
+"""
+Admission control for memory- and model-bound work
+
+A gate lets a fixed number of requests run a kind of work at once and a
+bounded number wait for a slot. Anything beyond that is refused at once, so
+a burst of uploads queues briefly or gets a quick 429/503 with Retry-After
+instead of piling up pandas parses until the process runs out of memory.
+Gates are per process; with several workers the limits apply to each.
+"""
+
+import math
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """Raised when a gate refuses work; carries the HTTP status and Retry-After seconds"""
+
+    def __init__(self, gate, status, retry_after, message):
+        super().__init__(message)
+        self.gate = gate
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A held slot; released on leaving its ``with`` block, or earlier by ``release()``"""
+
+    def __init__(self, gate):
+        self.gate = gate
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.gate._release(time.monotonic() - self.started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionGate:
+    """At most ``max_concurrent`` holders and ``max_queue`` waiters for one kind of work"""
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout=10.0):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.slots = threading.Semaphore(self.max_concurrent)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'timeout': 0}
+        # Moving average of how long a slot is held, for Retry-After
+        self.average_hold = 1.0
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained, at least 1"""
+        backlog = self.waiting + 1
+        return max(1, math.ceil(self.average_hold * backlog / self.max_concurrent))
+
+    def _reject(self, reason, status, message):
+        with self.lock:
+            self.rejected[reason] += 1
+            retry_after = self.retry_after()
+        raise Overloaded(self.name, status, retry_after, message)
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if there is room; returns a Ticket or raises Overloaded"""
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                queue_full = self.waiting >= self.max_queue
+                if not queue_full:
+                    self.waiting += 1
+            if queue_full:
+                self._reject('queue_full', 429, f'Too many {self.name} requests in progress, retry later')
+            try:
+                acquired = self.slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+            if not acquired:
+                self._reject('timeout', 503, f'Timed out waiting for a free {self.name} slot, retry later')
+        with self.lock:
+            self.active += 1
+            self.admitted += 1
+        return Ticket(self)
+
+    def check(self):
+        """Raise Overloaded if a request arriving now would be refused, without taking a slot
+
+        Lets an endpoint turn a request away before reading its body.
+        """
+        with self.lock:
+            refuse = self.active >= self.max_concurrent and self.waiting >= self.max_queue
+        if refuse:
+            self._reject('queue_full', 429, f'Too many {self.name} requests in progress, retry later')
+
+    def _release(self, held):
+        with self.lock:
+            self.active -= 1
+            self.average_hold = 0.8 * self.average_hold + 0.2 * held
+        self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'active': self.active,
+                'waiting': self.waiting,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected)
+            }
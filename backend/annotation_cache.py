@@ -0,0 +1,168 @@
+"""
+Content-addressed cache for model-generated column annotations
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Every worker process shares the file; a writer waits this long for another's lock
+BUSY_TIMEOUT_SECONDS = 10
+# Expired and surplus rows are pruned once per this many puts, not on every one
+PRUNE_EVERY = 100
+# Disk hits' access times are written in batches of this many
+TOUCH_BATCH = 64
+
+
+def annotation_key(kind, columns, sample_rows, model):
+    """Hash the normalized (columns, sampled values, model) that produced an annotation
+
+    Column order and surrounding whitespace do not change the meaning of a
+    schema, so columns are stripped and sorted; sample rows keep their order
+    but their values are compared as strings.
+    """
+    normalized = {
+        'kind': kind,
+        'model': model,
+        'columns': sorted(str(col).strip() for col in columns),
+        'sample': [
+            [[str(key).strip(), '' if value is None else str(value).strip()]
+             for key, value in sorted(row.items(), key=lambda item: str(item[0]))]
+            for row in sample_rows
+        ]
+    }
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class AnnotationCache:
+    """Two-level LRU/TTL cache: an in-process dict in front of a SQLite file
+
+    The file is shared by all worker processes (WAL, so readers never wait on
+    a writer). Access times of disk hits are buffered and written with the next
+    put or once a batch is full, and eviction runs every ``PRUNE_EVERY`` puts
+    over indexed columns, so a lookup or store stays a single-row operation.
+    """
+
+    def __init__(self, db_path, max_entries=1024, max_disk_entries=100000, ttl_seconds=7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.touched = {}
+        self.unpruned_puts = 0
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS annotations ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS annotations_accessed_at ON annotations (accessed_at)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS annotations_created_at ON annotations (created_at)')
+        self.db.commit()
+
+    def get(self, key):
+        """Return the cached value for ``key``, or None on a miss or expiry"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self.memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.memory[key]
+
+            row = self.db.execute(
+                'SELECT value, created_at FROM annotations WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+
+            value = json.loads(row[0])
+            self.touched[key] = now
+            if len(self.touched) >= TOUCH_BATCH:
+                self._write_touched()
+                self.db.commit()
+            self._remember(key, value, row[1])
+            self.hits += 1
+            self.disk_hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store ``value`` in memory and on disk, evicting the oldest entries"""
+        now = time.time()
+        with self.lock:
+            self._remember(key, value, now)
+            self.db.execute(
+                'INSERT OR REPLACE INTO annotations (key, value, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now, now)
+            )
+            self.touched.pop(key, None)
+            self._write_touched()
+            self.unpruned_puts += 1
+            if self.unpruned_puts >= PRUNE_EVERY:
+                self._prune(now)
+                self.unpruned_puts = 0
+            self.db.commit()
+
+    def _write_touched(self):
+        if self.touched:
+            self.db.executemany('UPDATE annotations SET accessed_at = ? WHERE key = ?',
+                                [(accessed_at, key) for key, accessed_at in self.touched.items()])
+            self.touched.clear()
+
+    def _prune(self, now):
+        """Drop expired rows, then the least recently used ones over ``max_disk_entries``"""
+        self.db.execute('DELETE FROM annotations WHERE created_at < ?', (now - self.ttl_seconds,))
+        surplus = self.db.execute('SELECT COUNT(*) FROM annotations').fetchone()[0] - self.max_disk_entries
+        if surplus > 0:
+            self.db.execute(
+                'DELETE FROM annotations WHERE key IN ('
+                'SELECT key FROM annotations ORDER BY accessed_at LIMIT ?)',
+                (surplus,)
+            )
+
+    def _remember(self, key, value, created_at):
+        self.memory[key] = (value, created_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """Return hit/miss counters and current sizes"""
+        with self.lock:
+            disk_entries = self.db.execute('SELECT COUNT(*) FROM annotations').fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_entries': len(self.memory),
+                'disk_entries': disk_entries
+            }
+
+    def close(self):
+        with self.lock:
+            self._write_touched()
+            self.db.commit()
+            self.db.close()
@@ -0,0 +1,196 @@
+"""
+Synthetic city datasets for benchmarks
+
+Each generator writes a CSV shaped like a real open-data export: GTFS
+stop_times, 311 service requests (San Antonio's column layout) and the
+pavement inventory used in test_gemini.py. Values come from a seeded
+generator, so the same arguments always produce the same bytes. Rows are
+built column-wise with numpy and written in chunks, so large files do not
+need to fit in memory. ``extra_columns`` pads the layout with filler
+columns to test wide files.
+
+Run from backend/:  python bench/generators.py 311 --rows 100000 -o 311.csv
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 100_000
+EPOCH = np.datetime64('2023-01-01T00:00:00')
+
+STREETS = np.array(['ELM PARK DR', 'BROADWAY', 'N MAIN AVE', 'CULEBRA RD', 'BANDERA RD', 'SW MILITARY DR',
+                    'FREDERICKSBURG RD', 'S FLORES ST', 'NACOGDOCHES RD', 'BLANCO RD'], dtype=object)
+CASE_TYPES = np.array([
+    ('Solid Waste Management', 'Missed Pickup', 'Trash'),
+    ('Solid Waste Management', 'Bulky Item Pickup', 'Bulky'),
+    ('Code Enforcement Services', 'Overgrown Yard/Trash', 'Code'),
+    ('Code Enforcement Services', 'Junk Vehicle On Private Property', 'Code'),
+    ('Animal Care Services', 'Stray Animal', 'Animal'),
+    ('Animal Care Services', 'Aggressive Animal(Non-Critical)', 'Animal'),
+    ('Transportation & Capital Improvements', 'Pot Hole Repair', 'Streets'),
+    ('Transportation & Capital Improvements', 'Traffic Signal Malfunction', 'Traffic'),
+    ('Parks and Recreation', 'Park Maintenance', 'Parks'),
+], dtype=object)
+
+
+def _timestamps(rng, rows, span_days=365):
+    seconds = rng.integers(0, span_days * 86400, size=rows)
+    return EPOCH + seconds.astype('timedelta64[s]')
+
+
+def _format(timestamps, fmt='%Y-%m-%d %H:%M:%S'):
+    return pd.DatetimeIndex(timestamps).strftime(fmt)
+
+
+def _pad(frame, rng, extra_columns):
+    """Add filler columns cycling through integer, float and text values"""
+    rows = len(frame)
+    for i in range(extra_columns):
+        kind = i % 3
+        if kind == 0:
+            frame[f'extra_{i}'] = rng.integers(0, 100_000, size=rows)
+        elif kind == 1:
+            values = np.round(rng.normal(100, 25, size=rows), 3)
+            values[rng.random(rows) < 0.05] = np.nan
+            frame[f'extra_{i}'] = values
+        else:
+            frame[f'extra_{i}'] = np.char.add('code-', rng.integers(0, 500, size=rows).astype(str))
+    return frame
+
+
+def gtfs_stop_times(rng, start, rows):
+    """GTFS stop_times.txt: trips of 40 stops with increasing times"""
+    row = np.arange(start, start + rows)
+    trip = row // 40
+    sequence = row % 40 + 1
+    seconds = 5 * 3600 + (trip % 200) * 300 + sequence * rng.integers(60, 180, size=rows)
+    arrival = [f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}' for s in seconds.tolist()]
+    departure = [f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}' for s in (seconds + 30).tolist()]
+    return pd.DataFrame({
+        'trip_id': np.char.add('T', trip.astype(str)),
+        'arrival_time': arrival,
+        'departure_time': departure,
+        'stop_id': rng.integers(1, 7000, size=rows),
+        'stop_sequence': sequence,
+        'stop_headsign': '',
+        'pickup_type': rng.choice([0, 0, 0, 1], size=rows),
+        'drop_off_type': rng.choice([0, 0, 0, 1], size=rows),
+        'shape_dist_traveled': np.round(sequence * rng.uniform(0.2, 0.6, size=rows), 4),
+        'timepoint': rng.choice([0, 1], size=rows)
+    })
+
+
+def service_requests_311(rng, start, rows):
+    """311 cases with open/close times, SLA dates and state-plane coordinates"""
+    opened = _timestamps(rng, rows)
+    hours = rng.gamma(1.5, 48, size=rows).astype('timedelta64[h]')
+    closed = opened + hours
+    sla = opened + rng.choice([48, 72, 120, 240], size=rows).astype('timedelta64[h]')
+    still_open = rng.random(rows) < 0.1
+    kinds = CASE_TYPES[rng.integers(0, len(CASE_TYPES), size=rows)]
+    closed_text = np.where(still_open, '', _format(closed))
+    return pd.DataFrame({
+        'CASEID': 1_000_000 + np.arange(start, start + rows),
+        'OPENEDDATETIME': _format(opened),
+        'SLA_Date': _format(sla),
+        'CLOSEDDATETIME': closed_text,
+        'Late (Yes/No)': np.where(~still_open & (closed > sla), 'YES', 'NO'),
+        'Dept': kinds[:, 0],
+        'REASONNAME': kinds[:, 2],
+        'TYPENAME': kinds[:, 1],
+        'CaseStatus': np.where(still_open, 'Open', 'Closed'),
+        'SourceID': rng.choice(['Web Portal', 'Constituent Call', 'Internal Services Requests', 'Mobile App'], size=rows),
+        'OBJECTDESC': (rng.integers(100, 9999, size=rows).astype(str).astype(object) + ' '
+                       + STREETS[rng.integers(0, len(STREETS), size=rows)]),
+        'Council District': rng.integers(1, 11, size=rows),
+        'XCOORD': np.round(rng.uniform(2_080_000, 2_180_000, size=rows), 1),
+        'YCOORD': np.round(rng.uniform(13_660_000, 13_760_000, size=rows), 1)
+    })
+
+
+def pavement(rng, start, rows):
+    """Street segment inventory with condition scores and Google Maps links"""
+    latitude = rng.uniform(29.25, 29.70, size=rows)
+    longitude = rng.uniform(98.30, 98.75, size=rows)
+    links = [f'http://www.google.com/maps/place/{lat:.8f}N {lon:012.8f}W'
+             for lat, lon in zip(latitude.tolist(), longitude.tolist())]
+    length = np.round(rng.lognormal(6.5, 0.8, size=rows), 6)
+    created = _timestamps(rng, rows, span_days=3650)
+    return pd.DataFrame({
+        'CartID': 300_000 + np.arange(start, start + rows),
+        'Comments': rng.choice(['', 'Field Calculated Length', 'Verified by inspector', 'Pending review'], size=rows),
+        'District': rng.integers(1, 11, size=rows).astype(str),
+        'FromStreet': STREETS[rng.integers(0, len(STREETS), size=rows)],
+        'GlobalID': [f'{{{high:08X}-{mid >> 16:04X}-{mid & 0xFFFF:04X}-{low >> 48:04X}-{low & 0xFFFFFFFFFFFF:012X}}}'
+                     for high, mid, low in zip(rng.integers(0, 2 ** 32, size=rows).tolist(),
+                                               rng.integers(0, 2 ** 32, size=rows).tolist(),
+                                               rng.integers(0, 2 ** 63, size=rows).tolist())],
+        'GoogleMapView': links,
+        'Historical_ID': np.where(rng.random(rows) < 0.2, np.nan, 300_000 + np.arange(start, start + rows)),
+        'InstallDate': _format(_timestamps(rng, rows, span_days=40 * 365) - np.timedelta64(40 * 365, 'D'), '%Y-%m-%d'),
+        'Jurisdiction': 'San Antonio',
+        'LengthFeet': length,
+        'MSAG_Name': STREETS[rng.integers(0, len(STREETS), size=rows)],
+        'MaintenanceResponsibility': 'COSA - Public Works Dept',
+        'OBJECTID': np.arange(start, start + rows) + 1,
+        'OneWay': rng.choice(['No', 'No', 'No', 'Yes'], size=rows),
+        'Owner': 'San Antonio',
+        'PCI': np.round(rng.uniform(10, 100, size=rows), 1),
+        'PavementWidth': rng.choice([20.0, 24.0, 30.0, 36.0, 44.0], size=rows),
+        'ProjectName': 'Unknown',
+        'ROAD_CLASSIFICATION': rng.integers(1, 6, size=rows),
+        'ROW_Type': 'Street',
+        'RoadFunction': rng.choice(['Local', 'Collector', 'Arterial'], size=rows),
+        'Shape_Length': length,
+        'SpeedLimit': rng.choice([0, 30, 35, 40, 45], size=rows),
+        'Stage': rng.choice(['Existing', 'Planned'], size=rows),
+        'Status': rng.choice(['Active', 'Inactive'], size=rows),
+        'Surface_Type': rng.choice(['Asphalt', 'Concrete', 'Chip Seal'], size=rows),
+        'SweepingSchedule': rng.choice(['Monthly', 'Quarterly', ''], size=rows),
+        'ToStreet': STREETS[rng.integers(0, len(STREETS), size=rows)],
+        'VendorComments': '',
+        'VendorProjectName': '',
+        'created_date': _format(created),
+        'created_user': rng.choice(['GIS_ADMIN', 'PW_EDITOR'], size=rows),
+        'last_edited_date': _format(created + rng.integers(0, 86400 * 90, size=rows).astype('timedelta64[s]')),
+        'last_edited_user': rng.choice(['GIS_ADMIN', 'PW_EDITOR'], size=rows)
+    })
+
+
+GENERATORS = {
+    'gtfs': gtfs_stop_times,
+    '311': service_requests_311,
+    'pavement': pavement
+}
+
+
+def write_dataset(kind, path, rows, extra_columns=0, seed=0, chunk_rows=CHUNK_ROWS):
+    """Write ``rows`` rows of a synthetic dataset to ``path``; returns the column names"""
+    make = GENERATORS[kind]
+    rng = np.random.default_rng(seed)
+    columns = None
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for start in range(0, max(rows, 1), chunk_rows):
+            count = min(chunk_rows, rows - start)
+            frame = _pad(make(rng, start, max(count, 0)), rng, extra_columns)
+            frame.to_csv(f, index=False, header=columns is None)
+            columns = list(frame.columns)
+    return columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic city dataset as CSV')
+    parser.add_argument('kind', choices=sorted(GENERATORS))
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--extra-columns', type=int, default=0, help='filler columns added after the real ones')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', required=True)
+    args = parser.parse_args()
+    columns = write_dataset(args.kind, args.output, args.rows, args.extra_columns, args.seed)
+    print(f'Wrote {args.rows} rows x {len(columns)} columns to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
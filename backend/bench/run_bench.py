@@ -0,0 +1,242 @@
+"""
+End-to-end API benchmark against synthetic city data and a stub model
+
+For each dataset a CSV is generated, then the app is driven through the
+Flask test client:
+
+  upload            POST /api/upload, new content each time
+  upload_duplicate  POST /api/upload, content already stored
+  file_info         GET /api/files/<filename>
+  download          POST /api/download, streaming the stored file
+  column_description  POST /api/get_column_description, cycling columns
+
+Model calls go to stub_gemini on a local port, so runs need no key and
+latency and error rates can be set. The app runs against a temporary
+uploads folder. The JSON report (throughput, p50/p99 latency, peak RSS)
+can be passed back with --compare to flag regressions.
+
+Run from backend/:
+  python bench/run_bench.py --rows 50000 --output bench.json
+  python bench/run_bench.py --rows 50000 --compare bench.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from generators import GENERATORS, write_dataset  # noqa: E402
+from stub_gemini import start_stub_server  # noqa: E402
+
+# Metrics where a larger value is worse, used by --compare
+LOWER_IS_BETTER = ('p50_ms', 'p99_ms')
+HIGHER_IS_BETTER = ('throughput_rps',)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Timer:
+    """Collects per-request latencies for one endpoint"""
+
+    def __init__(self):
+        self.durations = []
+        self.errors = 0
+        self.bytes = 0
+
+    def measure(self, fn):
+        start = time.perf_counter()
+        response = fn()
+        body = response.get_data()
+        self.durations.append(time.perf_counter() - start)
+        self.bytes += len(body)
+        if response.status_code >= 400:
+            self.errors += 1
+        return response
+
+    def summary(self, payload_bytes=None):
+        durations = np.array(self.durations)
+        total = float(durations.sum())
+        result = {
+            'requests': len(durations),
+            'errors': self.errors,
+            'total_s': round(total, 4),
+            'throughput_rps': round(len(durations) / total, 2) if total else None,
+            'p50_ms': round(float(np.percentile(durations, 50)) * 1000, 3),
+            'p99_ms': round(float(np.percentile(durations, 99)) * 1000, 3),
+            'response_bytes': self.bytes
+        }
+        if payload_bytes is not None and total:
+            result['mb_per_s'] = round(payload_bytes / total / (1024 * 1024), 2)
+        return result
+
+
+def load_app(workdir, stub, rate_limit):
+    """Build the app configured for a scratch uploads folder and the stub model"""
+    os.environ.update({
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'GOOGLE_API_KEY': os.environ.get('GOOGLE_API_KEY') or 'bench-key',
+        'GEMINI_BASE_URL': stub.base_url,
+        'GEMINI_RATE_LIMIT': str(rate_limit),
+        'GEMINI_RATE_BURST': str(max(1, int(rate_limit))),
+    })
+    from app import create_app
+    app = create_app()
+    app.extensions['csv_analyzer'].warm_up()
+    return app
+
+
+def bench_dataset(app, kind, path, columns, iterations, run_async):
+    client = app.test_client()
+    with open(path, 'rb') as f:
+        body = f.read()
+    # Repeating the last row makes each upload new content, so the full path is measured
+    last_row = body[body.rstrip(b'\n').rfind(b'\n') + 1:]
+    query = '?async=1' if run_async else ''
+    endpoints = {}
+
+    timer = Timer()
+    for i in range(iterations):
+        data = body + last_row * i
+        timer.measure(lambda: client.post(f'/api/upload{query}', content_type='multipart/form-data',
+                                          data={'file': (io.BytesIO(data), f'{kind}-{i}.csv')}))
+    endpoints['upload'] = timer.summary(payload_bytes=len(body) * iterations)
+
+    timer = Timer()
+    for i in range(iterations):
+        timer.measure(lambda: client.post(f'/api/upload{query}', content_type='multipart/form-data',
+                                          data={'file': (io.BytesIO(body), f'{kind}-copy-{i}.csv')}))
+    endpoints['upload_duplicate'] = timer.summary(payload_bytes=len(body) * iterations)
+
+    filename = f'{kind}-0.csv'
+    timer = Timer()
+    for _ in range(iterations):
+        timer.measure(lambda: client.get(f'/api/files/{filename}'))
+    endpoints['file_info'] = timer.summary()
+    sample = client.get(f'/api/files/{filename}').get_json()['file_info']['sample']
+
+    timer = Timer()
+    for _ in range(iterations):
+        timer.measure(lambda: client.post('/api/download', json={'filename': filename}))
+    endpoints['download'] = timer.summary(payload_bytes=len(body) * iterations)
+
+    timer = Timer()
+    for i in range(iterations):
+        column = columns[i % len(columns)]
+        timer.measure(lambda: client.post('/api/get_column_description',
+                                          json={'column_name': column, 'sample_data': sample}))
+    endpoints['column_description'] = timer.summary()
+
+    return {
+        'rows': sum(1 for _ in io.BytesIO(body)) - 1,
+        'columns': len(columns),
+        'file_bytes': len(body),
+        'endpoints': endpoints,
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Print relative changes against a baseline report; returns the regressions found"""
+    regressions = []
+    for kind, dataset in report['datasets'].items():
+        base_dataset = baseline.get('datasets', {}).get(kind)
+        if not base_dataset:
+            continue
+        for endpoint, metrics in dataset['endpoints'].items():
+            base = base_dataset['endpoints'].get(endpoint)
+            if not base:
+                continue
+            for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+                if not metrics.get(metric) or not base.get(metric):
+                    continue
+                change = metrics[metric] / base[metric] - 1
+                worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+                flag = '  REGRESSION' if worse else ''
+                print(f'{kind:>9} {endpoint:<19} {metric:<15} {base[metric]:>10} -> {metrics[metric]:>10} '
+                      f'({change:+.1%}){flag}')
+                if worse:
+                    regressions.append((kind, endpoint, metric, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the API on synthetic city datasets')
+    parser.add_argument('--datasets', nargs='+', choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--extra-columns', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=10, help='requests per endpoint')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--async-annotations', action='store_true', help='upload with ?async=1')
+    parser.add_argument('--stub-latency', type=float, default=0.2, help='mean stub response time in seconds')
+    parser.add_argument('--stub-error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=1000.0, help='model calls per second allowed by the client')
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--compare', help='baseline report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='relative change counted as a regression')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch folder with generated data')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='csv-bench-')
+    stub = start_stub_server(latency=args.stub_latency, error_rate=args.stub_error_rate)
+    try:
+        app = load_app(workdir, stub, args.rate_limit)
+        report = {
+            'config': vars(args),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count()
+            },
+            'datasets': {}
+        }
+        for kind in args.datasets:
+            path = os.path.join(workdir, f'{kind}.csv')
+            columns = write_dataset(kind, path, args.rows, args.extra_columns, args.seed)
+            print(f'Benchmarking {kind} ({args.rows} rows x {len(columns)} columns)...', file=sys.stderr)
+            report['datasets'][kind] = bench_dataset(app, kind, path, columns, args.iterations,
+                                                     args.async_annotations)
+        report['peak_rss_mb'] = round(peak_rss_mb(), 1)
+        services = app.extensions['csv_analyzer']
+        report['model'] = dict(services.gemini_client.stats(), stub_requests=stub.requests_served)
+        report['annotation_cache'] = services.annotation_cache.stats()
+        services.shutdown()
+    finally:
+        stub.shutdown()
+        if args.keep:
+            print(f'Scratch files kept in {workdir}', file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    encoded = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(encoded)
+    elif not args.compare:
+        print(encoded)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        print(f'{len(regressions)} regression(s) beyond {args.tolerance:.0%}')
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Per-response serialization cost, old path versus the serialization module
+
+For each (rows, columns) size a frame with NaN, inf and 'nan' cells is
+turned into a response body twice:
+
+  legacy: replace/where over the whole frame, to_dict, recursive
+          clean_nan_values, then json.dumps (what the API used to do)
+  current: serialization.frame_records on the rows sent, then dumps
+
+Run from backend/:  python bench/serialization_bench.py [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import dumps, frame_records, orjson  # noqa: E402
+
+ROW_COUNTS = (5, 100, 1000, 10000)
+COLUMN_COUNTS = (10, 50, 200)
+FRAME_ROWS = 10000
+
+
+def legacy_clean(obj):
+    if isinstance(obj, dict):
+        return {key: legacy_clean(value) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [legacy_clean(item) for item in obj]
+    elif pd.isna(obj) or obj == 'nan' or str(obj).lower() == 'nan':
+        return None
+    else:
+        return obj
+
+
+def legacy_body(frame, rows):
+    clean = frame.replace({pd.NA: None, pd.NaT: None})
+    clean = clean.where(pd.notnull(clean), None)
+    records = clean.head(rows).to_dict(orient='records')
+    return json.dumps(legacy_clean({'success': True, 'rows': records})).encode('utf-8')
+
+
+def current_body(frame, rows):
+    return dumps({'success': True, 'rows': frame_records(frame, rows)})
+
+
+def make_frame(rows, columns, seed=0):
+    """Mixed float, integer and text columns with about 5% missing cells"""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(columns):
+        kind = i % 3
+        if kind == 0:
+            values = rng.normal(size=rows)
+            values[rng.random(rows) < 0.05] = np.nan
+            values[rng.random(rows) < 0.01] = np.inf
+        elif kind == 1:
+            values = rng.integers(0, 1_000_000, size=rows)
+        else:
+            values = rng.choice(np.array(['Open', 'Closed', 'Pending', 'nan', 'Duplicate'], dtype=object), size=rows)
+        data[f'col_{i}'] = values
+    return pd.DataFrame(data)
+
+
+def best_of(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(row_counts=ROW_COUNTS, column_counts=COLUMN_COUNTS, repeats=5):
+    results = []
+    for columns in column_counts:
+        frame = make_frame(FRAME_ROWS, columns)
+        for rows in row_counts:
+            legacy = best_of(lambda: legacy_body(frame, rows), repeats)
+            current = best_of(lambda: current_body(frame, rows), repeats)
+            results.append({
+                'rows': rows,
+                'columns': columns,
+                'legacy_ms': round(legacy * 1000, 3),
+                'current_ms': round(current * 1000, 3),
+                'speedup': round(legacy / current, 1)
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=list(ROW_COUNTS))
+    parser.add_argument('--columns', type=int, nargs='+', default=list(COLUMN_COUNTS))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.rows, args.columns, args.repeats)
+    if args.json:
+        print(json.dumps({'encoder': 'orjson' if orjson else 'json', 'results': results}, indent=2))
+        return
+
+    print(f"encoder: {'orjson' if orjson else 'json'}  (frame of {FRAME_ROWS} rows, best of {args.repeats})")
+    print(f"{'rows':>6} {'cols':>5} {'legacy ms':>11} {'current ms':>11} {'speedup':>8}")
+    for result in results:
+        print(f"{result['rows']:>6} {result['columns']:>5} {result['legacy_ms']:>11.3f} "
+              f"{result['current_ms']:>11.3f} {result['speedup']:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
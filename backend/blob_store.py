@@ -0,0 +1,84 @@
+"""
+Content-addressed storage for uploaded files
+
+Every upload is stored once under its SHA-256 in ``uploads/.blobs/`` and
+each filename in the uploads folder is a hard link to its blob. Identical
+files share one blob, while every other module keeps reading
+``uploads/<filename>`` as before. A blob with no filename left pointing at
+it is removed.
+"""
+
+import hashlib
+import os
+import uuid
+
+BLOB_DIRNAME = '.blobs'
+COPY_BLOCK_BYTES = 1024 * 1024
+
+
+def blob_path(upload_folder, sha256):
+    return os.path.join(upload_folder, BLOB_DIRNAME, sha256)
+
+
+def has_blob(upload_folder, sha256):
+    return os.path.exists(blob_path(upload_folder, sha256))
+
+
+def staging_path(upload_folder):
+    """Return a fresh path on the same filesystem as the blobs, for receiving a file"""
+    directory = os.path.join(upload_folder, BLOB_DIRNAME, 'incoming')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, uuid.uuid4().hex)
+
+
+def commit_blob(upload_folder, staged_path, sha256):
+    """Move a received file into the store, or discard it if that content is already stored"""
+    target = blob_path(upload_folder, sha256)
+    if os.path.exists(target):
+        os.remove(staged_path)
+    else:
+        os.replace(staged_path, target)
+    return target
+
+
+def save_stream(stream, path, block_bytes=COPY_BLOCK_BYTES):
+    """Write a readable binary stream to ``path``; returns its SHA-256, computed as the blocks go by"""
+    hasher = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while True:
+            block = stream.read(block_bytes)
+            if not block:
+                break
+            hasher.update(block)
+            f.write(block)
+    return hasher.hexdigest()
+
+
+def link_blob(upload_folder, sha256, filename):
+    """Point ``uploads/<filename>`` at a blob, atomically replacing whatever was there
+
+    A new name is linked and then renamed over the old one. Writing into the
+    existing path instead would change every other filename sharing its blob.
+    """
+    filepath = os.path.join(upload_folder, filename)
+    tmp_path = f'{filepath}.{uuid.uuid4().hex}.tmp'
+    os.link(blob_path(upload_folder, sha256), tmp_path)
+    os.replace(tmp_path, filepath)
+    if os.path.lexists(tmp_path):
+        # Renaming onto another link of the same blob is a no-op that keeps both names
+        os.remove(tmp_path)
+    return filepath
+
+
+def release_blob(upload_folder, sha256):
+    """Delete a blob once no filename links to it; returns True if it was removed"""
+    if not sha256:
+        return False
+    path = blob_path(upload_folder, sha256)
+    try:
+        if os.stat(path).st_nlink > 1:
+            return False
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
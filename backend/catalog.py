@@ -0,0 +1,262 @@
+"""
+Persistent catalog of uploaded files
+
+One SQLite row per upload holds what listings need (size, mtime, row and
+column counts, schema hash), so listing never touches the uploads folder.
+Pages use keyset cursors over indexed columns and prefix filters are
+index range scans, so a page costs the same however many files are stored.
+The same database holds the schema similarity index (see schema_index), kept
+in step with the rows here.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from metadata_store import file_signature, load_metadata
+from schema_index import SchemaIndex, metadata_signatures
+
+# API sort key -> catalog column; every one is indexed together with filename
+SORT_COLUMNS = {
+    'filename': 'filename',
+    'size': 'size',
+    'uploaded_at': 'mtime',
+    'num_rows': 'num_rows',
+    'num_columns': 'num_columns'
+}
+SELECTED = ('filename', 'size', 'mtime', 'num_rows', 'num_columns', 'schema_hash')
+# Unknown counts (files catalogued without metadata) sort before every real count
+MISSING_COUNT = -1
+
+
+def is_upload_name(name):
+    """True for names sync catalogs: CSV uploads and GTFS feed tables (``<feed>__<table>.txt``, see gtfs)"""
+    return name.endswith('.csv') or (name.endswith('.txt') and '__' in name and not name.startswith('.'))
+
+
+class CatalogError(ValueError):
+    """Raised for a malformed cursor or an unknown sort key"""
+
+
+def schema_hash(columns):
+    """Hash a file's ordered column names, so identical layouts can be grouped"""
+    encoded = json.dumps([str(col) for col in columns], separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def encode_cursor(sort, value, filename):
+    raw = json.dumps([sort, value, filename], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        cursor_sort, value, filename = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise CatalogError('Invalid cursor')
+    if cursor_sort != sort:
+        raise CatalogError('Cursor was issued for a different sort order')
+    return value, filename
+
+
+def prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with ``prefix``"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class UploadCatalog:
+    """SQLite-backed index of the files in the uploads folder"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS uploads ('
+            'filename TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, '
+            'num_rows INTEGER NOT NULL, num_columns INTEGER NOT NULL, '
+            'schema_hash TEXT, sha256 TEXT)'
+        )
+        for column in ('size', 'mtime', 'num_rows', 'num_columns'):
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS uploads_{column} ON uploads ({column}, filename)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS uploads_sha256 ON uploads (sha256)')
+        self.db.commit()
+        self.schemas = SchemaIndex(self.db, self.lock)
+
+    def upsert(self, filename, size, mtime, num_rows=None, num_columns=None, columns=None, sha256=None):
+        """Add or replace the entry for ``filename``"""
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO uploads '
+                '(filename, size, mtime, num_rows, num_columns, schema_hash, sha256) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (filename, size, mtime,
+                 MISSING_COUNT if num_rows is None else num_rows,
+                 MISSING_COUNT if num_columns is None else num_columns,
+                 None if columns is None else schema_hash(columns), sha256)
+            )
+            self.db.commit()
+
+    def record(self, metadata):
+        """Catalog an upload from its sidecar metadata (as returned by ``save_metadata``)"""
+        self.upsert(metadata['filename'], metadata['size'], metadata['mtime'],
+                    metadata['num_rows'], metadata['num_columns'], metadata['columns'], metadata['sha256'])
+        self.schemas.add(metadata['filename'], metadata_signatures(metadata))
+
+    def remove(self, filename):
+        """Drop ``filename``; returns True if it was catalogued"""
+        with self.lock:
+            removed = self.db.execute('DELETE FROM uploads WHERE filename = ?', (filename,)).rowcount
+            self.db.commit()
+        self.schemas.remove([filename])
+        return bool(removed)
+
+    def get(self, filename):
+        with self.lock:
+            row = self.db.execute(
+                f'SELECT {", ".join(SELECTED)} FROM uploads WHERE filename = ?',
+                (filename,)
+            ).fetchone()
+        return None if row is None else self._entry(row)
+
+    def get_sha256(self, filename):
+        """Return the content hash recorded for ``filename``, or None"""
+        with self.lock:
+            row = self.db.execute('SELECT sha256 FROM uploads WHERE filename = ?', (filename,)).fetchone()
+        return None if row is None else row[0]
+
+    def filenames_with_sha256(self, sha256, limit=5):
+        """Return a few filenames whose content hash is ``sha256``"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT filename FROM uploads WHERE sha256 = ? LIMIT ?', (sha256, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def is_empty(self):
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM uploads LIMIT 1').fetchone() is None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def list(self, sort='filename', descending=False, prefix=None, limit=100, cursor=None):
+        """Return one page of entries plus the cursor for the next page (None on the last)
+
+        Rows are ordered by the sort column and then by filename, and the
+        cursor carries the last row's pair, so pages stay stable while files
+        are added or removed.
+        """
+        if sort not in SORT_COLUMNS:
+            raise CatalogError(f'Unknown sort key: {sort}')
+        column = SORT_COLUMNS[sort]
+        where = []
+        params = []
+        if prefix:
+            where.append('filename >= ? AND filename < ?')
+            params.extend([prefix, prefix_upper_bound(prefix)])
+        if cursor:
+            value, filename = decode_cursor(cursor, sort)
+            op = '<' if descending else '>'
+            where.append(f'({column} {op} ? OR ({column} = ? AND filename {op} ?))')
+            params.extend([value, value, filename])
+        direction = 'DESC' if descending else 'ASC'
+        order = f'filename {direction}' if column == 'filename' else f'{column} {direction}, filename {direction}'
+
+        query = f'SELECT {", ".join(SELECTED)} FROM uploads'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += f' ORDER BY {order} LIMIT ?'
+        with self.lock:
+            rows = self.db.execute(query, params + [limit + 1]).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(sort, last[SELECTED.index(column)], last[0])
+        return [self._entry(row) for row in rows], next_cursor
+
+    def count(self, prefix=None):
+        with self.lock:
+            if prefix:
+                return self.db.execute(
+                    'SELECT COUNT(*) FROM uploads WHERE filename >= ? AND filename < ?',
+                    (prefix, prefix_upper_bound(prefix))
+                ).fetchone()[0]
+            return self.db.execute('SELECT COUNT(*) FROM uploads').fetchone()[0]
+
+    def sync(self, upload_folder):
+        """Reconcile the catalog with the uploads folder; returns (added_or_updated, removed)
+
+        Only needed for files copied in or deleted behind the API's back, and
+        to fill a new catalog. Counts come from fresh sidecars; files without
+        one are listed with unknown counts until their metadata is rebuilt.
+        """
+        on_disk = {}
+        if os.path.isdir(upload_folder):
+            with os.scandir(upload_folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and is_upload_name(entry.name):
+                        file_stat = entry.stat()
+                        on_disk[entry.name] = (file_stat.st_size, file_stat.st_mtime)
+
+        with self.lock:
+            known = {row[0]: (row[1], row[2]) for row in self.db.execute('SELECT filename, size, mtime FROM uploads')}
+        # A row is only dropped once its file is gone, so a name not recognised above keeps its entry
+        stale = [name for name in known
+                 if name not in on_disk and not os.path.isfile(os.path.join(upload_folder, name))]
+        changed = [name for name, signature in on_disk.items() if known.get(name) != signature]
+
+        for name in changed:
+            metadata = load_metadata(upload_folder, name)
+            if metadata is not None:
+                self.record(metadata)
+            else:
+                signature = file_signature(os.path.join(upload_folder, name))
+                self.upsert(name, signature['size'], signature['mtime'])
+                self.schemas.remove([name])
+        with self.lock:
+            self.db.executemany('DELETE FROM uploads WHERE filename = ?', [(name,) for name in stale])
+            self.db.commit()
+        self.schemas.remove(stale)
+        return len(changed), len(stale)
+
+    def unrecognised_files(self, upload_folder):
+        """Files in the uploads folder that sync would not catalog and that have no catalog entry"""
+        names = []
+        if os.path.isdir(upload_folder):
+            with os.scandir(upload_folder) as entries:
+                names = [entry.name for entry in entries
+                         if entry.is_file() and not entry.name.startswith('.') and not is_upload_name(entry.name)]
+        with self.lock:
+            return sorted(name for name in names
+                          if self.db.execute('SELECT 1 FROM uploads WHERE filename = ?', (name,)).fetchone() is None)
+
+    def index_schemas(self, upload_folder):
+        """Fingerprint catalogued uploads that have fresh metadata but no schema entry; returns how many"""
+        indexed = 0
+        for name in self.schemas.missing():
+            metadata = load_metadata(upload_folder, name)
+            if metadata is not None:
+                self.schemas.add(name, metadata_signatures(metadata))
+                indexed += 1
+        return indexed
+
+    @staticmethod
+    def _entry(row):
+        filename, size, mtime, num_rows, num_columns, digest = row
+        return {
+            'filename': filename,
+            'size': size,
+            'uploaded_at': mtime,
+            'num_rows': None if num_rows == MISSING_COUNT else num_rows,
+            'num_columns': None if num_columns == MISSING_COUNT else num_columns,
+            'schema_hash': digest
+        }
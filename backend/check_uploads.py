@@ -1,45 +1,72 @@
 #!/usr/bin/env python3
 """
 Simple script to check the uploads folder and list uploaded files
+
+Listings come from the upload catalog, so they stay fast with many files.
+Use --rescan after copying files into or out of the folder by hand.
 """
 
+import argparse
 import os
-import json
 from datetime import datetime
 
+from catalog import SORT_COLUMNS, UploadCatalog
+from metadata_store import META_DIRNAME
+
 UPLOAD_FOLDER = 'uploads'
 
-def check_uploads():
-    """Check and list all files in the uploads folder"""
+def check_uploads(sort='filename', descending=False, prefix=None, limit=50, rescan=False):
+    """List the files in the uploads folder, one catalog page at a time"""
     print("=== CSV Analyzer Uploads Folder Check ===")
     print()
-    
+
     if not os.path.exists(UPLOAD_FOLDER):
         print(f"Uploads folder '{UPLOAD_FOLDER}' does not exist.")
         print("It will be created automatically when the first file is uploaded.")
         return
-    
-    files = os.listdir(UPLOAD_FOLDER)
-    csv_files = [f for f in files if f.endswith('.csv')]
-    
-    if not csv_files:
+
+    catalog = UploadCatalog(os.path.join(UPLOAD_FOLDER, META_DIRNAME, 'catalog.sqlite3'))
+    if rescan or catalog.is_empty():
+        updated, removed = catalog.sync(UPLOAD_FOLDER)
+        print(f"Catalog synced: {updated} added or updated, {removed} removed.")
+        skipped = catalog.unrecognised_files(UPLOAD_FOLDER)
+        if skipped:
+            print(f"Warning: {len(skipped)} file(s) are not recognised as uploads and were not catalogued:")
+            for name in skipped:
+                print(f"   {name}")
+        print()
+
+    total = catalog.count(prefix)
+    if not total:
         print("No CSV files found in uploads folder.")
         return
-    
-    print(f"Found {len(csv_files)} CSV file(s) in uploads folder:")
+
+    print(f"Found {total} CSV file(s) in uploads folder:")
     print()
-    
-    for i, filename in enumerate(csv_files, 1):
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file_stat = os.stat(file_path)
-        size_mb = file_stat.st_size / (1024 * 1024)
-        modified_time = datetime.fromtimestamp(file_stat.st_mtime)
-        
-        print(f"{i}. {filename}")
+
+    files, _ = catalog.list(sort=sort, descending=descending, prefix=prefix, limit=limit)
+    for i, entry in enumerate(files, 1):
+        size_mb = entry['size'] / (1024 * 1024)
+        modified_time = datetime.fromtimestamp(entry['uploaded_at'])
+        rows = 'unknown' if entry['num_rows'] is None else entry['num_rows']
+        columns = 'unknown' if entry['num_columns'] is None else entry['num_columns']
+
+        print(f"{i}. {entry['filename']}")
         print(f"   Size: {size_mb:.2f} MB")
+        print(f"   Rows: {rows}, Columns: {columns}")
         print(f"   Modified: {modified_time.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"   Path: {file_path}")
+        print(f"   Path: {os.path.join(UPLOAD_FOLDER, entry['filename'])}")
         print()
 
+    if total > len(files):
+        print(f"... {total - len(files)} more (use --limit to show more)")
+
 if __name__ == "__main__":
-    check_uploads() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="List files in the uploads folder")
+    parser.add_argument('--sort', choices=sorted(SORT_COLUMNS), default='filename')
+    parser.add_argument('--desc', action='store_true', help='sort in descending order')
+    parser.add_argument('--prefix', help='only files whose name starts with this')
+    parser.add_argument('--limit', type=int, default=50, help='number of files to show')
+    parser.add_argument('--rescan', action='store_true', help='re-sync the catalog with the folder first')
+    args = parser.parse_args()
+    check_uploads(args.sort, args.desc, args.prefix, args.limit, args.rescan)
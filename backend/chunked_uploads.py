@@ -0,0 +1,243 @@
+"""
+Resumable chunked uploads
+
+A client opens a session with the file's size, then PUTs fixed-size parts in
+any order and in parallel. Each part is written straight to its offset in one
+preallocated staging file, so completing the upload needs no reassembly
+copy. Part checksums are verified as parts arrive. The session itself is a
+JSON file written once, and each received part leaves a marker file holding
+its digest, so parts handled by different worker processes never rewrite
+shared state, and an interrupted upload resumes after a restart by re-sending
+only the parts without a marker.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+from blob_store import BLOB_DIRNAME
+
+SESSION_DIRNAME = 'sessions'
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MAX_PART_SIZE = 64 * 1024 * 1024
+SESSION_TTL_SECONDS = 24 * 3600
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadError(ValueError):
+    """Raised for a request the upload session cannot accept"""
+
+
+class UploadTooLarge(UploadError):
+    """Raised when a declared upload exceeds the configured size limit"""
+
+
+class SessionNotFound(KeyError):
+    """Raised for an unknown, expired or already completed upload id"""
+
+
+class UploadConflict(UploadError):
+    """Raised when another request is already completing the upload"""
+
+
+class ChunkedUploads:
+    """Upload sessions kept under ``uploads/.blobs/sessions/``"""
+
+    def __init__(self, upload_folder, default_part_size=DEFAULT_PART_SIZE, ttl_seconds=SESSION_TTL_SECONDS,
+                 max_part_size=MAX_PART_SIZE, max_size=None):
+        self.directory = os.path.join(upload_folder, BLOB_DIRNAME, SESSION_DIRNAME)
+        self.max_part_size = min(max_part_size, MAX_PART_SIZE)
+        self.default_part_size = min(default_part_size, self.max_part_size)
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _state_path(self, upload_id):
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+            raise SessionNotFound(upload_id)
+        return os.path.join(self.directory, f'{upload_id}.json')
+
+    def data_path(self, upload_id):
+        return os.path.join(self.directory, f'{upload_id}.data')
+
+    def parts_path(self, upload_id):
+        """Directory of part markers: one file per received part, named by index, holding its digest"""
+        return os.path.join(self.directory, f'{upload_id}.parts')
+
+    def _claimed_path(self, upload_id):
+        return f'{self._state_path(upload_id)}.finishing'
+
+    def _load(self, upload_id, path=None):
+        try:
+            with open(path or self._state_path(upload_id), 'r', encoding='utf-8') as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            raise SessionNotFound(upload_id)
+        # Sessions opened before part markers existed list their parts in the state file
+        session['parts'] = dict(session.get('parts') or {}, **self._parts(upload_id))
+        return session
+
+    def _parts(self, upload_id):
+        parts = {}
+        try:
+            names = os.listdir(self.parts_path(upload_id))
+        except FileNotFoundError:
+            return parts
+        for name in names:
+            if name.isdigit():
+                try:
+                    with open(os.path.join(self.parts_path(upload_id), name), 'r', encoding='ascii') as f:
+                        parts[name] = f.read()
+                except FileNotFoundError:
+                    pass
+        return parts
+
+    @staticmethod
+    def _write_atomically(path, text):
+        # A name of its own per write, so concurrent writers never share a temporary file
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def create(self, filename, size, part_size=None, sha256=None):
+        """Open a session and preallocate its staging file"""
+        part_size = int(part_size or self.default_part_size)
+        if not 0 < part_size <= self.max_part_size:
+            raise UploadError(f'part_size must be between 1 and {self.max_part_size} bytes')
+        if not isinstance(size, int) or size < 0:
+            raise UploadError('size must be a non-negative number of bytes')
+        if self.max_size is not None and size > self.max_size:
+            # Checked before the staging file is preallocated
+            raise UploadTooLarge(f'Uploads are limited to {self.max_size} bytes')
+        if sha256 is not None and not SHA256_PATTERN.match(sha256):
+            raise UploadError('sha256 must be a lower-case hex digest')
+        self.expire()
+
+        session = {
+            'upload_id': uuid.uuid4().hex,
+            'filename': filename,
+            'size': size,
+            'part_size': part_size,
+            'num_parts': max(1, -(-size // part_size)),
+            'sha256': sha256,
+            'created_at': time.time()
+        }
+        with open(self.data_path(session['upload_id']), 'wb') as f:
+            f.truncate(size)
+        os.makedirs(self.parts_path(session['upload_id']))
+        self._write_atomically(self._state_path(session['upload_id']), json.dumps(session))
+        return dict(session, parts={})
+
+    def get(self, upload_id):
+        return self._load(upload_id)
+
+    def write_part(self, upload_id, index, data, checksum=None):
+        """Verify one part and write it at its offset; returns the updated session"""
+        session = self.get(upload_id)
+        if not 0 <= index < session['num_parts']:
+            raise UploadError(f"Part index must be between 0 and {session['num_parts'] - 1}")
+        offset = index * session['part_size']
+        expected = min(session['part_size'], session['size'] - offset)
+        if len(data) != expected:
+            raise UploadError(f'Part {index} must be {expected} bytes, got {len(data)}')
+        digest = hashlib.sha256(data).hexdigest()
+        if checksum is not None and checksum.lower() != digest:
+            raise UploadError(f'Checksum mismatch for part {index}')
+
+        # Each part has its own handle and offset, so parts never overlap
+        with open(self.data_path(upload_id), 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # The marker is written once the data is durable, so a marker always means a stored part
+        markers = self.parts_path(upload_id)
+        try:
+            os.makedirs(markers, exist_ok=True)
+            self._write_atomically(os.path.join(markers, str(index)), digest)
+        except FileNotFoundError:
+            # Completed or aborted meanwhile
+            raise SessionNotFound(upload_id)
+        session['parts'].update(self._parts(upload_id))
+        session['parts'][str(index)] = digest
+        return session
+
+    def missing_parts(self, session):
+        return [index for index in range(session['num_parts']) if str(index) not in session['parts']]
+
+    def finish(self, upload_id):
+        """Check every part arrived and the whole-file hash; returns (session, staged_path, sha256)
+
+        The session is closed; the caller takes ownership of the staged file.
+        The state file is first renamed aside, which only one request (in any
+        worker process) can do; a concurrent call gets UploadConflict. If a
+        check fails the session is put back, so the client can still resume.
+        """
+        claimed_path = self._claimed_path(upload_id)
+        try:
+            os.rename(self._state_path(upload_id), claimed_path)
+        except FileNotFoundError:
+            if os.path.exists(claimed_path):
+                raise UploadConflict('The upload is already being completed')
+            raise SessionNotFound(upload_id)
+        session = self._load(upload_id, claimed_path)
+        try:
+            missing = self.missing_parts(session)
+            if missing:
+                raise UploadError(f'Missing parts: {missing[:20]}')
+
+            hasher = hashlib.sha256()
+            with open(self.data_path(upload_id), 'rb') as f:
+                for block in iter(lambda: f.read(DEFAULT_PART_SIZE), b''):
+                    hasher.update(block)
+            sha256 = hasher.hexdigest()
+            if session['sha256'] and session['sha256'] != sha256:
+                raise UploadError('Uploaded content does not match the declared sha256')
+        except BaseException:
+            os.rename(claimed_path, self._state_path(upload_id))
+            raise
+
+        os.remove(claimed_path)
+        shutil.rmtree(self.parts_path(upload_id), ignore_errors=True)
+        return session, self.data_path(upload_id), sha256
+
+    def abort(self, upload_id):
+        self._load(upload_id)
+        os.remove(self._state_path(upload_id))
+        shutil.rmtree(self.parts_path(upload_id), ignore_errors=True)
+        if os.path.exists(self.data_path(upload_id)):
+            os.remove(self.data_path(upload_id))
+
+    def expire(self):
+        """Drop sessions idle for longer than the TTL, with their staging files and part markers
+
+        A session is idle when neither its state, its staging file nor its
+        markers changed within the TTL, so a slow upload that keeps sending
+        parts stays open.
+        """
+        cutoff = time.time() - self.ttl_seconds
+        last_active = {}
+        for name in os.listdir(self.directory):
+            try:
+                mtime = os.stat(os.path.join(self.directory, name)).st_mtime
+            except FileNotFoundError:
+                continue
+            upload_id = name.split('.', 1)[0]
+            last_active[upload_id] = max(last_active.get(upload_id, 0), mtime)
+        for name in os.listdir(self.directory):
+            if last_active.get(name.split('.', 1)[0], cutoff) >= cutoff:
+                continue
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
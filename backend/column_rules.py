@@ -0,0 +1,135 @@
+"""
+Data-driven rules for rule-based column descriptions
+
+Rules live in JSON files. Each file has a ``priority`` (lower wins), an
+optional ``default`` description and a list of ``rules``; a rule matches when
+the lower-cased column name contains every term in ``contains`` or equals
+``equals``. Within a priority, earlier files and earlier rules win, so the
+bundled ``column_rules.json`` behaves like the original chain of ``if`` checks.
+
+All ``contains`` terms are compiled into one Aho-Corasick automaton, so a
+column name is scanned once no matter how many rules are loaded.
+"""
+
+import glob
+import json
+import os
+from collections import deque
+from functools import lru_cache
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), 'column_rules.json')
+DEFAULT_PRIORITY = 100
+FALLBACK_DESCRIPTION = 'No description available.'
+
+
+class TermMatcher:
+    """Aho-Corasick automaton reporting every term found in a string, overlaps included"""
+
+    def __init__(self, terms):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for term_id, term in enumerate(terms):
+            node = 0
+            for char in term:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].append(term_id)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text):
+        """Return the set of term ids occurring anywhere in ``text``"""
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            if self.output[node]:
+                found.update(self.output[node])
+        return found
+
+
+class RuleEngine:
+    """Compiled rule table with a memoized ``describe`` lookup"""
+
+    def __init__(self, rules, default=FALLBACK_DESCRIPTION, cache_size=65536):
+        # Rank is the position after sorting by (priority, load order), lower wins
+        ordered = sorted(enumerate(rules), key=lambda item: (item[1].get('priority', DEFAULT_PRIORITY), item[0]))
+        self.descriptions = []
+        self.equals = {}
+        term_ids = {}
+        self.rules_by_term = []
+        self.required_terms = []
+
+        for rank, (_, rule) in enumerate(ordered):
+            self.descriptions.append(rule['description'])
+            if 'equals' in rule:
+                self.equals.setdefault(rule['equals'].lower(), rank)
+                self.required_terms.append(0)
+                continue
+            terms = {term.lower() for term in rule['contains']}
+            self.required_terms.append(len(terms))
+            for term in terms:
+                if term not in term_ids:
+                    term_ids[term] = len(term_ids)
+                    self.rules_by_term.append([])
+                self.rules_by_term[term_ids[term]].append(rank)
+
+        self.matcher = TermMatcher(list(term_ids))
+        self.default = default
+        self.describe = lru_cache(maxsize=cache_size)(self._describe)
+
+    def _describe(self, col):
+        col = str(col).lower()
+        best = self.equals.get(col)
+
+        hits = {}
+        for term_id in self.matcher.find(col):
+            for rank in self.rules_by_term[term_id]:
+                hits[rank] = hits.get(rank, 0) + 1
+        for rank, count in hits.items():
+            if count == self.required_terms[rank] and (best is None or rank < best):
+                best = rank
+
+        return self.default if best is None else self.descriptions[best]
+
+
+def load_rule_files(paths):
+    """Read rule files in order, stamping each rule with its file's priority"""
+    rules = []
+    default = FALLBACK_DESCRIPTION
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        priority = config.get('priority', DEFAULT_PRIORITY)
+        if 'default' in config:
+            default = config['default']
+        for rule in config.get('rules', []):
+            if not rule.get('description') or not (rule.get('contains') or rule.get('equals')):
+                raise ValueError(f"Rule in {path} needs a description and 'contains' or 'equals': {rule}")
+            rules.append(dict(rule, priority=rule.get('priority', priority)))
+    return rules, default
+
+
+def load_rule_engine(extra_dir=None, default_path=DEFAULT_RULES_PATH):
+    """Build the engine from the bundled rules plus any ``*.json`` vocabularies in ``extra_dir``"""
+    paths = [default_path]
+    if extra_dir and os.path.isdir(extra_dir):
+        paths.extend(sorted(glob.glob(os.path.join(extra_dir, '*.json'))))
+    rules, default = load_rule_files(paths)
+    return RuleEngine(rules, default)
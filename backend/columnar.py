@@ -0,0 +1,99 @@
+"""
+Typed columnar (Arrow IPC) shadow copies of uploads
+
+Each upload is converted once, in the background, to an uncompressed Arrow
+IPC file next to its metadata sidecar. Readers memory-map that file and pull
+only the columns they need, so repeat reads skip CSV parsing entirely. When
+pyarrow is not installed, or no copy exists yet, readers fall back to
+streaming the CSV.
+"""
+
+import os
+import uuid
+
+import pandas as pd
+
+from csv_ingest import CHUNK_ROWS, arrow_options, iter_chunks
+from metadata_store import META_DIRNAME
+from sniffing import pandas_options, resolve_dialect
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # Optional: without it every read streams the CSV
+    pa = None
+
+BLOCK_BYTES = 8 * 1024 * 1024
+
+
+def columnar_available():
+    return pa is not None
+
+
+def columnar_path(upload_folder, filename):
+    """Return the path of a file's Arrow IPC shadow copy"""
+    return os.path.join(upload_folder, META_DIRNAME, f'{filename}.arrow')
+
+
+def convert_to_columnar(filepath, target_path, dialect=None, block_bytes=BLOCK_BYTES):
+    """Stream a CSV into an Arrow IPC file with Arrow's multithreaded parser
+
+    Column types come from the dialect's sniffed hints; if a later block does
+    not fit them the conversion raises ``pyarrow.ArrowInvalid`` and no copy
+    is written.
+    """
+    read_options, parse_options, convert_options = arrow_options(
+        resolve_dialect(filepath, dialect), block_bytes=block_bytes)
+    tmp_path = f'{target_path}.{uuid.uuid4().hex}.tmp'
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    try:
+        reader = pa_csv.open_csv(filepath, read_options=read_options, parse_options=parse_options,
+                                 convert_options=convert_options)
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa_ipc.new_file(sink, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def has_columnar_copy(upload_folder, filename, metadata):
+    """True when a shadow copy exists and was built from the file's current content"""
+    return (
+        pa is not None
+        and metadata is not None
+        and metadata.get('columnar_sha256') == metadata.get('sha256')
+        and os.path.exists(columnar_path(upload_folder, filename))
+    )
+
+
+def open_columnar(upload_folder, filename):
+    """Memory-map the shadow copy and return an Arrow IPC file reader"""
+    source = pa.memory_map(columnar_path(upload_folder, filename), 'r')
+    return pa_ipc.open_file(source)
+
+
+def iter_frames(upload_folder, filename, metadata, columns=None, chunksize=CHUNK_ROWS):
+    """Yield DataFrames of the upload, from the shadow copy when it is fresh"""
+    if not has_columnar_copy(upload_folder, filename, metadata):
+        yield from iter_chunks(os.path.join(upload_folder, filename), columns=columns, chunksize=chunksize,
+                               dialect=metadata and metadata.get('dialect'))
+        return
+    reader = open_columnar(upload_folder, filename)
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        if columns is not None:
+            batch = batch.select(columns)
+        yield batch.to_pandas()
+
+
+def read_columns(upload_folder, filename, metadata, columns):
+    """Load just ``columns`` of the upload as one DataFrame"""
+    if not has_columnar_copy(upload_folder, filename, metadata):
+        filepath = os.path.join(upload_folder, filename)
+        dialect = resolve_dialect(filepath, metadata and metadata.get('dialect'))
+        return pd.read_csv(filepath, usecols=columns, **pandas_options(dialect))[columns]
+    return open_columnar(upload_folder, filename).read_all().select(columns).to_pandas()
@@ -0,0 +1,99 @@
+"""
+Shared pytest fixtures: an app on a temporary uploads folder
+
+The model is pointed at a closed local port, so annotation falls back to
+rule-based descriptions unless a test uses the ``stub`` fixture (see stub_gemini.py).
+"""
+
+import io
+import time
+
+import pytest
+
+from app import create_app
+from stub_gemini import start_stub_server
+
+# A script that calls the real API at import time, not a test module
+collect_ignore = ['test_gemini.py']
+
+OFFLINE_MODEL = {
+    'GOOGLE_API_KEY': 'test-key',
+    'GEMINI_BASE_URL': 'http://127.0.0.1:1/v1beta',
+    'GEMINI_MAX_RETRIES': '0',
+    'GEMINI_TIMEOUT': '2'
+}
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build apps over ``tmp_path/uploads``; later keyword settings override the offline defaults"""
+    apps = []
+
+    def build(**overrides):
+        app = create_app(dict(OFFLINE_MODEL, UPLOAD_FOLDER=str(tmp_path / 'uploads'), **overrides))
+        app.config['TESTING'] = True
+        apps.append(app)
+        return app
+
+    yield build
+    for app in apps:
+        app.extensions['csv_analyzer'].shutdown()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def services(app):
+    return app.extensions['csv_analyzer']
+
+
+@pytest.fixture(scope='session')
+def stub_server():
+    server = start_stub_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub(stub_server):
+    """The shared model stub, answering normally with its request count reset"""
+    stub_server.config.update(error_rate=0.0, error_status=503, answer=None)
+    stub_server.requests_served = 0
+    return stub_server
+
+
+def upload(client, filename, data, query=''):
+    """POST ``data`` (bytes or str) to /api/upload as ``filename`` and return the response"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return client.post(f'/api/upload{query}', data={'file': (io.BytesIO(data), filename)},
+                       content_type='multipart/form-data')
+
+
+def wait_for_job(client, job_id, timeout=30):
+    """Poll /api/jobs/<job_id> until it is done or failed; returns the job"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f'/api/jobs/{job_id}').get_json()['job']
+        if job['status'] in ('done', 'failed') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+def get_when_built(client, url, timeout=30):
+    """GET ``url`` until it stops answering 202 (a sidecar still being built); returns the response"""
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(url)
+        if response.status_code != 202 or time.monotonic() > deadline:
+            return response
+        time.sleep(0.05)
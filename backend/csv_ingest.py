@@ -0,0 +1,312 @@
+"""
+Streaming helpers for reading uploaded CSV files without loading them whole
+
+Every reader takes the file's sniffed dialect (see sniffing.py). Chunked
+reads use Arrow's multithreaded CSV reader when pyarrow is installed, and
+pandas otherwise.
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from sniffing import Utf8Check, fallback_encoding, pandas_options, resolve_dialect
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # Optional: without it chunks are parsed by pandas
+    pa = None
+
+SCAN_CHUNK_BYTES = 4 * 1024 * 1024
+SAMPLE_ROWS = 5
+CHUNK_ROWS = 100_000
+ARROW_BLOCK_BYTES = 8 * 1024 * 1024
+# Byte offset of every N-th row is kept so row windows can be read by seeking
+ROW_INDEX_EVERY = 1000
+
+NEWLINE = ord('\n')
+CARRIAGE_RETURN = ord('\r')
+
+
+class RecordScanner:
+    """Find CSV record boundaries in raw bytes, one chunk at a time.
+
+    A newline ends a record only when it sits outside a quoted field, which is
+    tracked with a running parity of quote characters (RFC 4180 escapes a quote
+    by doubling it, so parity still holds). As in the parser, only a quote at
+    the start of a field opens quoting; a chunk where parity would open one
+    anywhere else (an inch mark such as ``12" pipe``) is rescanned quote by
+    quote. Empty lines are skipped the same way ``pd.read_csv`` skips them.
+    """
+
+    def __init__(self, quotechar='"', delimiter=','):
+        self.quote = ord(quotechar)
+        self.delimiter = ord(delimiter)
+        self.in_quotes = 0
+        self.pending = 0
+        self.last_byte = NEWLINE
+        self.last_close = -2
+        self.position = 0
+
+    def _field_start(self, arr, positions):
+        """Whether each position is the first byte of a field"""
+        before = np.where(positions > 0, arr[np.maximum(positions - 1, 0)], self.last_byte)
+        return (before == self.delimiter) | (before == NEWLINE) | (before == CARRIAGE_RETURN)
+
+    def _quote_toggles(self, arr, quotes):
+        """Quotes that switch quoting on or off, following the parser's rules one quote at a time"""
+        toggles = []
+        state = self.in_quotes
+        field_start = self._field_start(arr, quotes)
+        i = 0
+        while i < len(quotes):
+            p = int(quotes[i])
+            if not state:
+                # Opens a field, or is the second half of a doubled quote split by a close
+                if field_start[i] or self.position + p - 1 == self.last_close:
+                    state = 1
+                    toggles.append(p)
+            elif i + 1 < len(quotes) and quotes[i + 1] == p + 1:
+                # Escaped quote inside a quoted field
+                i += 1
+            else:
+                state = 0
+                toggles.append(p)
+                self.last_close = self.position + p
+            i += 1
+        return np.array(toggles, dtype=np.int64)
+
+    def feed(self, chunk):
+        """Return absolute offsets of the newlines ending non-empty records in ``chunk``"""
+        arr = np.frombuffer(chunk, dtype=np.uint8)
+        if arr.size == 0:
+            return np.empty(0, dtype=np.int64)
+
+        is_quote = arr == self.quote
+        parity = (np.cumsum(is_quote) + self.in_quotes) & 1
+        quotes = np.flatnonzero(is_quote)
+        if quotes.size:
+            opening = quotes[parity[quotes] == 1]
+            before = np.where(opening > 0, arr[np.maximum(opening - 1, 0)], self.last_byte)
+            if not np.all(self._field_start(arr, opening) | (before == self.quote)):
+                toggled = np.zeros(arr.size, dtype=np.int64)
+                toggled[self._quote_toggles(arr, quotes)] = 1
+                parity = (np.cumsum(toggled) + self.in_quotes) & 1
+            else:
+                last = int(quotes[-1])
+                if parity[last] == 0:
+                    self.last_close = self.position + last
+        ends = np.flatnonzero((arr == NEWLINE) & (parity == 0))
+
+        if ends.size:
+            starts = np.empty_like(ends)
+            starts[0] = -self.pending - 1
+            starts[1:] = ends[:-1]
+            lengths = ends - starts - 1
+            before = np.where(ends > 0, arr[ends - 1], self.last_byte)
+            empty = (lengths == 0) | ((lengths == 1) & (before == CARRIAGE_RETURN))
+            self.pending = arr.size - 1 - int(ends[-1])
+            ends = ends[~empty]
+        else:
+            self.pending += arr.size
+
+        self.in_quotes = int(parity[-1])
+        self.last_byte = int(arr[-1])
+        offsets = ends + self.position
+        self.position += arr.size
+        return offsets
+
+    def finish(self):
+        """Return True when the data ends with an unterminated, non-empty record"""
+        if self.pending == 0:
+            return False
+        return not (self.pending == 1 and self.last_byte == CARRIAGE_RETURN)
+
+
+def scan_rows(filepath, quotechar='"', chunk_bytes=SCAN_CHUNK_BYTES, hasher=None, checkpoint_every=None,
+              utf8_check=None, delimiter=','):
+    """Count data rows (header excluded) with a bounded-memory byte scan
+
+    When ``hasher`` (or ``utf8_check``) is given it is fed the same bytes, so
+    a content hash costs no extra pass over the file. With ``checkpoint_every``
+    the byte offset where every N-th data row starts is collected too, which
+    is enough to seek straight to any row later.
+    """
+    scanner = RecordScanner(quotechar, delimiter)
+    records = 0
+    checkpoints = []
+    with open(filepath, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            if hasher is not None:
+                hasher.update(chunk)
+            if utf8_check is not None:
+                utf8_check.update(chunk)
+            ends = scanner.feed(chunk)
+            if checkpoint_every and ends.size:
+                # Record r ends right before data row r starts (record 0 is the header)
+                record_ids = np.arange(records, records + ends.size)
+                checkpoints.append(ends[record_ids % checkpoint_every == 0] + 1)
+            records += ends.size
+    if scanner.finish():
+        records += 1
+    num_rows = max(records - 1, 0)
+    offsets = np.concatenate(checkpoints) if checkpoints else np.empty(0, dtype=np.int64)
+    # A checkpoint after the last record would point at end of file
+    return num_rows, offsets[:(num_rows + checkpoint_every - 1) // checkpoint_every] if checkpoint_every else offsets
+
+
+def count_rows(filepath, quotechar='"', chunk_bytes=SCAN_CHUNK_BYTES, hasher=None):
+    """Count data rows (header excluded) with a bounded-memory byte scan"""
+    return scan_rows(filepath, quotechar, chunk_bytes, hasher)[0]
+
+
+def hash_file(filepath, chunk_bytes=SCAN_CHUNK_BYTES):
+    """Return the SHA-256 hex digest of a file"""
+    hasher = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def summarize_csv(filepath, sample_rows=SAMPLE_ROWS, checkpoint_every=ROW_INDEX_EVERY, dialect=None, sha256=None):
+    """Sniff the dialect, count and index rows without parsing them, then read a bounded sample
+
+    The sniffed encoding is confirmed on the whole file during the row scan:
+    a file that is UTF-8 only at the start is read as Windows-1252. The content
+    hash is computed in the same scan unless the caller already has it.
+    """
+    dialect = resolve_dialect(filepath, dialect)
+    hasher = hashlib.sha256() if sha256 is None else None
+    utf8_check = Utf8Check() if dialect['encoding'] == 'utf-8' else None
+    num_rows, checkpoints = scan_rows(filepath, dialect['quotechar'], hasher=hasher,
+                                      checkpoint_every=checkpoint_every, utf8_check=utf8_check,
+                                      delimiter=dialect['delimiter'])
+    if utf8_check is not None and not utf8_check.valid:
+        dialect = dict(dialect, encoding=fallback_encoding(dialect['encoding']))
+    sample = pd.read_csv(filepath, nrows=sample_rows, **pandas_options(dialect))
+    return {
+        'columns': list(sample.columns),
+        'num_rows': num_rows,
+        'sha256': hasher.hexdigest() if hasher is not None else sha256,
+        'checkpoints': checkpoints,
+        'checkpoint_every': checkpoint_every,
+        'dialect': dialect,
+        'sample': sample
+    }
+
+
+def read_rows(filepath, columns, checkpoints, checkpoint_every, offset, limit, dialect=None):
+    """Read rows ``[offset, offset + limit)`` by seeking to the nearest checkpoint
+
+    At most ``checkpoint_every - 1`` rows are parsed and discarded, so a deep
+    page costs about the same as the first one.
+    """
+    slot = offset // checkpoint_every
+    if limit <= 0 or slot >= len(checkpoints):
+        return pd.DataFrame(columns=columns)
+    skip = offset - slot * checkpoint_every
+    options = pandas_options(resolve_dialect(filepath, dialect))
+    with open(filepath, 'rb') as f:
+        f.seek(int(checkpoints[slot]))
+        window = pd.read_csv(f, header=None, names=columns, nrows=skip + limit, **options)
+    return window.iloc[skip:]
+
+
+ARROW_TYPES = {'integer': 'int64', 'float': 'float64', 'boolean': 'bool_', 'string': 'string', 'empty': 'string'}
+
+
+def arrow_options(dialect, columns=None, as_text=False, block_bytes=ARROW_BLOCK_BYTES):
+    """Arrow (read, parse, convert) options for a dialect, typing columns from its hints
+
+    Without hints Arrow infers each column's type from the first block, and a
+    column empty or numeric there fails the read once later blocks disagree.
+    With ``as_text`` every value is read as the original text, with no nulls.
+    """
+    header = list(dialect.get('column_types') or {})
+    read_options = pa_csv.ReadOptions(
+        use_threads=True,
+        block_size=block_bytes,
+        # Names as pandas gives them (duplicates made unique); the header row is skipped
+        column_names=header or None,
+        skip_rows=1 if header else 0,
+        encoding='utf8' if dialect['encoding'] in ('utf-8', 'utf-8-sig') else dialect['encoding']
+    )
+    parse_options = pa_csv.ParseOptions(delimiter=dialect['delimiter'], quote_char=dialect['quotechar'])
+    if as_text:
+        column_types = {col: pa.string() for col in header}
+    else:
+        column_types = {col: getattr(pa, ARROW_TYPES[kind])() for col, kind in dialect['column_types'].items()}
+    if columns is not None and header:
+        # Keep file order, as pandas' usecols does
+        wanted = set(columns)
+        columns = [col for col in header if col in wanted]
+    convert_options = pa_csv.ConvertOptions(
+        column_types=column_types,
+        include_columns=columns,
+        # Match pandas: empty strings are nulls, not empty values
+        strings_can_be_null=not as_text,
+        null_values=[] if as_text else None
+    )
+    return read_options, parse_options, convert_options
+
+
+def _arrow_chunks(filepath, dialect, columns, chunksize, as_text):
+    read_options, parse_options, convert_options = arrow_options(dialect, columns, as_text)
+    reader = pa_csv.open_csv(filepath, read_options=read_options, parse_options=parse_options,
+                             convert_options=convert_options)
+    pending = []
+    pending_rows = 0
+    for batch in reader:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= chunksize:
+            table = pa.Table.from_batches(pending, schema=reader.schema)
+            yield table.slice(0, chunksize).to_pandas()
+            rest = table.slice(chunksize)
+            pending = rest.to_batches()
+            pending_rows = rest.num_rows
+    if pending_rows:
+        yield pa.Table.from_batches(pending, schema=reader.schema).to_pandas()
+
+
+def _pandas_chunks(filepath, dialect, columns, chunksize, as_text, skip_rows=0):
+    options = pandas_options(dialect)
+    if as_text:
+        options.update(dtype=str, keep_default_na=False)
+    with pd.read_csv(filepath, usecols=columns, chunksize=chunksize, **options) as reader:
+        for chunk in reader:
+            if skip_rows >= len(chunk):
+                skip_rows -= len(chunk)
+                continue
+            yield chunk.iloc[skip_rows:] if skip_rows else chunk
+            skip_rows = 0
+
+
+def iter_chunks(filepath, columns=None, chunksize=CHUNK_ROWS, dialect=None, as_text=False):
+    """Yield the file as DataFrames of at most ``chunksize`` rows, optionally only ``columns``
+
+    With ``as_text`` every value is the cell's original text and empty cells
+    are empty strings. Arrow parses the blocks on all cores when available; if
+    a later block does not fit the column types (or is ragged), pandas takes
+    over from the first row not yet yielded.
+    """
+    dialect = resolve_dialect(filepath, dialect)
+    yielded = 0
+    if pa is not None:
+        try:
+            for chunk in _arrow_chunks(filepath, dialect, columns, chunksize, as_text):
+                yield chunk
+                yielded += len(chunk)
+            return
+        except (pa.ArrowInvalid, UnicodeDecodeError):
+            pass
+    yield from _pandas_chunks(filepath, dialect, columns, chunksize, as_text, skip_rows=yielded)
@@ -0,0 +1,127 @@
+"""
+Streaming CSV export of stored uploads with server-side edits and compression
+"""
+
+import zlib
+
+import pandas as pd
+
+from csv_ingest import CHUNK_ROWS, iter_chunks
+
+try:
+    import zstandard
+except ImportError:  # Optional: only needed for compression='zstd'
+    zstandard = None
+
+FILTER_OPS = {'eq', 'ne', 'lt', 'le', 'gt', 'ge', 'contains', 'in', 'not_in', 'is_null', 'not_null'}
+COMPRESSIONS = {'none', 'gzip', 'zstd'}
+
+
+class ExportError(ValueError):
+    """Raised for transforms or options the exporter cannot apply"""
+
+
+def validate_transforms(transforms, header):
+    """Check a transform spec against the file's columns before any bytes are streamed"""
+    columns = set(header)
+    for key in ('drop', 'columns'):
+        unknown = [col for col in transforms.get(key) or [] if col not in columns]
+        if unknown:
+            raise ExportError(f"Unknown columns in '{key}': {unknown}")
+    unknown = [col for col in transforms.get('rename') or {} if col not in columns]
+    if unknown:
+        raise ExportError(f"Unknown columns in 'rename': {unknown}")
+    for spec in transforms.get('filters') or []:
+        if spec.get('column') not in columns:
+            raise ExportError(f"Unknown filter column: {spec.get('column')}")
+        if spec.get('op') not in FILTER_OPS:
+            raise ExportError(f"Unknown filter op: {spec.get('op')}")
+
+
+def filter_mask(values, op, value):
+    """Vectorized row mask for one filter; values are the raw strings from the file"""
+    if op == 'is_null':
+        return values == ''
+    if op == 'not_null':
+        return values != ''
+    if op == 'contains':
+        return values.str.contains(str(value), regex=False)
+    if op in ('in', 'not_in'):
+        mask = values.isin([str(item) for item in value or []])
+        return mask if op == 'in' else ~mask
+    if op in ('eq', 'ne'):
+        mask = values == str(value)
+        return mask if op == 'eq' else ~mask
+
+    # Ordering comparisons are numeric when the filter value is a number
+    try:
+        target = float(value)
+        left = pd.to_numeric(values, errors='coerce')
+    except (TypeError, ValueError):
+        target = str(value)
+        left = values
+    if op == 'lt':
+        return left < target
+    if op == 'le':
+        return left <= target
+    if op == 'gt':
+        return left > target
+    return left >= target
+
+
+def iter_transformed(filepath, transforms, chunksize=CHUNK_ROWS, dialect=None):
+    """Yield chunks with filters, column selection, drops and renames applied, in that order
+
+    Values are read as text so exported cells keep their original formatting.
+    """
+    filters = transforms.get('filters') or []
+    keep = transforms.get('columns')
+    drop = set(transforms.get('drop') or [])
+    rename = transforms.get('rename') or {}
+
+    for chunk in iter_chunks(filepath, chunksize=chunksize, dialect=dialect, as_text=True):
+        for spec in filters:
+            chunk = chunk[filter_mask(chunk[spec['column']], spec['op'], spec.get('value'))]
+        if keep:
+            chunk = chunk[keep]
+        if drop:
+            chunk = chunk.drop(columns=[col for col in chunk.columns if col in drop])
+        if rename:
+            chunk = chunk.rename(columns=rename)
+        yield chunk
+
+
+def iter_csv_bytes(filepath, transforms, chunksize=CHUNK_ROWS, dialect=None):
+    """Yield UTF-8, comma-separated CSV text whatever the source dialect, the header only once"""
+    header = True
+    for chunk in iter_transformed(filepath, transforms, chunksize, dialect):
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+
+
+def compress_stream(chunks, compression):
+    """Wrap a byte generator in streaming gzip or zstd compression"""
+    if compression == 'none':
+        yield from chunks
+        return
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        flush = compressor.flush
+    else:
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        flush = compressor.flush
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield flush()
+
+
+def export_stream(filepath, header, transforms, compression='none', chunksize=CHUNK_ROWS, dialect=None):
+    """Validate options, then return a generator of (optionally compressed) CSV bytes"""
+    if compression not in COMPRESSIONS:
+        raise ExportError(f"Unsupported compression: {compression}")
+    if compression == 'zstd' and zstandard is None:
+        raise ExportError("zstd compression requires the 'zstandard' package")
+    validate_transforms(transforms, header)
+    return compress_stream(iter_csv_bytes(filepath, transforms, chunksize, dialect), compression)
@@ -0,0 +1,230 @@
+"""
+GTFS feed ingestion
+
+A GTFS feed is a zip of related CSV tables (routes.txt, trips.txt,
+stop_times.txt, ...). Its members are extracted by streaming and each one is
+stored as an ordinary upload named ``<feed>__<member>``. The CPU-bound work
+runs in a process pool: every table is summarized and profiled, tables with
+many rows are split into byte ranges at their row-index checkpoints so one
+stop_times.txt is parsed on every core, and the keys tables refer to each
+other by are checked with a hash join.
+"""
+
+import hashlib
+import json
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from blob_store import staging_path
+from csv_ingest import CHUNK_ROWS
+from metadata_store import META_DIRNAME
+from profiler import merge_profiles, profile_range
+from sniffing import pandas_options
+
+COPY_CHUNK_BYTES = 1024 * 1024
+# Tables with fewer rows are profiled and checked as a single range
+RANGE_MIN_ROWS = 200_000
+MAX_MISSING_SAMPLES = 20
+
+# (table, column, tables that hold the key); an empty value is no reference
+FOREIGN_KEYS = (
+    ('routes.txt', 'agency_id', (('agency.txt', 'agency_id'),)),
+    ('trips.txt', 'route_id', (('routes.txt', 'route_id'),)),
+    ('trips.txt', 'service_id', (('calendar.txt', 'service_id'), ('calendar_dates.txt', 'service_id'))),
+    ('trips.txt', 'shape_id', (('shapes.txt', 'shape_id'),)),
+    ('stop_times.txt', 'trip_id', (('trips.txt', 'trip_id'),)),
+    ('stop_times.txt', 'stop_id', (('stops.txt', 'stop_id'),)),
+    ('frequencies.txt', 'trip_id', (('trips.txt', 'trip_id'),)),
+    ('transfers.txt', 'from_stop_id', (('stops.txt', 'stop_id'),)),
+    ('transfers.txt', 'to_stop_id', (('stops.txt', 'stop_id'),)),
+)
+
+
+class FeedError(ValueError):
+    """Raised for a zip that cannot be ingested as a feed"""
+
+
+def feed_name_for(filename):
+    """Feed name for an uploaded zip: its filename without the extension"""
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def feed_table_name(feed_name, member):
+    return f'{feed_name}__{member}'
+
+
+def report_path(upload_folder, feed_name):
+    return os.path.join(upload_folder, META_DIRNAME, f'{feed_name}.feed.json')
+
+
+def save_feed_report(upload_folder, feed_name, report):
+    path = report_path(upload_folder, feed_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def load_feed_report(upload_folder, feed_name):
+    """Return the stored ingestion report of a feed, or None"""
+    try:
+        with open(report_path(upload_folder, feed_name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_table(info):
+    name = os.path.basename(info.filename)
+    return (not info.is_dir() and name.endswith('.txt') and not name.startswith('.')
+            and not info.filename.startswith('__MACOSX/'))
+
+
+def extract_members(zip_path, upload_folder, max_bytes):
+    """Copy each table of a feed zip to a staging file; yields (member, staged_path, sha256)
+
+    Members are copied in small blocks and hashed on the way, so none is held
+    in memory. The uncompressed total is limited to ``max_bytes``, checked
+    against the sizes the zip declares and again while copying.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        members = [info for info in archive.infolist() if is_table(info)]
+        if not members:
+            raise FeedError('The zip contains no .txt tables')
+        names = [os.path.basename(info.filename) for info in members]
+        if len(set(names)) != len(names):
+            raise FeedError('The zip contains more than one table with the same name')
+        if sum(info.file_size for info in members) > max_bytes:
+            raise FeedError(f'Feed tables are limited to {max_bytes} bytes uncompressed')
+
+        written = 0
+        for name, info in zip(names, members):
+            staged_path = staging_path(upload_folder)
+            hasher = hashlib.sha256()
+            try:
+                with archive.open(info) as source, open(staged_path, 'wb') as target:
+                    while True:
+                        chunk = source.read(COPY_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        written += len(chunk)
+                        if written > max_bytes:
+                            raise FeedError(f'Feed tables are limited to {max_bytes} bytes uncompressed')
+                        hasher.update(chunk)
+                        target.write(chunk)
+            except BaseException:
+                os.remove(staged_path)
+                raise
+            yield name, staged_path, hasher.hexdigest()
+
+
+def plan_ranges(ingest, parts):
+    """Split a table into up to ``parts`` (first_row, start_byte, nrows) ranges at row-index checkpoints"""
+    num_rows = ingest['num_rows']
+    checkpoints = ingest['checkpoints']
+    every = ingest['checkpoint_every']
+    if num_rows == 0 or not len(checkpoints):
+        return []
+    if num_rows < RANGE_MIN_ROWS:
+        parts = 1
+    bounds = np.unique(np.linspace(0, len(checkpoints), max(1, min(parts, len(checkpoints))) + 1).astype(int))
+    return [
+        (int(first) * every, int(checkpoints[first]), min(int(last) * every, num_rows) - int(first) * every)
+        for first, last in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def submit_profile(pool, filepath, ingest, parts, chunksize=CHUNK_ROWS):
+    """Queue a table's profile in the pool, one task per range; returns the futures"""
+    return [
+        pool.submit(profile_range, filepath, ingest['columns'], ingest['dialect'], start, nrows, chunksize)
+        for _, start, nrows in plan_ranges(ingest, parts)
+    ]
+
+
+def collect_profile(futures, ingest):
+    return merge_profiles([future.result() for future in futures], ingest['columns'])
+
+
+def hash_keys(values):
+    """64-bit hashes of key values, compared as text"""
+    return pd.util.hash_array(values.to_numpy(dtype=object))
+
+
+def key_hashes(filepath, column, dialect):
+    """Pool task: sorted unique hashes of the non-empty values of a key column"""
+    hashes = [np.empty(0, dtype=np.uint64)]
+    with pd.read_csv(filepath, usecols=[column], dtype=str, keep_default_na=False, chunksize=CHUNK_ROWS,
+                     **pandas_options(dialect)) as reader:
+        for chunk in reader:
+            values = chunk[column].str.strip()
+            hashes.append(np.unique(hash_keys(values[values != ''])))
+    return np.unique(np.concatenate(hashes))
+
+
+def missing_keys(filepath, columns, dialect, column, first_row, start, nrows, parent_hashes, max_samples):
+    """Pool task: find values of ``column`` in one range of a table that no parent row holds"""
+    checked = 0
+    missing = 0
+    samples = []
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        with pd.read_csv(f, header=None, names=columns, usecols=[column], nrows=nrows, dtype=str,
+                         keep_default_na=False, chunksize=CHUNK_ROWS, **pandas_options(dialect)) as reader:
+            for chunk in reader:
+                values = chunk[column].str.strip()
+                values = values[values != '']
+                checked += len(values)
+                absent = values[~np.isin(hash_keys(values), parent_hashes)]
+                missing += len(absent)
+                for row, value in absent.iloc[:max_samples - len(samples)].items():
+                    samples.append({'row': first_row + int(row), 'value': value})
+    return {'checked': checked, 'missing': missing, 'samples': samples}
+
+
+def check_foreign_keys(pool, tables, parts, max_samples=MAX_MISSING_SAMPLES):
+    """Hash-join every known GTFS reference between ``tables`` ({member: (filepath, ingest)})
+
+    Each referenced key column is hashed once; the referring column is then
+    streamed in ranges, in parallel, and each value is looked up in the
+    sorted hashes.
+    """
+    def has_column(table, column):
+        return table in tables and column in tables[table][1]['columns']
+
+    checks = [(table, column, [ref for ref in refs if has_column(*ref)])
+              for table, column, refs in FOREIGN_KEYS if has_column(table, column)]
+    key_futures = {}
+    for _, _, refs in checks:
+        for table, column in refs:
+            if (table, column) not in key_futures:
+                filepath, ingest = tables[table]
+                key_futures[table, column] = pool.submit(key_hashes, filepath, column, ingest['dialect'])
+
+    results = []
+    for table, column, refs in checks:
+        result = {'table': table, 'column': column, 'references': [f'{t}.{c}' for t, c in refs]}
+        if not refs:
+            results.append(dict(result, status='skipped', message='Referenced table is not in the feed'))
+            continue
+        parent_hashes = np.unique(np.concatenate([key_futures[ref].result() for ref in refs]))
+        filepath, ingest = tables[table]
+        futures = [
+            pool.submit(missing_keys, filepath, ingest['columns'], ingest['dialect'], column,
+                        first_row, start, nrows, parent_hashes, max_samples)
+            for first_row, start, nrows in plan_ranges(ingest, parts)
+        ]
+        parts_found = [future.result() for future in futures]
+        missing = sum(part['missing'] for part in parts_found)
+        results.append(dict(
+            result,
+            status='ok' if missing == 0 else 'missing',
+            checked=sum(part['checked'] for part in parts_found),
+            missing=missing,
+            samples=[sample for part in parts_found for sample in part['samples']][:max_samples]
+        ))
+    return results
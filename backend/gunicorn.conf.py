@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for serving wsgi:app
+
+Workers are pre-forked processes, so parsing and profiling in one request do
+not hold the GIL for the others. Each worker runs a few threads for
+requests that mostly wait: model calls, uploads and job event streams. Every
+setting can be overridden from the environment.
+"""
+
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+worker_class = 'gthread'
+threads = int(os.getenv('WORKER_THREADS', '4'))
+
+# Uploads of large files and profiling can run for a while
+timeout = int(os.getenv('WORKER_TIMEOUT', '120'))
+# On SIGTERM a worker stops accepting and gets this long to finish in-flight work
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+# The app is imported in each worker, after the fork, so no SQLite handle,
+# socket or thread pool is shared between processes
+preload_app = False
+
+# Recycle workers now and then to bound memory growth from pandas
+max_requests = int(os.getenv('MAX_REQUESTS', '1000'))
+max_requests_jitter = 100
+
+accesslog = '-'
+
+
+def _services(worker):
+    return worker.wsgi.extensions['csv_analyzer']
+
+
+def post_worker_init(worker):
+    # Liveness is answered at once; /api/ready turns 200 when warm-up is done
+    _services(worker).start_warm_up()
+
+
+def worker_exit(server, worker):
+    # Let queued annotation and columnar jobs finish, then close handles
+    _services(worker).shutdown(wait=True)
@@ -0,0 +1,154 @@
+"""
+Background job runner for work that should not hold up an HTTP response
+
+A job runs in the worker process that submitted it, but its status and result
+are also written to a SQLite file shared by every worker, so a poll or event
+stream that a load balancer sends to another worker still finds the job.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# A writer waits this long for another worker's lock on the job store
+BUSY_TIMEOUT_SECONDS = 10
+JOB_FIELDS = ('id', 'kind', 'status', 'result', 'error', 'created_at', 'finished_at')
+
+
+class JobRunner:
+    """Run callables on a bounded thread pool and keep their status by job id
+
+    With ``db_path`` every status change is also stored there, and jobs of
+    other processes are read (and, for ``wait``, polled) from it.
+    """
+
+    def __init__(self, max_workers=4, max_finished=1000, db_path=None, poll_interval=0.5):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.max_finished = max_finished
+        self.poll_interval = poll_interval
+        self.jobs = OrderedDict()
+        self.changed = threading.Condition()
+        self.db = None
+        if db_path is not None:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self.db = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, result TEXT, error TEXT, '
+                'created_at REAL NOT NULL, finished_at REAL)'
+            )
+            self.db.execute('CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)')
+            self.db.commit()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue ``fn(*args, **kwargs)`` and return the new job id"""
+        job_id = uuid.uuid4().hex
+        with self.changed:
+            self.jobs[job_id] = {
+                'id': job_id,
+                'kind': kind,
+                'status': 'queued',
+                'result': None,
+                'error': None,
+                'created_at': time.time(),
+                'finished_at': None
+            }
+            self._store(self.jobs[job_id])
+            self._prune()
+        self.executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status='running')
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Job {job_id} failed: {str(e)}")
+            self._update(job_id, status='failed', error=str(e), finished_at=time.time())
+        else:
+            self._update(job_id, status='done', result=result, finished_at=time.time())
+
+    def _update(self, job_id, **fields):
+        with self.changed:
+            self.jobs[job_id].update(fields)
+            self._store(self.jobs[job_id])
+            self.changed.notify_all()
+
+    def _store(self, job):
+        if self.db is None:
+            return
+        from serialization import dumps
+
+        result = None if job['result'] is None else dumps(job['result']).decode('utf-8')
+        self.db.execute(
+            f'INSERT OR REPLACE INTO jobs ({", ".join(JOB_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job['id'], job['kind'], job['status'], result, job['error'], job['created_at'], job['finished_at'])
+        )
+        self.db.commit()
+
+    def _load(self, job_id):
+        with self.changed:
+            if self.db is None:
+                return None
+            row = self.db.execute(f'SELECT {", ".join(JOB_FIELDS)} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        if job['result'] is not None:
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['finished_at'] is not None]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self.jobs[job_id]
+        if self.db is not None:
+            surplus = self.db.execute(
+                'SELECT COUNT(*) FROM jobs WHERE finished_at IS NOT NULL').fetchone()[0] - self.max_finished
+            if surplus > 0:
+                self.db.execute(
+                    'DELETE FROM jobs WHERE id IN ('
+                    'SELECT id FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at LIMIT ?)',
+                    (surplus,)
+                )
+                self.db.commit()
+
+    def get(self, job_id):
+        """Return a snapshot of a job, or None if the id is unknown or was pruned"""
+        with self.changed:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        return self._load(job_id)
+
+    def wait(self, job_id, last_status=None, timeout=15):
+        """Block until the job's status differs from ``last_status`` or ``timeout`` passes"""
+        with self.changed:
+            if job_id in self.jobs:
+                self.changed.wait_for(
+                    lambda: job_id not in self.jobs or self.jobs[job_id]['status'] != last_status,
+                    timeout=timeout
+                )
+                job = self.jobs.get(job_id)
+                return dict(job) if job is not None else None
+        # Another worker's job: its status only changes in the store
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self._load(job_id)
+            if job is None or job['status'] != last_status or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs; with ``wait`` block until queued and running jobs finish"""
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+        if self.db is not None:
+            with self.changed:
+                self.db.close()
+                self.db = None
@@ -0,0 +1,148 @@
+"""
+Sidecar metadata for uploaded files, kept next to the uploads so it survives restarts
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from csv_ingest import hash_file
+
+META_DIRNAME = '.meta'
+
+# Serializes read-modify-write updates from request threads and background jobs
+update_lock = threading.Lock()
+
+
+def meta_path(upload_folder, filename):
+    """Return the sidecar path for an uploaded file"""
+    return os.path.join(upload_folder, META_DIRNAME, f'{filename}.json')
+
+
+def file_signature(filepath):
+    """Return the size and mtime used to tell whether a sidecar is stale"""
+    file_stat = os.stat(filepath)
+    return {'size': file_stat.st_size, 'mtime': file_stat.st_mtime}
+
+
+def read_metadata(upload_folder, filename):
+    """Return a file's stored metadata as written, without checking it still describes the file"""
+    try:
+        with open(meta_path(upload_folder, filename), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_metadata(upload_folder, filename):
+    """Return the stored metadata for a file, or None if missing or stale
+
+    Size and mtime are checked first. If only the mtime moved (the file was
+    touched or copied over with identical bytes) the content hash decides.
+    """
+    filepath = os.path.join(upload_folder, filename)
+    if not os.path.exists(filepath):
+        return None
+    metadata = read_metadata(upload_folder, filename)
+    if metadata is None:
+        return None
+
+    signature = file_signature(filepath)
+    if metadata.get('size') != signature['size']:
+        return None
+    if metadata.get('mtime') != signature['mtime']:
+        if not metadata.get('sha256') or hash_file(filepath) != metadata['sha256']:
+            return None
+        metadata['mtime'] = signature['mtime']
+        save_metadata(upload_folder, filename, metadata)
+    return metadata
+
+
+def save_metadata(upload_folder, filename, metadata):
+    """Write the sidecar atomically, stamping it with the file's current signature"""
+    path = meta_path(upload_folder, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    record = dict(metadata)
+    record.update(file_signature(os.path.join(upload_folder, filename)))
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, default=str)
+    os.replace(tmp_path, path)
+    return record
+
+
+def update_metadata(upload_folder, filename, **fields):
+    """Merge ``fields`` into an existing sidecar; returns None if there is none"""
+    with update_lock:
+        metadata = load_metadata(upload_folder, filename)
+        if metadata is None:
+            return None
+        metadata.update(fields)
+        return save_metadata(upload_folder, filename, metadata)
+
+
+def delete_metadata(upload_folder, filename):
+    """Remove a file's sidecar and row index, if present"""
+    for path in (meta_path(upload_folder, filename), row_index_path(upload_folder, filename)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def row_index_path(upload_folder, filename):
+    """Return the path of a file's row-offset index"""
+    return os.path.join(upload_folder, META_DIRNAME, f'{filename}.rows.npy')
+
+
+def save_row_index(upload_folder, filename, checkpoints):
+    """Store the byte offset of every N-th row as a flat int64 array"""
+    path = row_index_path(upload_folder, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp.npy'
+    np.save(tmp_path, np.asarray(checkpoints, dtype=np.int64))
+    os.replace(tmp_path, path)
+
+
+def load_row_index(upload_folder, filename):
+    """Memory-map a file's row index, or return None if it was never built"""
+    path = row_index_path(upload_folder, filename)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r')
+
+
+class SidecarCache:
+    """Decoded sidecars of the last few files used, so a request does not re-read and re-decode one
+
+    ``load(upload_folder, filename)`` returns ``(sha256, value)`` or None; an
+    entry is only served for the content hash it was built from.
+    """
+
+    def __init__(self, load, max_files=8):
+        self.load = load
+        self.max_files = max_files
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, upload_folder, filename, sha256):
+        """Return the decoded sidecar of this content, or None while it is not built"""
+        with self.lock:
+            entry = self.entries.get(filename)
+            if entry is not None and entry[0] == sha256:
+                self.entries.move_to_end(filename)
+                return entry[1]
+        entry = self.load(upload_folder, filename)
+        if entry is None or entry[0] != sha256:
+            return None
+        with self.lock:
+            self.entries[filename] = entry
+            self.entries.move_to_end(filename)
+            while len(self.entries) > self.max_files:
+                self.entries.popitem(last=False)
+        return entry[1]
+
+    def discard(self, filename):
+        with self.lock:
+            self.entries.pop(filename, None)
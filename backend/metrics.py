@@ -0,0 +1,210 @@
+"""
+In-process metrics with Prometheus text exposition
+
+Counters and histograms are kept per label set in one registry per process.
+``stage()`` times a block of work into the stage histogram and, when a
+request is being traced, also records it as a span so the response can carry
+a ``Server-Timing`` header. Values that other components already count
+(model client, annotation cache) are read at scrape time through collectors
+instead of being counted twice.
+"""
+
+import cProfile
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Histogram:
+    """Bucketed distribution per label set, rendered with cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self.lock:
+            snapshot = [(key, list(counts), total, count) for key, (counts, total, count) in self.series.items()]
+        samples = []
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', key, cumulative, f'le="{_format_value(bound)}"'))
+            samples.append((f'{self.name}_sum', key, total))
+            samples.append((f'{self.name}_count', key, count))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.metrics = []
+        self.collectors = {}
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(f'{self.prefix}_{name}', help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(f'{self.prefix}_{name}', help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, name, collect):
+        """Set the callable under ``name`` returning ``(name, kind, help, [(labels_dict, value), ...])`` families
+
+        Collectors run at scrape time. Registering a name again replaces the
+        previous collector, so an app built twice in one process reports once.
+        """
+        self.collectors[name] = collect
+
+    def render(self):
+        """Return every metric in the Prometheus text format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample in metric.samples():
+                name, key, value = sample[:3]
+                extra = sample[3] if len(sample) > 3 else None
+                lines.append(f'{name}{_format_labels(metric.labels, key, extra)} {_format_value(value)}')
+        for collect in list(self.collectors.values()):
+            for name, kind, help_text, samples in collect():
+                name = f'{self.prefix}_{name}'
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry('csv_analyzer')
+stage_seconds = registry.histogram('stage_duration_seconds', 'Time spent in each processing stage', ['stage'])
+
+# Spans of the request being handled on this thread, if it is being traced
+_spans = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """Time a block as processing stage ``name``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name)
+        spans = getattr(_spans, 'current', None)
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def begin_spans():
+    _spans.current = []
+
+
+def end_spans():
+    """Stop collecting spans on this thread and return them as (stage, seconds) pairs"""
+    spans = getattr(_spans, 'current', None) or []
+    _spans.current = None
+    return spans
+
+
+def server_timing(spans):
+    """Format spans as a Server-Timing header value, summing repeated stages"""
+    totals = {}
+    for name, elapsed in spans:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return ', '.join(f'{name};dur={elapsed * 1000:.1f}' for name, elapsed in totals.items())
+
+
+class RequestProfiler:
+    """Runs cProfile on a random sample of requests and writes one .prof file per profiled request"""
+
+    def __init__(self, sample_rate, output_dir):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+
+    def maybe_start(self):
+        """Return a running profiler for this request, or None if it is not sampled"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return None
+        return profiler
+
+    def finish(self, profiler, label):
+        profiler.disable()
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_label = ''.join(char if char.isalnum() else '_' for char in label).strip('_') or 'request'
+        path = os.path.join(self.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{safe_label}-{uuid.uuid4().hex[:8]}.prof')
+        profiler.dump_stats(path)
+        return path
@@ -0,0 +1,215 @@
+"""
+Shared Gemini client: pooled keep-alive connections, retries, rate limiting and a circuit breaker
+"""
+
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ModelUnavailable(Exception):
+    """Raised when the model could not produce an answer; callers fall back to rule-based text"""
+
+
+class TokenBucket:
+    """Allow ``rate`` calls per second on average with bursts of up to ``capacity``"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout):
+        """Take one token, waiting up to ``timeout`` seconds; returns False if none came free"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Open after ``failure_threshold`` consecutive failures and stay open for ``reset_timeout`` seconds
+
+    Once the timeout passes a single trial call is let through (half-open); its
+    outcome closes the circuit again or re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+class GeminiClient:
+    """Thread-safe client shared by every request that talks to Gemini"""
+
+    def __init__(self, api_key, model, base_url=GEMINI_BASE_URL, timeout=30, pool_size=10,
+                 max_concurrency=4, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 rate_limit=5.0, burst=10, failure_threshold=5, reset_timeout=30):
+        self.api_key = api_key
+        self.model = model
+        self.url = f"{base_url.rstrip('/')}/models/{model}:generateContent"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # Retries are handled here so they share the rate limiter and breaker
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+        self.concurrency = threading.BoundedSemaphore(max_concurrency)
+        self.rate_limiter = TokenBucket(rate_limit, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self.stats_lock = threading.Lock()
+        self.counters = {'calls': 0, 'attempts': 0, 'retries': 0, 'failures': 0, 'short_circuited': 0}
+
+    def _count(self, name):
+        with self.stats_lock:
+            self.counters[name] += 1
+
+    def _backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring Retry-After when the server sends one"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        time.sleep(delay)
+
+    def generate(self, prompt):
+        """Return the text of the first candidate for ``prompt`` or raise ModelUnavailable"""
+        self._count('calls')
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise ModelUnavailable('Gemini circuit breaker is open')
+
+        try:
+            text = self._generate_with_retries(prompt)
+        except BaseException as e:
+            # Every way out of a failed call is recorded, or a half-open trial would stay running
+            self._count('failures')
+            self.breaker.record_failure()
+            if isinstance(e, Exception) and not isinstance(e, ModelUnavailable):
+                raise ModelUnavailable(f'Gemini call failed: {e!r}') from e
+            raise
+        self.breaker.record_success()
+        return text
+
+    def _generate_with_retries(self, prompt):
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count('retries')
+            if not self.rate_limiter.acquire(self.timeout):
+                raise ModelUnavailable('Gemini rate limit wait exceeded timeout')
+
+            retry_after = None
+            self._count('attempts')
+            with self.concurrency:
+                try:
+                    response = self.session.post(
+                        self.url, params={'key': self.api_key}, json=payload, timeout=self.timeout
+                    )
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    last_error = str(e)
+                    response = None
+                except requests.RequestException as e:
+                    raise ModelUnavailable(f'Gemini request failed: {e}') from e
+
+            if response is not None:
+                if response.status_code == 200:
+                    return self._answer_text(response)
+                last_error = f"{response.status_code} - {response.text[:200]}"
+                if response.status_code not in RETRY_STATUSES:
+                    raise ModelUnavailable(f"Gemini API error: {last_error}")
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                self._backoff(attempt, retry_after)
+
+        raise ModelUnavailable(f"Gemini API failed after {self.max_retries + 1} attempts: {last_error}")
+
+    @staticmethod
+    def _answer_text(response):
+        """Text of the first candidate; a malformed or blocked answer (no content) is ModelUnavailable"""
+        try:
+            result = response.json()
+            candidates = result.get('candidates')
+            if not candidates:
+                raise ModelUnavailable('Gemini returned no candidates')
+            text = candidates[0]['content']['parts'][0]['text']
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            raise ModelUnavailable(f'Gemini returned an unreadable answer: {e!r}') from e
+        if not isinstance(text, str):
+            raise ModelUnavailable('Gemini returned an unreadable answer')
+        return text
+
+    def close(self):
+        self.session.close()
+
+    def stats(self):
+        """Return call counters and the current breaker state"""
+        with self.stats_lock:
+            stats = dict(self.counters)
+        stats['circuit'] = self.breaker.state
+        return stats
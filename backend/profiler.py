@@ -0,0 +1,382 @@
+"""
+Streaming column profiler for stored uploads
+
+The file is read in chunks and each column keeps small mergeable sketches, so
+memory depends on the number of columns rather than the number of rows:
+HyperLogLog for distinct counts, a merging t-digest for quantiles and a
+bounded heavy-hitter table for top values. Columns are updated in parallel.
+"""
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from csv_ingest import CHUNK_ROWS, iter_chunks
+from sniffing import pandas_options, resolve_dialect
+
+QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+TOP_K = 10
+# Share of non-null values that must parse before a text column counts as dates
+DATETIME_MIN_PARSE_RATE = 0.95
+DATETIME_SAMPLE_SIZE = 200
+
+
+def infer_datetime_format(values):
+    """Return a strptime format shared by most of ``values`` (strings), or None"""
+    sample = values.dropna().astype(str)
+    if sample.empty:
+        return None
+    sample = sample.iloc[:DATETIME_SAMPLE_SIZE]
+    fmt = guess_datetime_format(sample.iloc[0])
+    if fmt is None:
+        return None
+    parsed = pd.to_datetime(sample, format=fmt, errors='coerce')
+    if parsed.notna().mean() < DATETIME_MIN_PARSE_RATE:
+        return None
+    return fmt
+
+
+def normalize_values(values):
+    """Put non-null values on a dtype that is stable across chunks
+
+    A column of integers reads as float in any chunk that has a gap, so
+    integral floats are turned back into integers before hashing or counting.
+    """
+    if pd.api.types.is_float_dtype(values.dtype):
+        array = values.to_numpy()
+        if np.all(np.mod(array, 1) == 0) and np.all(np.abs(array) < 2 ** 53):
+            return values.astype(np.int64)
+        return values
+    if pd.api.types.is_object_dtype(values.dtype):
+        return values.astype(str)
+    return values
+
+
+class HyperLogLog:
+    """Distinct-count estimator using 2**precision one-byte registers"""
+
+    def __init__(self, precision=12):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def update(self, hashes):
+        if not hashes.size:
+            return
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rank = leading_zeros(hashes << np.uint64(self.p)) + 1
+        rank = np.minimum(rank, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * self.m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            return self.m * math.log(self.m / zeros)
+        return float(raw)
+
+
+def leading_zeros(values):
+    """Count leading zero bits of uint64 values, vectorized via frexp on 32-bit halves"""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    _, high_bits = np.frexp(high)
+    _, low_bits = np.frexp(low)
+    return np.where(high > 0, 32 - high_bits, 64 - low_bits)
+
+
+class QuantileSketch:
+    """Merging t-digest
+
+    After each chunk the existing centroids and the new values are sorted
+    together and re-clustered along the arcsine scale function, which keeps
+    about ``compression / 2`` centroids and makes them smallest at the tails.
+    """
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    def update(self, values):
+        values = values[np.isfinite(values)]
+        if values.size:
+            self._absorb(values, np.ones(values.size))
+
+    def merge(self, other):
+        if other.weights.size:
+            self._absorb(other.means, other.weights)
+
+    def _absorb(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind='stable')
+        means = means[order]
+        weights = weights[order]
+
+        cumulative = np.cumsum(weights)
+        q = (cumulative - weights / 2) / cumulative[-1]
+        scale = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * q - 1))
+        starts = np.flatnonzero(np.diff(scale, prepend=scale[0] - 1))
+
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q, minimum, maximum):
+        if not self.weights.size:
+            return None
+        cumulative = np.cumsum(self.weights)
+        centers = cumulative - self.weights / 2
+        return float(np.interp(
+            q * cumulative[-1],
+            np.concatenate([[0.0], centers, [cumulative[-1]]]),
+            np.concatenate([[minimum], self.means, [maximum]])
+        ))
+
+
+class TopValues:
+    """Approximate top-k: per-chunk counts merged into a table trimmed to ``capacity`` entries"""
+
+    def __init__(self, k=TOP_K, capacity=None):
+        self.k = k
+        self.capacity = capacity or k * 50
+        self.counts = pd.Series(dtype='int64')
+
+    def update(self, values):
+        self._add(values.value_counts(sort=False))
+
+    def merge(self, other):
+        if not other.counts.empty:
+            self._add(other.counts)
+
+    def _add(self, counts):
+        if self.counts.empty:
+            merged = counts
+        else:
+            merged = self.counts.add(counts, fill_value=0)
+        self.counts = merged.nlargest(self.capacity).astype('int64')
+
+    def top(self):
+        return [
+            {'value': value.item() if hasattr(value, 'item') else value, 'count': int(count)}
+            for value, count in self.counts.nlargest(self.k).items()
+        ]
+
+
+class ColumnProfile:
+    """Accumulates the statistics for one column across chunks"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.kinds = set()
+        self.datetime_format = None
+        self.distinct = HyperLogLog()
+        self.top_values = TopValues()
+        self.quantiles = QuantileSketch()
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.numeric_count = 0
+
+    def _kind(self, values):
+        dtype = values.dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            return 'boolean'
+        if pd.api.types.is_integer_dtype(dtype):
+            return 'integer'
+        if pd.api.types.is_float_dtype(dtype):
+            return 'integer' if pd.api.types.is_integer_dtype(normalize_values(values).dtype) else 'float'
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            # Already parsed, e.g. by the Arrow reader of a columnar copy
+            self.datetime_format = self.datetime_format or 'ISO8601'
+            return 'datetime'
+        if self.datetime_format is None and not self.kinds:
+            self.datetime_format = infer_datetime_format(values)
+        return 'datetime' if self.datetime_format else 'string'
+
+    def update(self, series):
+        self.count += len(series)
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if values.empty:
+            return
+
+        kind = self._kind(values)
+        normalized = normalize_values(values)
+        self.distinct.update(pd.util.hash_pandas_object(normalized, index=False).to_numpy())
+        self.top_values.update(normalized)
+
+        if kind == 'datetime':
+            parsed = pd.to_datetime(values, format=self.datetime_format, errors='coerce')
+            if parsed.notna().mean() < DATETIME_MIN_PARSE_RATE:
+                kind = 'string'
+            else:
+                self._extend(parsed.min(), parsed.max())
+        elif kind in ('integer', 'float', 'boolean'):
+            array = values.to_numpy(dtype=np.float64)
+            self.total += float(array.sum())
+            self.numeric_count += array.size
+            if kind != 'boolean':
+                self.quantiles.update(array)
+                self._extend(array.min(), array.max())
+        self.kinds.add(kind)
+
+    def merge(self, other):
+        """Fold in the profile of the same column over other rows"""
+        self.count += other.count
+        self.nulls += other.nulls
+        self.kinds |= other.kinds
+        self.datetime_format = self.datetime_format or other.datetime_format
+        self.distinct.merge(other.distinct)
+        self.top_values.merge(other.top_values)
+        self.quantiles.merge(other.quantiles)
+        if other.minimum is not None:
+            self._extend(other.minimum, other.maximum)
+        self.total += other.total
+        self.numeric_count += other.numeric_count
+
+    def _extend(self, minimum, maximum):
+        if pd.isna(minimum):
+            return
+        self.minimum = minimum if self.minimum is None else min(self.minimum, minimum)
+        self.maximum = maximum if self.maximum is None else max(self.maximum, maximum)
+
+    @property
+    def dtype(self):
+        if not self.kinds:
+            return 'empty'
+        if len(self.kinds) == 1:
+            return next(iter(self.kinds))
+        if self.kinds <= {'integer', 'float'}:
+            return 'float'
+        return 'string'
+
+    def result(self):
+        dtype = self.dtype
+        profile = {
+            'name': self.name,
+            'dtype': dtype,
+            'count': self.count,
+            'null_count': self.nulls,
+            'distinct_estimate': int(round(min(self.distinct.estimate(), self.count - self.nulls))),
+            'top_values': self.top_values.top()
+        }
+        if dtype in ('integer', 'float'):
+            cast = int if dtype == 'integer' else float
+            profile['min'] = cast(self.minimum)
+            profile['max'] = cast(self.maximum)
+            profile['mean'] = self.total / self.numeric_count
+            profile['quantiles'] = {
+                f'p{int(q * 100):02d}': self.quantiles.quantile(q, self.minimum, self.maximum)
+                for q in QUANTILES
+            }
+        elif dtype == 'boolean':
+            profile['mean'] = self.total / self.numeric_count
+        elif dtype == 'datetime':
+            profile['datetime_format'] = self.datetime_format
+            profile['min'] = self.minimum.isoformat()
+            profile['max'] = self.maximum.isoformat()
+        return profile
+
+
+def infer_schema(filepath, nrows=1000, dialect=None):
+    """Infer each column's dominant dtype (and date format) from the first ``nrows`` rows
+
+    A type is chosen when at least ``DATETIME_MIN_PARSE_RATE`` of the non-empty
+    sample values fit it, so a few bad values do not turn a numeric column into
+    text; those values are what validation is meant to report.
+    """
+    # Undecodable bytes must not stop inference; the validator reports them itself
+    sample = pd.read_csv(filepath, nrows=nrows, dtype=str, keep_default_na=False,
+                         **pandas_options(resolve_dialect(filepath, dialect)))
+    schema = {}
+    for col in sample.columns:
+        values = sample[col][sample[col] != '']
+        schema[col] = {'dtype': 'empty' if values.empty else 'string', 'datetime_format': None}
+        if values.empty:
+            continue
+        numbers = pd.to_numeric(values, errors='coerce')
+        if numbers.notna().mean() >= DATETIME_MIN_PARSE_RATE:
+            integral = (np.mod(numbers.dropna(), 1) == 0).all()
+            schema[col]['dtype'] = 'integer' if integral else 'float'
+        elif values.str.lower().isin(['true', 'false']).mean() >= DATETIME_MIN_PARSE_RATE:
+            schema[col]['dtype'] = 'boolean'
+        else:
+            fmt = infer_datetime_format(values)
+            if fmt:
+                schema[col] = {'dtype': 'datetime', 'datetime_format': fmt}
+    return schema
+
+
+def profile_file(filepath, chunksize=CHUNK_ROWS, workers=None, chunks=None, dialect=None):
+    """Profile every column of a CSV in one streaming pass
+
+    ``chunks`` may supply the DataFrames from elsewhere (such as a columnar
+    copy); by default the CSV itself is streamed.
+    """
+    workers = workers or os.cpu_count() or 1
+    if chunks is None:
+        chunks = iter_chunks(filepath, chunksize=chunksize, dialect=dialect)
+    profiles = None
+    rows = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunks:
+            if profiles is None:
+                profiles = {col: ColumnProfile(col) for col in chunk.columns}
+            rows += len(chunk)
+            # Column sketches are independent, so each column updates on its own thread
+            list(executor.map(lambda col: profiles[col].update(chunk[col]), chunk.columns))
+
+    if profiles is None:
+        header = pd.read_csv(filepath, nrows=0, **pandas_options(resolve_dialect(filepath, dialect))).columns
+        profiles = {col: ColumnProfile(col) for col in header}
+    return {
+        'total_rows': rows,
+        'total_columns': len(profiles),
+        'columns': [profile.result() for profile in profiles.values()]
+    }
+
+
+def profile_range(filepath, columns, dialect, start, nrows, chunksize=CHUNK_ROWS):
+    """Profile ``nrows`` rows starting at byte offset ``start``, which must begin a row
+
+    Returns (profiles by column, rows read). Ranges of one file can be
+    profiled in separate processes and combined with ``merge_profiles``.
+    """
+    profiles = {col: ColumnProfile(col) for col in columns}
+    rows = 0
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        with pd.read_csv(f, header=None, names=columns, nrows=nrows, chunksize=chunksize,
+                         **pandas_options(dialect)) as reader:
+            for chunk in reader:
+                rows += len(chunk)
+                for col in columns:
+                    profiles[col].update(chunk[col])
+    return profiles, rows
+
+
+def merge_profiles(parts, columns):
+    """Combine ``profile_range`` results, in file order, into a ``profile_file`` result"""
+    profiles = {col: ColumnProfile(col) for col in columns}
+    rows = 0
+    for part_profiles, part_rows in parts:
+        rows += part_rows
+        for col, profile in part_profiles.items():
+            profiles[col].merge(profile)
+    return {
+        'total_rows': rows,
+        'total_columns': len(profiles),
+        'columns': [profile.result() for profile in profiles.values()]
+    }
@@ -0,0 +1,121 @@
+"""
+Prompt construction and answer parsing for column annotation
+"""
+
+import json
+
+# Rough size of an English token, used instead of a tokenizer
+CHARS_PER_TOKEN = 4
+# Room left in the budget for each column's description in the answer
+OUTPUT_TOKENS_PER_COLUMN = 40
+# Sample values longer than this are cut; free text adds tokens but little meaning
+MAX_SAMPLE_VALUE_CHARS = 80
+
+COLUMNS_PROMPT = """
+You are a data expert. The following CSV file has these column headers:
+
+{columns}
+
+Here are a few sample rows:
+
+{sample_text}
+
+Please analyze the column names and give a description of what each one likely refers to or means.
+Output your answer as a JSON object where keys are column names and values are descriptions.
+Example format: {{"column1": "description1", "column2": "description2"}}
+
+Only return the JSON object, no other text.
+"""
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_value(value, max_chars=MAX_SAMPLE_VALUE_CHARS):
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + '...'
+    return value
+
+
+def format_sample_rows(sample_data, columns=None, max_value_chars=MAX_SAMPLE_VALUE_CHARS):
+    """Sample rows as prompt text, limited to ``columns`` if given, with long values cut"""
+    rows = []
+    for row in sample_data:
+        if columns is not None:
+            row = {col: row.get(col) for col in columns}
+        rows.append({key: truncate_value(value, max_value_chars) for key, value in row.items()})
+    return "\n".join([f"Row {i+1}: {json.dumps(row, default=str)}" for i, row in enumerate(rows)])
+
+
+def build_columns_prompt(columns, sample_text):
+    """Prompt asking for a JSON object of descriptions for ``columns``"""
+    return COLUMNS_PROMPT.format(columns=', '.join(columns), sample_text=sample_text)
+
+
+def pack_columns(columns, sample_text, token_budget):
+    """Split ``columns`` into as few groups as fit ``token_budget`` per prompt
+
+    Every prompt repeats the template and sample rows, so their cost is paid
+    once per group; each column then costs its name plus its expected answer.
+    A column is never dropped, even if it alone exceeds the budget.
+    """
+    base_tokens = estimate_tokens(build_columns_prompt([], sample_text))
+    groups = []
+    current = []
+    used = base_tokens
+    for col in columns:
+        cost = estimate_tokens(f'{col}, ') + OUTPUT_TOKENS_PER_COLUMN
+        if current and used + cost > token_budget:
+            groups.append(current)
+            current = []
+            used = base_tokens
+        current.append(col)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+def shard_columns(columns, sample_data, token_budget):
+    """Split ``columns`` into shards whose prompts, with only their own sample values, fit ``token_budget``
+
+    Unlike ``pack_columns`` the sample rows are not repeated whole in every
+    prompt: each column brings its (truncated) sample values along, so wide
+    schemas split into many small prompts that can be sent concurrently.
+    """
+    base_tokens = estimate_tokens(build_columns_prompt([], format_sample_rows(sample_data, columns=[])))
+    shards = []
+    current = []
+    used = base_tokens
+    for col in columns:
+        values = [json.dumps(truncate_value(row.get(col)), default=str) for row in sample_data]
+        cost = (estimate_tokens(f'{col}, ') + OUTPUT_TOKENS_PER_COLUMN
+                + estimate_tokens(json.dumps(str(col))) * len(sample_data) + estimate_tokens(', '.join(values)))
+        if current and used + cost > token_budget:
+            shards.append(current)
+            current = []
+            used = base_tokens
+        current.append(col)
+        used += cost
+    if current:
+        shards.append(current)
+    return shards
+
+
+def parse_json_answer(ai_response):
+    """Parse a JSON object answer, tolerating a markdown code fence; raises ValueError"""
+    # Clean the response - remove markdown code blocks if present
+    cleaned_response = ai_response.strip()
+    if cleaned_response.startswith('```json'):
+        cleaned_response = cleaned_response[7:]  # Remove ```json
+    elif cleaned_response.startswith('```'):
+        cleaned_response = cleaned_response[3:]
+    if cleaned_response.endswith('```'):
+        cleaned_response = cleaned_response[:-3]  # Remove ```
+    cleaned_response = cleaned_response.strip()
+
+    answer = json.loads(cleaned_response)
+    if not isinstance(answer, dict):
+        raise ValueError(f'Expected a JSON object, got {type(answer).__name__}')
+    return answer
@@ -0,0 +1,341 @@
+"""
+Time-series rollups of uploads with date columns
+
+After upload, the date columns of a file are parsed once, vectorized, and
+reduced to daily, weekly and monthly cells: a row count and, when the file
+has them, duration statistics (close minus open) and the late rate. Each
+cell exists overall and per value of a few low-cardinality category columns.
+Cells only hold sums, minimums, maximums and a fixed log-scale histogram of
+durations, so partial results for chunks, or for rows appended in a newer
+upload of the same file, combine exactly.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from csv_ingest import CHUNK_ROWS, SCAN_CHUNK_BYTES, iter_chunks
+from metadata_store import META_DIRNAME
+from profiler import infer_schema
+from serialization import dumps
+from sniffing import pandas_options
+
+GRAINS = ('day', 'week', 'month')
+COMPRESS_LEVEL = 3
+SAMPLE_ROWS = 1000
+MAX_CATEGORIES = 100
+MAX_CATEGORY_COLUMNS = 6
+# Share of distinct values in the sample above which a column is an identifier, not a category
+MAX_CATEGORY_RATIO = 0.2
+
+START_HINTS = ('open', 'created', 'start', 'received', 'submitted', 'reported')
+END_HINTS = ('close', 'resolved', 'completed', 'finish', 'end')
+DUE_HINTS = ('sla', 'due', 'deadline', 'target')
+LATE_PATTERN = re.compile(r'late|overdue|past[\s_]?due', re.I)
+LATE_VALUES = {'true': 1.0, 'yes': 1.0, 'y': 1.0, '1': 1.0, 'late': 1.0,
+               'false': 0.0, 'no': 0.0, 'n': 0.0, '0': 0.0, 'on time': 0.0}
+
+# Duration histogram edges in hours, from one minute to a year
+DURATION_EDGES = np.geomspace(1 / 60, 24 * 365, 19)
+HIST_FIELDS = [f'hist_{i}' for i in range(len(DURATION_EDGES) + 1)]
+KEY_FIELDS = ['time_column', 'grain', 'category_column', 'period', 'category']
+SUM_FIELDS = ['count', 'duration_count', 'duration_sum', 'late_count', 'late_known'] + HIST_FIELDS
+
+
+def rollups_path(upload_folder, filename):
+    return os.path.join(upload_folder, META_DIRNAME, f'{filename}.rollups.json.gz')
+
+
+def _named(columns, hints, candidates):
+    for col in candidates:
+        if any(hint in str(col).lower() for hint in hints):
+            return col
+    return None
+
+
+def plan_rollups(filepath, dialect):
+    """Pick the time, duration, late and category columns from a sample of the file"""
+    schema = infer_schema(filepath, SAMPLE_ROWS, dialect=dialect)
+    sample = pd.read_csv(filepath, nrows=SAMPLE_ROWS, dtype=str, keep_default_na=False, **pandas_options(dialect))
+    time_columns = [col for col, info in schema.items() if info['dtype'] == 'datetime']
+    formats = {col: schema[col]['datetime_format'] for col in time_columns}
+
+    start = _named(time_columns, START_HINTS, time_columns)
+    end = _named(time_columns, END_HINTS, [col for col in time_columns if col != start])
+    duration = {'start': start, 'end': end} if start and end else None
+
+    late = None
+    for col in sample.columns:
+        values = sample[col].str.strip().str.lower()
+        values = values[values != '']
+        if LATE_PATTERN.search(str(col)) and not values.empty and values.isin(list(LATE_VALUES)).all():
+            late = {'column': col}
+            break
+    if late is None and duration:
+        # Without a late flag, a case is late when it closed after its SLA/due date
+        due = _named(time_columns, DUE_HINTS, [col for col in time_columns if col not in (start, end)])
+        if due:
+            late = {'due': due}
+
+    categories = []
+    for col, info in schema.items():
+        if info['dtype'] not in ('string', 'integer') or (late and col == late.get('column')):
+            continue
+        values = sample[col][sample[col] != '']
+        distinct = values.nunique()
+        if 2 <= distinct <= MAX_CATEGORIES and distinct <= MAX_CATEGORY_RATIO * len(values):
+            categories.append(col)
+    return {
+        'time_columns': time_columns,
+        'datetime_formats': formats,
+        'duration': duration,
+        'late': late,
+        'category_columns': categories[:MAX_CATEGORY_COLUMNS]
+    }
+
+
+def needed_columns(plan):
+    columns = list(plan['time_columns']) + list(plan['category_columns'])
+    if plan['late'] and 'column' in plan['late']:
+        columns.append(plan['late']['column'])
+    return columns
+
+
+def period_start(stamps, grain):
+    days = stamps.dt.floor('D')
+    if grain == 'day':
+        return days
+    if grain == 'week':
+        # Weeks start on Monday
+        return days - pd.to_timedelta(days.dt.weekday, unit='D')
+    return days - pd.to_timedelta(days.dt.day - 1, unit='D')
+
+
+def aggregate(chunk, plan):
+    """Rollup cells for one chunk of text values, as a DataFrame of KEY_FIELDS plus stats"""
+    stamps = {col: pd.to_datetime(chunk[col], format=plan['datetime_formats'][col], errors='coerce')
+              for col in plan['time_columns']}
+
+    stats = pd.DataFrame({'count': np.ones(len(chunk), dtype=np.int64)}, index=chunk.index)
+    duration = plan['duration']
+    if duration:
+        hours = (stamps[duration['end']] - stamps[duration['start']]).dt.total_seconds() / 3600
+        # Closed before opened is a data error, not a duration
+        valid = (hours >= 0).to_numpy()
+        stats['duration_count'] = valid.astype(np.int64)
+        stats['duration_sum'] = np.where(valid, hours, 0.0)
+        stats['duration_min'] = hours.where(valid)
+        stats['duration_max'] = hours.where(valid)
+        bins = np.digitize(np.nan_to_num(hours.to_numpy(), nan=0.0), DURATION_EDGES)
+        hist = (bins[:, None] == np.arange(len(HIST_FIELDS))) & valid[:, None]
+        stats = stats.join(pd.DataFrame(hist.astype(np.int64), columns=HIST_FIELDS, index=chunk.index))
+    late = plan['late']
+    if late:
+        if 'column' in late:
+            flags = chunk[late['column']].str.strip().str.lower().map(LATE_VALUES)
+        else:
+            end, due = stamps[duration['end']], stamps[late['due']]
+            flags = (end > due).astype(np.float64).where(end.notna() & due.notna())
+        stats['late_count'] = flags.fillna(0.0)
+        stats['late_known'] = flags.notna().astype(np.int64)
+
+    sums = [field for field in SUM_FIELDS if field in stats.columns]
+    # One block per dtype, so each group-by sums a few 2-D blocks rather than every column alone
+    stats = stats.copy()
+    cells = []
+    for time_column, values in stamps.items():
+        dated = values.notna()
+        if not dated.any():
+            continue
+        rows = stats[dated]
+        day = values[dated].dt.floor('D').rename('period')
+        for category_column in [None] + plan['category_columns']:
+            keys = [day]
+            if category_column is not None:
+                keys.append(chunk.loc[dated, category_column].rename('category'))
+            days = group_cells(rows.groupby(keys, sort=False), sums)
+            if category_column is None:
+                days['category'] = ''
+            # Rows are grouped once; weeks and months regroup the far fewer day cells
+            for grain in GRAINS:
+                if grain == 'day':
+                    grouped = days.copy()
+                else:
+                    period = period_start(days['period'], grain)
+                    grouped = group_cells(days.groupby([period, days['category']], sort=False), sums)
+                # Formatted after grouping, once per cell instead of once per row
+                grouped['period'] = grouped['period'].dt.strftime('%Y-%m-%d')
+                grouped['time_column'] = time_column
+                grouped['grain'] = grain
+                grouped['category_column'] = category_column or ''
+                cells.append(grouped)
+    return pd.concat(cells, ignore_index=True) if cells else None
+
+
+def group_cells(groups, sums):
+    """One sum over all summed fields, plus min and max, instead of a reduction per field"""
+    grouped = groups[sums].sum()
+    if 'duration_min' in groups.obj.columns:
+        grouped['duration_min'] = groups['duration_min'].min()
+        grouped['duration_max'] = groups['duration_max'].max()
+    return grouped.reset_index()
+
+
+def combine(parts):
+    """Merge cell frames from chunks or earlier builds into one cell per key"""
+    parts = [part for part in parts if part is not None and len(part)]
+    if not parts:
+        return pd.DataFrame(columns=KEY_FIELDS + SUM_FIELDS + ['duration_min', 'duration_max'])
+    cells = pd.concat(parts, ignore_index=True)
+    return group_cells(cells.groupby(KEY_FIELDS, sort=True), [field for field in SUM_FIELDS if field in cells.columns])
+
+
+def read_tail(filepath, columns, dialect, start, needed, chunksize=CHUNK_ROWS):
+    """Yield text chunks of the rows that begin at byte ``start``"""
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        with pd.read_csv(f, header=None, names=columns, usecols=needed, dtype=str, keep_default_na=False,
+                         chunksize=chunksize, **pandas_options(dialect)) as reader:
+            yield from reader
+
+
+def prefix_matches(filepath, size, sha256):
+    """True when the file's first ``size`` bytes hash to ``sha256`` and end a row"""
+    if os.path.getsize(filepath) <= size:
+        return False
+    hasher = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        remaining = size
+        last = b''
+        while remaining:
+            block = f.read(min(SCAN_CHUNK_BYTES, remaining))
+            if not block:
+                return False
+            hasher.update(block)
+            remaining -= len(block)
+            last = block[-1:]
+    return last == b'\n' and hasher.hexdigest() == sha256
+
+
+def build_rollups(filepath, metadata, previous=None, chunksize=CHUNK_ROWS):
+    """Compute the rollups of a file; reuses ``previous`` when the file only appended rows to it
+
+    Returns the stored form: the plan, the source it reflects, and the cells.
+    """
+    dialect = metadata.get('dialect')
+    plan = plan_rollups(filepath, dialect)
+    needed = needed_columns(plan)
+    appended = (
+        previous is not None
+        and previous['plan'] == plan
+        and previous['columns'] == metadata['columns']
+        and previous['dialect'] == dialect
+        and prefix_matches(filepath, previous['size'], previous['sha256'])
+    )
+    if not plan['time_columns']:
+        parts = []
+    elif appended:
+        parts = [previous_cells(previous)]
+        parts += [aggregate(chunk, plan)
+                  for chunk in read_tail(filepath, metadata['columns'], dialect, previous['size'], needed, chunksize)]
+    else:
+        parts = [aggregate(chunk, plan)
+                 for chunk in iter_chunks(filepath, columns=needed, chunksize=chunksize, dialect=dialect,
+                                          as_text=True)]
+    cells = combine(parts)
+    return {
+        'sha256': metadata['sha256'],
+        'size': os.path.getsize(filepath),
+        'columns': metadata['columns'],
+        'dialect': dialect,
+        'plan': plan,
+        'incremental': appended,
+        'cells': {field: cells[field].tolist() for field in cells.columns}
+    }
+
+
+def previous_cells(rollups):
+    return pd.DataFrame(rollups['cells'])
+
+
+def save_rollups(upload_folder, filename, rollups):
+    path = rollups_path(upload_folder, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    # Encoded in one pass; a fast compression level, as the cells are rewritten on every upload
+    with gzip.open(tmp_path, 'wb', compresslevel=COMPRESS_LEVEL) as f:
+        f.write(dumps(rollups))
+    os.replace(tmp_path, path)
+
+
+def load_rollups(upload_folder, filename):
+    """Return the stored rollups of a file, or None"""
+    try:
+        with gzip.open(rollups_path(upload_folder, filename), 'rb') as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def load_rollup_cells(upload_folder, filename):
+    """Loader for a SidecarCache: the stored rollups and their cells as a DataFrame"""
+    rollups = load_rollups(upload_folder, filename)
+    if rollups is None:
+        return None
+    return rollups['sha256'], (rollups, previous_cells(rollups))
+
+
+def histogram_quantile(hist, q, minimum, maximum):
+    """Approximate the q-quantile of each row's duration histogram, interpolating geometrically in a bin"""
+    totals = hist.sum(axis=1)
+    cumulative = np.cumsum(hist, axis=1)
+    target = q * totals
+    index = np.argmax(cumulative >= target[:, None], axis=1)
+    rows = np.arange(len(hist))
+    below = np.where(index > 0, cumulative[rows, np.maximum(index - 1, 0)], 0)
+    in_bin = hist[rows, index]
+    fraction = np.divide(target - below, in_bin, out=np.zeros(len(hist)), where=in_bin > 0)
+    edges = np.concatenate([[DURATION_EDGES[0] / 2], DURATION_EDGES, [DURATION_EDGES[-1] * 2]])
+    low = np.maximum(edges[index], minimum)
+    high = np.minimum(edges[index + 1], maximum)
+    low = np.minimum(low, high)
+    value = np.exp(np.log(np.maximum(low, 1e-9)) + fraction * (np.log(np.maximum(high, 1e-9))
+                                                                - np.log(np.maximum(low, 1e-9))))
+    return np.where(totals > 0, value, np.nan)
+
+
+def query_rollups(cells, time_column, grain, category_column='', categories=None, start=None, end=None):
+    """Select one series of ``cells`` and turn their sums into counts, rates and duration statistics"""
+    if cells.empty:
+        return pd.DataFrame(columns=['period', 'count'])
+    mask = ((cells['time_column'] == time_column) & (cells['grain'] == grain)
+            & (cells['category_column'] == category_column))
+    if categories:
+        mask &= cells['category'].astype(str).isin(categories)
+    if start:
+        mask &= cells['period'] >= start
+    if end:
+        mask &= cells['period'] <= end
+    cells = cells[mask].sort_values(['period', 'category'])
+
+    rows = pd.DataFrame({'period': cells['period'], 'count': cells['count'].astype(np.int64)})
+    if category_column:
+        rows['category'] = cells['category']
+    if 'late_known' in cells.columns:
+        rows['late_rate'] = (cells['late_count'] / cells['late_known'].where(cells['late_known'] > 0))
+    if 'duration_count' in cells.columns:
+        hist = cells[HIST_FIELDS].to_numpy(dtype=np.float64)
+        minimum = cells['duration_min'].to_numpy(dtype=np.float64)
+        maximum = cells['duration_max'].to_numpy(dtype=np.float64)
+        rows['duration_count'] = cells['duration_count'].astype(np.int64)
+        rows['duration_mean_hours'] = cells['duration_sum'] / cells['duration_count'].where(cells['duration_count'] > 0)
+        rows['duration_min_hours'] = minimum
+        rows['duration_max_hours'] = maximum
+        rows['duration_p50_hours'] = histogram_quantile(hist, 0.5, minimum, maximum)
+        rows['duration_p90_hours'] = histogram_quantile(hist, 0.9, minimum, maximum)
+    return rows
@@ -0,0 +1,1384 @@
+"""
+API routes
+
+Modules that import pandas, numpy or requests are imported inside the
+handlers that use them, so the app itself imports quickly and the health
+check answers before they are loaded. Each worker loads them once, during
+warm-up or on its first request.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from flask import Blueprint, Response, current_app, g, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from admission import Overloaded
+from annotation_cache import annotation_key
+from blob_store import commit_blob, has_blob, link_blob, release_blob, save_stream, staging_path
+from chunked_uploads import SessionNotFound, UploadConflict, UploadError, UploadTooLarge
+from metrics import begin_spans, end_spans, server_timing, stage
+from metrics import registry as metrics_registry
+from prompts import build_columns_prompt, format_sample_rows, pack_columns, parse_json_answer, shard_columns
+
+api = Blueprint('api', __name__)
+
+# Request metrics; model and cache counters are read from their own stats at scrape time
+http_requests = metrics_registry.counter(
+    'http_requests_total', 'Requests handled, by endpoint, method and status', ['endpoint', 'method', 'status'])
+http_request_seconds = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Time until the response is returned (streamed bodies excluded)',
+    ['endpoint', 'method'])
+fallback_descriptions = metrics_registry.counter(
+    'fallback_descriptions_total', 'Column descriptions served by the rule-based fallback')
+
+
+def get_services():
+    return current_app.extensions['csv_analyzer']
+
+@api.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    begin_spans()
+    g.profiler = get_services().request_profiler.maybe_start()
+
+@api.after_app_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    started = g.get('request_started')
+    if started is not None:
+        http_request_seconds.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    spans = end_spans()
+    if spans:
+        response.headers['Server-Timing'] = server_timing(spans)
+    if g.get('profiler') is not None:
+        get_services().request_profiler.finish(g.profiler, f'{request.method}-{endpoint}')
+    return response
+
+@api.app_errorhandler(Overloaded)
+def overloaded(e):
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+@api.app_errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    limit = current_app.config['MAX_CONTENT_LENGTH']
+    return jsonify({'error': f'Request body is larger than the {limit} byte limit'}), 413
+
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/upload', methods=['POST'])
+def upload_file():
+    svc = get_services()
+    # Turned away before the body is read if the parse queue is already full
+    svc.parse_gate.check()
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    if not is_plain_filename(file.filename):
+        return jsonify({'error': 'A plain filename is required'}), 400
+    staged_path = staging_path(svc.upload_folder)
+    with stage('save'):
+        # Hashed while it is written, so the stored copy is not read back just for its hash
+        sha256 = save_stream(file.stream, staged_path)
+        if is_feed_upload(file.filename):
+            return start_feed(svc, file.filename, staged_path)
+    return finish_upload(svc, file.filename, staged_path, sha256, wants_async())
+
+# With ?async=1 the summary is returned right away and annotations are
+# delivered through /api/jobs/<job_id>
+def wants_async():
+    return str(request.values.get('async', '')).lower() in ('1', 'true', 'yes')
+
+def is_plain_filename(filename):
+    """True for a bare name inside the uploads folder: no directory part and no dotfile (.meta, ..)"""
+    return (isinstance(filename, str) and bool(filename) and os.path.basename(filename) == filename
+            and not filename.startswith('.'))
+
+def finish_upload(svc, filename, staged_path, sha256, run_async, parse_ticket=None):
+    """Store a received file under its content hash, then summarize and annotate it
+
+    Content that is already stored is linked to the new name and its metadata
+    and annotations are copied, so nothing is parsed or sent to the model again.
+    New content is parsed under a parse slot: ``parse_ticket`` if the caller
+    already holds one, otherwise one is taken here before anything is stored.
+    """
+    from csv_ingest import summarize_csv
+    from metadata_store import file_signature, save_metadata
+    from serialization import clean_nan_values, frame_records, json_response
+    from sniffing import UnsupportedEncoding
+
+    known = find_known_metadata(svc, sha256)
+    reusable = known is not None and known.get('annotations')
+    if parse_ticket is None and not reusable:
+        try:
+            parse_ticket = svc.parse_gate.acquire()
+        except Overloaded:
+            # Nothing is stored yet, so a retry starts clean
+            os.remove(staged_path)
+            raise
+    try:
+        previous = svc.upload_catalog.get_sha256(filename)
+        with stage('save'):
+            commit_blob(svc.upload_folder, staged_path, sha256)
+            filepath = link_blob(svc.upload_folder, sha256, filename)
+            if previous != sha256:
+                release_blob(svc.upload_folder, previous)
+
+        if reusable:
+            return json_response(reuse_upload(svc, filename, known))
+
+        # --- CSV Summary ---
+        try:
+            # Only the header, a bounded sample and a streamed row count are needed,
+            # so the file is never loaded whole
+            with stage('parse'):
+                ingest = summarize_csv(filepath, sha256=sha256)
+                # Missing values are cleaned per column on just the rows sent back
+                sample_data = frame_records(ingest['sample'], 5)
+                metadata = build_file_metadata(svc, filename, ingest, sample_data)
+                inherited = inherit_from_similar(svc, metadata)
+        except Exception as e:
+            # The file stays stored, so it is still listed, with unknown counts
+            svc.upload_catalog.upsert(filename, sha256=sha256, **file_signature(filepath))
+            if isinstance(e, UnsupportedEncoding):
+                return jsonify({'error': str(e)}), 400
+            return jsonify({'error': f'Failed to process CSV: {str(e)}'}), 500
+    finally:
+        if parse_ticket is not None:
+            parse_ticket.release()
+    # --- Column Annotation with Gemini AI ---
+    # Columns carried over from a similar upload keep their annotations
+    columns_list = [col for col in ingest['columns'] if col not in inherited]
+
+    # Get sample data for context
+    context_rows = sample_data[:3]
+
+    annotate_ticket = None
+    if not columns_list:
+        # Every column was inherited, so there is nothing to ask the model
+        run_async = False
+    elif not run_async:
+        try:
+            annotate_ticket = svc.annotate_gate.acquire()
+        except Overloaded:
+            # Model-bound requests are backed up: the upload still succeeds and
+            # its columns are annotated in the background instead
+            run_async = True
+
+    if annotate_ticket is not None:
+        with annotate_ticket:
+            metadata['annotations'] = annotate_columns(svc, ingest['columns'], context_rows, inherited)
+    else:
+        metadata['annotations'] = inherited
+    # Persist the summary and annotations so later lookups skip re-parsing
+    svc.upload_catalog.record(save_metadata(svc.upload_folder, filename, clean_nan_values(metadata)))
+    annotation_job = None
+    if run_async:
+        job_id = svc.job_runner.submit('annotate', annotate_upload, svc, filename, ingest['columns'], context_rows,
+                                       inherited)
+        annotation_job = {'id': job_id, 'status': 'queued', 'status_url': f'/api/jobs/{job_id}'}
+    schedule_columnar_copy(svc, filename, ingest['sha256'])
+    schedule_rollups(svc, filename, ingest['sha256'])
+    schedule_spatial_index(svc, filename, ingest['sha256'])
+
+    return json_response(upload_response(metadata, annotation_job))
+
+# A .zip sent to either upload endpoint is a GTFS feed: its tables are stored
+# as separate uploads and ingested in the background (see gtfs.py)
+def is_feed_upload(filename):
+    return filename.lower().endswith('.zip')
+
+def start_feed(svc, filename, staged_path):
+    """Queue ingestion of a received feed zip and answer 202 with its job"""
+    import zipfile
+    from gtfs import feed_name_for
+    from serialization import json_response
+
+    if not zipfile.is_zipfile(staged_path):
+        os.remove(staged_path)
+        return jsonify({'error': 'Not a valid zip file'}), 400
+    feed_name = feed_name_for(filename)
+    job_id = svc.job_runner.submit('feed', ingest_feed, svc, feed_name, staged_path)
+    return json_response({
+        'success': True,
+        'message': 'Feed received, ingesting its tables',
+        'feed': feed_name,
+        'feed_job': {'id': job_id, 'status': 'queued', 'status_url': f'/api/jobs/{job_id}'},
+        'report_url': f'/api/feeds/{feed_name}'
+    }, status=202)
+
+def ingest_feed(svc, feed_name, zip_path):
+    """Background job body: store each table of a feed, then summarize, profile and cross-check them
+
+    Tables are summarized in parallel in the process pool; large tables are
+    profiled and key-checked in byte ranges across all its workers.
+    """
+    from csv_ingest import summarize_csv
+    from gtfs import check_foreign_keys, collect_profile, extract_members, feed_table_name, save_feed_report
+    from gtfs import submit_profile
+    from metadata_store import file_signature, save_metadata, update_metadata
+    from serialization import clean_nan_values, frame_records
+
+    stored = {}
+    try:
+        for member, staged_path, sha256 in extract_members(zip_path, svc.upload_folder, svc.max_upload_size):
+            filename = feed_table_name(feed_name, member)
+            previous = svc.upload_catalog.get_sha256(filename)
+            commit_blob(svc.upload_folder, staged_path, sha256)
+            filepath = link_blob(svc.upload_folder, sha256, filename)
+            if previous != sha256:
+                release_blob(svc.upload_folder, previous)
+            stored[member] = (filename, filepath, sha256)
+    finally:
+        os.remove(zip_path)
+
+    pool = svc.process_pool
+    summaries = {member: pool.submit(summarize_csv, filepath) for member, (_, filepath, _) in stored.items()}
+    tables = {}
+    report_tables = {}
+    for member, future in summaries.items():
+        filename, filepath, sha256 = stored[member]
+        try:
+            ingest = future.result()
+        except Exception as e:
+            # Stored and listed like any upload that failed to parse
+            svc.upload_catalog.upsert(filename, sha256=sha256, **file_signature(filepath))
+            report_tables[member] = {'filename': filename, 'error': f'Failed to process CSV: {str(e)}'}
+            continue
+        sample_data = frame_records(ingest['sample'], 5)
+        metadata = build_file_metadata(svc, filename, ingest, sample_data)
+        inherited = inherit_from_similar(svc, metadata)
+        metadata['annotations'] = inherited
+        svc.upload_catalog.record(save_metadata(svc.upload_folder, filename, clean_nan_values(metadata)))
+        job_id = None
+        if len(inherited) < len(ingest['columns']):
+            job_id = svc.job_runner.submit('annotate', annotate_upload, svc, filename, ingest['columns'],
+                                           sample_data[:3], inherited)
+        schedule_columnar_copy(svc, filename, sha256)
+        schedule_rollups(svc, filename, sha256)
+        schedule_spatial_index(svc, filename, sha256)
+        tables[member] = (filepath, ingest)
+        report_tables[member] = {
+            'filename': filename,
+            'num_rows': ingest['num_rows'],
+            'num_columns': len(ingest['columns']),
+            'annotation_job': job_id
+        }
+
+    # Every table's ranges are queued before any result is awaited, so small
+    # tables fill the workers while stop_times is still being parsed
+    profiles = {member: submit_profile(pool, filepath, ingest, svc.feed_workers, svc.profile_chunk_rows)
+                for member, (filepath, ingest) in tables.items()}
+    for member, futures in profiles.items():
+        profile = clean_nan_values(collect_profile(futures, tables[member][1]))
+        update_metadata(svc.upload_folder, report_tables[member]['filename'], profile=profile)
+
+    foreign_keys = check_foreign_keys(pool, tables, svc.feed_workers)
+    report = {
+        'feed': feed_name,
+        'tables': report_tables,
+        'foreign_keys': foreign_keys,
+        'is_valid': (all('error' not in table for table in report_tables.values())
+                     and all(check['status'] != 'missing' for check in foreign_keys))
+    }
+    save_feed_report(svc.upload_folder, feed_name, report)
+    return report
+
+@api.route('/api/feeds/<feed_name>', methods=['GET'])
+def get_feed(feed_name):
+    from gtfs import load_feed_report
+    from serialization import json_response
+
+    if not is_plain_filename(feed_name):
+        return jsonify({'error': 'A plain feed name is required'}), 400
+    report = load_feed_report(get_services().upload_folder, feed_name)
+    if report is None:
+        return jsonify({'error': 'Feed not found'}), 404
+    return json_response({'success': True, 'feed': report})
+
+def upload_response(metadata, annotation_job=None):
+    """Build the body returned by the upload endpoints"""
+    summary = {
+        'filename': metadata['filename'],
+        'num_rows': metadata['num_rows'],
+        'num_columns': metadata['num_columns'],
+        'columns': metadata['columns'],
+        'sample': metadata['sample']
+    }
+    annotations = metadata.get('annotations', {})
+    response_data = {
+        'success': True,
+        'message': 'File uploaded successfully',
+        'summary': summary,
+        'annotations': annotations,
+        'filename': metadata['filename'],
+        'data': metadata['sample'],
+        'stats': summary,
+        'column_descriptions': annotations
+    }
+    if annotation_job:
+        response_data['annotation_job'] = annotation_job
+    if metadata.get('schema_match'):
+        response_data['schema_match'] = metadata['schema_match']
+    return response_data
+
+def find_known_metadata(svc, sha256):
+    """Return fresh metadata of any stored file with this content, or None"""
+    from metadata_store import load_metadata
+
+    for name in svc.upload_catalog.filenames_with_sha256(sha256):
+        metadata = load_metadata(svc.upload_folder, name)
+        if metadata is not None and metadata.get('sha256') == sha256:
+            return metadata
+    return None
+
+def reuse_upload(svc, filename, source):
+    """Give a new name to already-processed content by copying its metadata and derived files"""
+    from columnar import columnar_path, has_columnar_copy
+    from metadata_store import row_index_path, save_metadata
+    from metadata_store import update_lock as metadata_update_lock
+    from rollups import rollups_path
+    from spatial import spatial_path
+
+    metadata = {key: value for key, value in source.items() if key not in ('size', 'mtime', 'columnar_sha256')}
+    metadata['filename'] = filename
+    with metadata_update_lock:
+        for path_of in (row_index_path, columnar_path, rollups_path, spatial_path):
+            source_path = path_of(svc.upload_folder, source['filename'])
+            target_path = path_of(svc.upload_folder, filename)
+            if source_path != target_path and os.path.exists(source_path):
+                # Derived files are immutable once written, so the new name can share them
+                tmp_path = f'{target_path}.tmp'
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                os.link(source_path, tmp_path)
+                os.replace(tmp_path, target_path)
+        if has_columnar_copy(svc.upload_folder, source['filename'], source):
+            metadata['columnar_sha256'] = source['sha256']
+        metadata = save_metadata(svc.upload_folder, filename, metadata)
+    svc.upload_catalog.record(metadata)
+    if 'columnar_sha256' not in metadata:
+        schedule_columnar_copy(svc, filename, metadata['sha256'])
+    return dict(upload_response(metadata), deduplicated=True)
+
+@api.route('/api/uploads', methods=['POST'])
+def create_chunked_upload():
+    from serialization import json_response
+
+    svc = get_services()
+    data = request.get_json() or {}
+    filename = data.get('filename')
+    if not is_plain_filename(filename):
+        return jsonify({'error': 'A plain filename is required'}), 400
+
+    sha256 = data.get('sha256')
+    if sha256 and has_blob(svc.upload_folder, sha256):
+        # Content already stored: no parts need to be sent
+        known = find_known_metadata(svc, sha256)
+        if known is not None and known.get('annotations'):
+            previous = svc.upload_catalog.get_sha256(filename)
+            link_blob(svc.upload_folder, sha256, filename)
+            if previous != sha256:
+                release_blob(svc.upload_folder, previous)
+            return json_response(dict(reuse_upload(svc, filename, known), complete=True))
+
+    try:
+        session = svc.chunked_uploads.create(filename, data.get('size'), data.get('part_size'), sha256)
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    return json_response(dict(chunk_session_status(svc, session), complete=False), status=201)
+
+@api.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    from serialization import json_response
+
+    svc = get_services()
+    try:
+        session = svc.chunked_uploads.get(upload_id)
+    except SessionNotFound:
+        return jsonify({'error': 'Upload not found'}), 404
+    return json_response(chunk_session_status(svc, session))
+
+@api.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    try:
+        get_services().chunked_uploads.abort(upload_id)
+    except SessionNotFound:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'success': True, 'message': 'Upload aborted'})
+
+@api.route('/api/uploads/<upload_id>/parts/<int:index>', methods=['PUT'])
+def put_upload_part(upload_id, index):
+    try:
+        session = get_services().chunked_uploads.write_part(upload_id, index, request.get_data(cache=False),
+                                                            request.headers.get('X-Part-SHA256'))
+    except SessionNotFound:
+        return jsonify({'error': 'Upload not found'}), 404
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'part': index,
+        'sha256': session['parts'][str(index)],
+        'received_parts': len(session['parts']),
+        'num_parts': session['num_parts']
+    })
+
+@api.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    svc = get_services()
+    # The slot is taken before the session is closed, so a refused request
+    # can simply be retried
+    parse_ticket = svc.parse_gate.acquire()
+    try:
+        session, staged_path, sha256 = svc.chunked_uploads.finish(upload_id)
+    except SessionNotFound:
+        parse_ticket.release()
+        return jsonify({'error': 'Upload not found'}), 404
+    except UploadConflict as e:
+        parse_ticket.release()
+        return jsonify({'error': str(e)}), 409
+    except UploadError as e:
+        parse_ticket.release()
+        return jsonify({'error': str(e)}), 400
+    if is_feed_upload(session['filename']):
+        # Feed tables are parsed by the process pool, not under this slot
+        parse_ticket.release()
+        return start_feed(svc, session['filename'], staged_path)
+    return finish_upload(svc, session['filename'], staged_path, sha256, wants_async(), parse_ticket)
+
+def chunk_session_status(svc, session):
+    missing = svc.chunked_uploads.missing_parts(session)
+    return {
+        'success': True,
+        'upload_id': session['upload_id'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'part_size': session['part_size'],
+        'num_parts': session['num_parts'],
+        'missing_parts': missing,
+        'received_parts': session['num_parts'] - len(missing)
+    }
+
+def annotate_columns(svc, columns_list, sample_data, inherited=None):
+    """Describe every column with Gemini, reusing cached answers for known schemas
+
+    Columns in ``inherited`` (annotations carried over from a similar upload)
+    are not sent; the result keeps ``columns_list`` order.
+    """
+    inherited = inherited or {}
+    remaining = [col for col in columns_list if col not in inherited]
+    annotations = {}
+    if remaining:
+        with stage('annotate'):
+            annotations = annotate_schema(svc, remaining, sample_data)
+    return {col: inherited[col] if col in inherited else annotations[col] for col in columns_list}
+
+def annotate_schema(svc, columns_list, sample_data):
+    """Split the columns into prompts that fit the token budget and send them concurrently
+
+    Narrow schemas still take a single prompt. Each shard is answered (and
+    cached) on its own, so a failed call or malformed answer only sends that
+    shard's columns to the rule-based fallback.
+    """
+    shards = shard_columns(columns_list, sample_data, svc.prompt_token_budget)
+    if len(shards) <= 1:
+        results = [annotate_shard(svc, shard, sample_data) for shard in shards]
+    else:
+        with ThreadPoolExecutor(max_workers=min(svc.annotation_shard_workers, len(shards))) as executor:
+            results = list(executor.map(lambda shard: annotate_shard(svc, shard, sample_data), shards))
+    annotations = {}
+    for result in results:
+        annotations.update(result)
+    return annotations
+
+def annotate_shard(svc, columns, sample_data):
+    from model_client import ModelUnavailable
+
+    # Each prompt only carries its own columns' sample values
+    shard_sample = [{col: row.get(col) for col in columns} for row in sample_data]
+    cache_key = annotation_key('schema', columns, shard_sample, svc.gemini_model)
+    cached = svc.annotation_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    prompt = build_columns_prompt(columns, format_sample_rows(shard_sample))
+
+    try:
+        with stage('model'):
+            ai_response = svc.gemini_client.generate(prompt)
+    except ModelUnavailable as e:
+        print(f"Error calling Gemini API: {str(e)}")
+        return {col: human_column_description(svc, col) for col in columns}
+
+    try:
+        answer = parse_json_answer(ai_response)
+    except ValueError as e:
+        print(f"JSON parsing error for {len(columns)} columns: {e}")
+        print(f"Response: {ai_response}")
+        # Fallback to human descriptions
+        return {col: human_column_description(svc, col) for col in columns}
+
+    annotations = {}
+    complete = True
+    for col in columns:
+        description = answer.get(col)
+        if isinstance(description, str) and description.strip():
+            annotations[col] = description
+        else:
+            # Only this column falls back; the rest of the shard keeps its answers
+            annotations[col] = human_column_description(svc, col)
+            complete = False
+    # Only complete model answers are cached; fallbacks are retried on the next upload
+    if complete:
+        svc.annotation_cache.put(cache_key, annotations)
+    return annotations
+
+def annotate_upload(svc, filename, columns_list, sample_data, inherited=None):
+    """Background job body: annotate an upload and store the result in its sidecar"""
+    from metadata_store import update_metadata
+    from serialization import clean_nan_values
+
+    annotations = clean_nan_values(annotate_columns(svc, columns_list, sample_data, inherited))
+    update_metadata(svc.upload_folder, filename, annotations=annotations)
+    return annotations
+
+@api.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    from serialization import json_response
+
+    job = get_services().job_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return json_response({'success': True, 'job': job})
+
+@api.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_job(job_id):
+    from serialization import dumps
+
+    job_runner = get_services().job_runner
+    if job_runner.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        status = None
+        while True:
+            job = job_runner.wait(job_id, last_status=status)
+            if job is None:
+                return
+            if job['status'] == status:
+                # Comment line keeps proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            status = job['status']
+            yield f"event: {status}\ndata: {dumps(job).decode('utf-8')}\n\n"
+            if status in ('done', 'failed'):
+                return
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@api.route('/api/get_column_description', methods=['POST'])
+def get_column_description():
+    from model_client import ModelUnavailable
+
+    svc = get_services()
+    data = request.get_json()
+    column_name = data.get('column_name')
+    sample_data = data.get('sample_data', [])
+
+    if not column_name:
+        return jsonify({'error': 'Column name is required'}), 400
+
+    cache_key = annotation_key('column', [column_name], sample_data[:3], svc.gemini_model)
+    cached = svc.annotation_cache.get(cache_key)
+    if cached is not None:
+        return jsonify({'description': cached}), 200
+
+    # Create prompt for single column
+    sample_text = format_sample_rows(sample_data[:3])
+
+    prompt = f"""
+You are a data expert. I have a CSV column named "{column_name}".
+
+Here are a few sample rows from the dataset:
+
+{sample_text}
+
+Please provide a clear, concise description of what this column likely represents or contains.
+Focus on the business meaning and purpose of this data field.
+"""
+
+    try:
+        with svc.annotate_gate.acquire(), stage('model'):
+            description = svc.gemini_client.generate(prompt)
+    except ModelUnavailable:
+        return jsonify({'description': human_column_description(svc, column_name)}), 200
+
+    svc.annotation_cache.put(cache_key, description)
+    return jsonify({'description': description}), 200
+
+@api.route('/api/get_column_descriptions', methods=['POST'])
+def get_column_descriptions():
+    from model_client import ModelUnavailable
+
+    svc = get_services()
+    data = request.get_json()
+    columns = data.get('columns', [])
+    sample_data = data.get('sample_data', [])[:3]
+
+    if not columns or not isinstance(columns, list):
+        return jsonify({'error': 'A list of column names is required'}), 400
+
+    # Columns share the single-column cache entries, so results are interchangeable
+    # with /api/get_column_description
+    columns = list(dict.fromkeys(str(col) for col in columns))
+    descriptions = {}
+    sources = {}
+    uncached = []
+    cache_keys = {}
+    for col in columns:
+        cache_keys[col] = annotation_key('column', [col], sample_data, svc.gemini_model)
+        cached = svc.annotation_cache.get(cache_keys[col])
+        if cached is not None:
+            descriptions[col] = cached
+            sources[col] = 'cache'
+        else:
+            uncached.append(col)
+
+    sample_text = format_sample_rows(sample_data)
+    groups = pack_columns(uncached, sample_text, svc.prompt_token_budget)
+    # One slot covers all of this request's prompts; fully cached requests need none
+    with svc.annotate_gate.acquire() if groups else nullcontext():
+        for group in groups:
+            try:
+                with stage('model'):
+                    answer = parse_json_answer(svc.gemini_client.generate(build_columns_prompt(group, sample_text)))
+            except (ModelUnavailable, ValueError) as e:
+                print(f"Batch description prompt failed for {len(group)} columns: {str(e)}")
+                answer = {}
+            for col in group:
+                description = answer.get(col)
+                if isinstance(description, str) and description.strip():
+                    svc.annotation_cache.put(cache_keys[col], description)
+                    descriptions[col] = description
+                    sources[col] = 'model'
+                else:
+                    # Only this column falls back; the rest of the group keeps its answers
+                    descriptions[col] = human_column_description(svc, col)
+                    sources[col] = 'fallback'
+
+    return jsonify({
+        'success': True,
+        'descriptions': descriptions,
+        'sources': sources
+    }), 200
+
+@api.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    svc = get_services()
+    return jsonify({
+        'success': True,
+        'annotations': svc.annotation_cache.stats(),
+        'gemini': svc.gemini_client.stats()
+    })
+
+@api.route('/api/login', methods=['POST'])
+def login():
+    data = request.get_json()
+    email = data.get('email')
+    password = data.get('password')
+    # Dummy credentials for demonstration
+    if email == 'admin@bfinstitute.org' and password == 'admin123':
+        return jsonify({'success': True, 'message': 'Login successful'}), 200
+    else:
+        return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
+
+# Liveness: answers as soon as the process serves requests and touches nothing else
+@api.route('/api/health', methods=['GET'])
+def health_check():
+    return jsonify({'status': 'healthy', 'message': 'CSV Analyzer Backend is running'})
+
+# Readiness: 503 until this worker has warmed up, and again once it starts draining
+@api.route('/api/ready', methods=['GET'])
+def readiness_check():
+    ready, checks = get_services().readiness()
+    return jsonify({'status': 'ready' if ready else 'not ready', 'checks': checks}), 200 if ready else 503
+
+@api.route('/api/analyze', methods=['POST'])
+def analyze_csv():
+    from columnar import iter_frames
+    from metadata_store import update_metadata
+    from profiler import profile_file
+    from serialization import clean_nan_values, json_response
+
+    svc = get_services()
+    data = request.get_json()
+    filename = data.get('filename')
+
+    if filename:
+        if not is_plain_filename(filename):
+            return jsonify({'error': 'A plain filename is required'}), 400
+        # Profile the stored upload; the result is kept in its metadata sidecar
+        file_path = os.path.join(svc.upload_folder, filename)
+        if not os.path.exists(file_path):
+            return jsonify({'error': 'File not found'}), 404
+        try:
+            metadata = ensure_metadata(svc, filename)
+            profile = metadata.get('profile')
+            if profile is None or data.get('refresh'):
+                with svc.parse_gate.acquire():
+                    chunks = iter_frames(svc.upload_folder, filename, metadata, chunksize=svc.profile_chunk_rows)
+                    profile = clean_nan_values(profile_file(file_path, svc.profile_chunk_rows,
+                                                            svc.profile_workers, chunks,
+                                                            dialect=metadata.get('dialect')))
+                update_metadata(svc.upload_folder, filename, profile=profile)
+        except Overloaded:
+            raise
+        except Exception as e:
+            return jsonify({'error': f'Failed to profile CSV: {str(e)}'}), 500
+
+        return json_response({
+            'success': True,
+            'analysis': dict(profile, filename=filename, message='Analysis completed')
+        })
+
+    csv_data = data.get('csvData', [])
+
+    if not csv_data:
+        return jsonify({'error': 'No CSV data provided'}), 400
+
+    # For now, return basic analysis
+    return jsonify({
+        'success': True,
+        'analysis': {
+            'total_rows': len(csv_data),
+            'total_columns': len(csv_data[0]) if csv_data else 0,
+            'message': 'Analysis completed'
+        }
+    })
+
+@api.route('/api/download', methods=['POST'])
+def download_csv():
+    svc = get_services()
+    data = request.get_json()
+    csv_data = data.get('csvData', [])
+    filename = data.get('filename', 'processed_data.csv')
+
+    if not csv_data:
+        if not is_plain_filename(filename):
+            return jsonify({'error': 'A plain filename is required'}), 400
+        if os.path.exists(os.path.join(svc.upload_folder, filename)):
+            return stream_stored_csv(svc, filename, data)
+        return jsonify({'error': 'No CSV data provided'}), 400
+
+    # Convert to CSV and return as file
+    import io
+    import csv
+
+    output = io.StringIO()
+    if csv_data:
+        writer = csv.DictWriter(output, fieldnames=csv_data[0].keys())
+        writer.writeheader()
+        writer.writerows(csv_data)
+
+    output.seek(0)
+
+    return Response(
+        output.getvalue(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+def stream_stored_csv(svc, filename, data):
+    """Stream a stored upload with the posted edits applied, without buffering it"""
+    from exporter import ExportError, export_stream
+
+    compression = data.get('compression', 'none')
+    transforms = data.get('transforms') or {}
+    download_name = data.get('download_name') or filename
+    try:
+        metadata = ensure_metadata(svc, filename)
+        stream = export_stream(os.path.join(svc.upload_folder, filename), metadata['columns'], transforms,
+                               compression, svc.export_chunk_rows, dialect=metadata.get('dialect'))
+    except ExportError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Failed to export CSV: {str(e)}'}), 500
+
+    mimetype = 'text/csv'
+    if compression == 'gzip':
+        download_name, mimetype = f'{download_name}.gz', 'application/gzip'
+    elif compression == 'zstd':
+        download_name, mimetype = f'{download_name}.zst', 'application/zstd'
+    return Response(
+        stream,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={download_name}'},
+        direct_passthrough=True
+    )
+
+@api.route('/api/validate', methods=['POST'])
+def validate_csv():
+    from serialization import json_response
+    from validator import validate_file
+
+    svc = get_services()
+    data = request.get_json()
+    filename = data.get('filename')
+
+    if filename:
+        if not is_plain_filename(filename):
+            return jsonify({'error': 'A plain filename is required'}), 400
+        # Validate the stored upload in place so the client never re-sends the data
+        file_path = os.path.join(svc.upload_folder, filename)
+        if not os.path.exists(file_path):
+            return jsonify({'error': 'File not found'}), 404
+        key_columns = data.get('key_columns')
+        if key_columns is not None and not isinstance(key_columns, list):
+            return jsonify({'error': 'key_columns must be a list of column names'}), 400
+        try:
+            max_samples = int(data.get('max_samples', 20))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'max_samples must be an integer'}), 400
+        if max_samples < 0:
+            return jsonify({'error': 'max_samples must not be negative'}), 400
+        try:
+            with svc.parse_gate.acquire():
+                dialect = ensure_metadata(svc, filename).get('dialect')
+                validation = validate_file(file_path, key_columns=key_columns,
+                                           max_samples=max_samples, dialect=dialect)
+        except Overloaded:
+            raise
+        except Exception as e:
+            return jsonify({'error': f'Failed to validate CSV: {str(e)}'}), 500
+
+        validation['filename'] = filename
+        validation['message'] = 'Validation completed'
+        return json_response({
+            'success': True,
+            'validation': validation
+        })
+
+    csv_data = data.get('csvData', [])
+
+    if not csv_data:
+        return jsonify({'error': 'No CSV data provided'}), 400
+
+    # Basic validation
+    validation_results = {
+        'has_data': len(csv_data) > 0,
+        'total_rows': len(csv_data),
+        'total_columns': len(csv_data[0]) if csv_data else 0,
+        'message': 'Validation completed'
+    }
+
+    return jsonify({
+        'success': True,
+        'validation': validation_results
+    })
+
+@api.route('/api/verify-token', methods=['POST'])
+def verify_token():
+    data = request.get_json()
+    token = data.get('token')
+
+    if not token:
+        return jsonify({'error': 'Token is required'}), 400
+
+    # For now, just return success
+    return jsonify({
+        'success': True,
+        'user': {
+            'email': 'test@example.com',
+            'name': 'Test User'
+        }
+    })
+
+@api.route('/api/files', methods=['GET'])
+def list_files():
+    from catalog import CatalogError
+    from serialization import json_response
+
+    svc = get_services()
+    limit = request.args.get('limit', 100, type=int)
+    if limit <= 0:
+        return jsonify({'error': 'limit must be positive'}), 400
+    limit = min(limit, svc.max_files_per_page)
+    prefix = request.args.get('prefix') or None
+    try:
+        # Served from the catalog, so the uploads folder is never scanned
+        files, next_cursor = svc.upload_catalog.list(
+            sort=request.args.get('sort', 'filename'),
+            descending=request.args.get('order', 'asc').lower() == 'desc',
+            prefix=prefix,
+            limit=limit,
+            cursor=request.args.get('cursor')
+        )
+        total = svc.upload_catalog.count(prefix)
+    except CatalogError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error listing files: {str(e)}'}), 500
+
+    return json_response({
+        'success': True,
+        'files': files,
+        'total': total,
+        'next_cursor': next_cursor
+    })
+
+@api.route('/api/files/<filename>', methods=['GET'])
+def get_file_info(filename):
+    from columnar import has_columnar_copy
+    from serialization import json_response
+
+    if not is_plain_filename(filename):
+        return jsonify({'error': 'A plain filename is required'}), 400
+    svc = get_services()
+    try:
+        file_path = os.path.join(svc.upload_folder, filename)
+
+        if not os.path.exists(file_path):
+            return jsonify({'error': 'File not found'}), 404
+
+        metadata = ensure_metadata(svc, filename)
+
+        info = {
+            'filename': filename,
+            'size': metadata['size'],
+            'uploaded_at': metadata['mtime'],
+            'total_rows': metadata['num_rows'],
+            'total_columns': metadata['num_columns'],
+            'columns': metadata['columns'],
+            'sample': metadata['sample'],
+            'annotations': metadata.get('annotations', {}),
+            'columnar': has_columnar_copy(svc.upload_folder, filename, metadata)
+        }
+
+        return json_response({
+            'success': True,
+            'file_info': info
+        })
+    except Exception as e:
+        return jsonify({'error': f'Error getting file info: {str(e)}'}), 500
+
+@api.route('/api/files/<filename>', methods=['DELETE'])
+def delete_file(filename):
+    from columnar import columnar_path
+    from metadata_store import delete_metadata
+    from metadata_store import update_lock as metadata_update_lock
+    from rollups import rollups_path
+    from spatial import spatial_path
+
+    if not is_plain_filename(filename):
+        return jsonify({'error': 'A plain filename is required'}), 400
+    svc = get_services()
+    file_path = os.path.join(svc.upload_folder, filename)
+    sha256 = svc.upload_catalog.get_sha256(filename)
+    in_catalog = svc.upload_catalog.remove(filename)
+    if not os.path.isfile(file_path):
+        if in_catalog:
+            # The file had already been removed by hand; the stale entry is gone now
+            return jsonify({'success': True, 'message': 'File deleted'})
+        return jsonify({'error': 'File not found'}), 404
+
+    try:
+        with metadata_update_lock:
+            os.remove(file_path)
+            delete_metadata(svc.upload_folder, filename)
+            for path_of in (columnar_path, rollups_path, spatial_path):
+                path = path_of(svc.upload_folder, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+        svc.rollup_cache.discard(filename)
+        svc.spatial_cache.discard(filename)
+        # The stored content goes too once no other filename refers to it
+        release_blob(svc.upload_folder, sha256)
+    except OSError as e:
+        return jsonify({'error': f'Error deleting file: {str(e)}'}), 500
+
+    return jsonify({'success': True, 'message': 'File deleted'})
+
+@api.route('/api/files/<filename>/rows', methods=['GET'])
+def get_file_rows(filename):
+    from csv_ingest import read_rows, summarize_csv
+    from metadata_store import load_row_index, save_metadata
+    from serialization import frame_records, json_response
+
+    if not is_plain_filename(filename):
+        return jsonify({'error': 'A plain filename is required'}), 400
+    svc = get_services()
+    file_path = os.path.join(svc.upload_folder, filename)
+    if not os.path.exists(file_path):
+        return jsonify({'error': 'File not found'}), 404
+
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', 100, type=int)
+    if offset < 0 or limit < 0:
+        return jsonify({'error': 'offset and limit must be non-negative'}), 400
+    limit = min(limit, svc.max_rows_per_page)
+
+    try:
+        metadata = ensure_metadata(svc, filename)
+        checkpoints = load_row_index(svc.upload_folder, filename)
+        if checkpoints is None or 'row_index_every' not in metadata:
+            # Sidecars written before the row index existed
+            rebuilt = build_file_metadata(svc, filename, summarize_csv(file_path), metadata['sample'])
+            metadata = save_metadata(svc.upload_folder, filename, {
+                **rebuilt, **metadata, 'row_index_every': rebuilt['row_index_every']
+            })
+            checkpoints = load_row_index(svc.upload_folder, filename)
+
+        window = read_rows(file_path, metadata['columns'], checkpoints,
+                           metadata['row_index_every'], offset, limit, dialect=metadata.get('dialect'))
+        rows = frame_records(window)
+    except Exception as e:
+        return jsonify({'error': f'Error reading rows: {str(e)}'}), 500
+
+    return json_response({
+        'success': True,
+        'filename': filename,
+        'offset': offset,
+        'limit': limit,
+        'total_rows': metadata['num_rows'],
+        'columns': metadata['columns'],
+        'rows': rows
+    })
+
+@api.route('/api/files/<filename>/rollups', methods=['GET'])
+def get_file_rollups(filename):
+    from rollups import GRAINS, query_rollups
+    from serialization import frame_records, json_response
+
+    if not is_plain_filename(filename):
+        return jsonify({'error': 'A plain filename is required'}), 400
+    svc = get_services()
+    if not os.path.exists(os.path.join(svc.upload_folder, filename)):
+        return jsonify({'error': 'File not found'}), 404
+    try:
+        metadata = ensure_metadata(svc, filename)
+        cached = svc.rollup_cache.get(svc.upload_folder, filename, metadata['sha256'])
+    except Exception as e:
+        return jsonify({'error': f'Error reading rollups: {str(e)}'}), 500
+    if cached is None:
+        # Built after upload; files from before rollups existed get theirs now
+        job_id = schedule_rollups(svc, filename, metadata['sha256'])
+        return json_response({
+            'success': True,
+            'status': 'pending',
+            'message': 'Rollups are being built',
+            'job': {'id': job_id, 'status_url': f'/api/jobs/{job_id}'}
+        }, status=202)
+
+    rollups, cells = cached
+    plan = rollups['plan']
+    time_column = request.args.get('column') or (plan['time_columns'][0] if plan['time_columns'] else None)
+    grain = request.args.get('grain', 'month')
+    category_column = request.args.get('category', '')
+    if time_column is not None and time_column not in plan['time_columns']:
+        return jsonify({'error': f"No rollups for column '{time_column}'; date columns: {plan['time_columns']}"}), 400
+    if grain not in GRAINS:
+        return jsonify({'error': f'grain must be one of {list(GRAINS)}'}), 400
+    if category_column and category_column not in plan['category_columns']:
+        return jsonify({'error': f"Not a category column: '{category_column}'; "
+                                 f"category columns: {plan['category_columns']}"}), 400
+    categories = [value for value in request.args.get('values', '').split(',') if value]
+
+    rows = []
+    if time_column is not None:
+        rows = frame_records(query_rollups(cells, time_column, grain, category_column, categories,
+                                           request.args.get('start'), request.args.get('end')))
+    return json_response({
+        'success': True,
+        'filename': filename,
+        'time_column': time_column,
+        'grain': grain,
+        'category_column': category_column or None,
+        'available': dict(plan, grains=list(GRAINS)),
+        'incremental': rollups['incremental'],
+        'rows': rows
+    })
+
+def spatial_index_or_pending(svc, filename):
+    """Return (index, None), or (None, response) for a bad name, a missing file or an index being built"""
+    from serialization import json_response
+
+    if not is_plain_filename(filename):
+        return None, (jsonify({'error': 'A plain filename is required'}), 400)
+    if not os.path.exists(os.path.join(svc.upload_folder, filename)):
+        return None, (jsonify({'error': 'File not found'}), 404)
+    try:
+        metadata = ensure_metadata(svc, filename)
+        index = svc.spatial_cache.get(svc.upload_folder, filename, metadata['sha256'])
+    except Exception as e:
+        return None, (jsonify({'error': f'Error reading spatial index: {str(e)}'}), 500)
+    if index is None:
+        # Built after upload; files from before the index existed get theirs now
+        job_id = schedule_spatial_index(svc, filename, metadata['sha256'])
+        return None, json_response({
+            'success': True,
+            'status': 'pending',
+            'message': 'Spatial index is being built',
+            'job': {'id': job_id, 'status_url': f'/api/jobs/{job_id}'}
+        }, status=202)
+    return index, None
+
+@api.route('/api/files/<filename>/spatial', methods=['GET'])
+def get_spatial_summary(filename):
+    from serialization import json_response
+    from spatial import SpatialQueryError, parse_bbox
+
+    svc = get_services()
+    index, response = spatial_index_or_pending(svc, filename)
+    if response is not None:
+        return response
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+        count = index.count(bbox) if bbox is not None else None
+    except SpatialQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    return json_response({
+        'success': True,
+        'filename': filename,
+        'coordinates': index.plan['coordinates'],
+        'district_column': index.plan['district'],
+        'rows': index.rows,
+        'located': index.located,
+        'bounds': index.bounds(),
+        'bbox': bbox,
+        'count': count
+    })
+
+@api.route('/api/files/<filename>/spatial/districts', methods=['GET'])
+def get_spatial_districts(filename):
+    from serialization import json_response
+    from spatial import SpatialQueryError, parse_bbox
+
+    svc = get_services()
+    index, response = spatial_index_or_pending(svc, filename)
+    if response is not None:
+        return response
+    if not index.plan['district']:
+        return jsonify({'error': 'The file has no district column'}), 400
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+        districts = index.districts(bbox)
+    except SpatialQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    return json_response({
+        'success': True,
+        'filename': filename,
+        'district_column': index.plan['district'],
+        'bbox': bbox,
+        'districts': districts
+    })
+
+@api.route('/api/files/<filename>/spatial/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_spatial_tile(filename, z, x, y):
+    from serialization import json_response
+    from spatial import MAX_TILE_BINS, TILE_BINS, SpatialQueryError
+
+    svc = get_services()
+    index, response = spatial_index_or_pending(svc, filename)
+    if response is not None:
+        return response
+    if not index.plan['coordinates']:
+        return jsonify({'error': 'The file has no coordinate columns'}), 400
+    bins = request.args.get('bins', TILE_BINS, type=int)
+    if not 1 <= bins <= MAX_TILE_BINS:
+        return jsonify({'error': f'bins must be between 1 and {MAX_TILE_BINS}'}), 400
+    try:
+        tile = index.tile(z, x, y, bins)
+    except SpatialQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    return json_response(dict(tile, success=True, filename=filename))
+
+@api.route('/api/feedback', methods=['POST'])
+def submit_feedback():
+    data = request.get_json()
+
+    # For now, just log and return success
+    print("Feedback received:", data)
+
+    return jsonify({
+        'success': True,
+        'message': 'Feedback submitted successfully'
+    })
+
+def build_file_metadata(svc, filename, ingest, sample_data):
+    """Collect the per-file fields kept in the sidecar metadata store and write the row index"""
+    from metadata_store import save_row_index
+
+    save_row_index(svc.upload_folder, filename, ingest['checkpoints'])
+    return {
+        'filename': filename,
+        'sha256': ingest['sha256'],
+        'num_rows': ingest['num_rows'],
+        'num_columns': len(ingest['columns']),
+        'columns': ingest['columns'],
+        'sample': sample_data,
+        'row_index_every': ingest['checkpoint_every'],
+        'dialect': ingest['dialect'],
+        'annotations': {}
+    }
+
+def inherit_from_similar(svc, metadata):
+    """Carry over what is known about unchanged columns from the most similar catalogued schema
+
+    Returns the inherited annotations. Columns whose values the sniff could not
+    type take the matched column's type hint, and ``metadata`` records the
+    match under ``schema_match``. Renamed, retyped and new columns inherit
+    nothing, and neither do rule-based fallback descriptions, so the model
+    answers those.
+    """
+    from metadata_store import read_metadata
+    from schema_index import match_columns, metadata_signatures
+
+    signatures = metadata_signatures(metadata)
+    match = svc.upload_catalog.schemas.nearest(signatures, min_similarity=svc.schema_match_similarity)
+    if match is None:
+        return {}
+    # A file re-uploaded under its own name is matched before its old sidecar is replaced
+    source = read_metadata(svc.upload_folder, match['filename'])
+    if source is None or source.get('sha256') != match['sha256']:
+        return {}
+
+    column_types = metadata['dialect']['column_types']
+    source_annotations = source.get('annotations') or {}
+    inherited = {}
+    for col, source_col in match_columns(signatures, match['columns']).items():
+        kind = match['columns'][source_col]['kind']
+        if column_types.get(col) == 'empty' and kind != 'empty':
+            column_types[col] = kind
+        description = source_annotations.get(source_col)
+        if isinstance(description, str) and description.strip() and description != svc.column_rules.describe(source_col):
+            inherited[col] = description
+    metadata['schema_match'] = {
+        'filename': match['filename'],
+        'similarity': round(match['similarity'], 3),
+        'inherited': [col for col in metadata['columns'] if col in inherited],
+        'annotated': [col for col in metadata['columns'] if col not in inherited]
+    }
+    return inherited
+
+def schedule_columnar_copy(svc, filename, sha256):
+    """Queue conversion of an upload to its Arrow shadow copy, if pyarrow is installed"""
+    from columnar import columnar_available
+
+    if columnar_available():
+        svc.job_runner.submit('columnar', build_columnar_copy, svc, filename, sha256)
+
+def build_columnar_copy(svc, filename, sha256):
+    """Background job body: write the shadow copy and record which content it reflects"""
+    from columnar import columnar_path, convert_to_columnar
+    from metadata_store import load_metadata, save_metadata
+    from metadata_store import update_lock as metadata_update_lock
+
+    metadata = load_metadata(svc.upload_folder, filename)
+    convert_to_columnar(os.path.join(svc.upload_folder, filename), columnar_path(svc.upload_folder, filename),
+                        dialect=metadata and metadata.get('dialect'))
+    with metadata_update_lock:
+        metadata = load_metadata(svc.upload_folder, filename)
+        # Skip if the file was replaced while converting
+        if metadata is not None and metadata['sha256'] == sha256:
+            metadata['columnar_sha256'] = sha256
+            save_metadata(svc.upload_folder, filename, metadata)
+        elif not os.path.exists(os.path.join(svc.upload_folder, filename)):
+            # Deleted while converting
+            os.remove(columnar_path(svc.upload_folder, filename))
+    return {'filename': filename, 'sha256': sha256}
+
+def schedule_derived(svc, kind, build, filename, sha256):
+    """Queue ``build(svc, filename, sha256)`` unless a ``kind`` job for this content is already pending"""
+    pending = svc.derived_jobs.get((kind, filename))
+    if pending is not None and pending['sha256'] == sha256:
+        job = svc.job_runner.get(pending['id'])
+        if job is not None and job['status'] in ('queued', 'running'):
+            return pending['id']
+    job_id = svc.job_runner.submit(kind, build, svc, filename, sha256)
+    svc.derived_jobs[kind, filename] = {'id': job_id, 'sha256': sha256}
+    return job_id
+
+def schedule_rollups(svc, filename, sha256):
+    """Queue a rollup build for an upload unless one for this content is already pending"""
+    return schedule_derived(svc, 'rollups', build_file_rollups, filename, sha256)
+
+def build_file_rollups(svc, filename, sha256):
+    """Background job body: build an upload's rollups, extending the old ones if rows were only appended"""
+    from metadata_store import load_metadata
+    from metadata_store import update_lock as metadata_update_lock
+    from rollups import build_rollups, load_rollups, save_rollups
+
+    metadata = load_metadata(svc.upload_folder, filename)
+    if metadata is None or metadata['sha256'] != sha256:
+        # Replaced or deleted before the job ran
+        return None
+    previous = load_rollups(svc.upload_folder, filename)
+    if previous is not None and previous['sha256'] == sha256:
+        return {'filename': filename, 'sha256': sha256, 'incremental': previous['incremental']}
+    rollups = build_rollups(os.path.join(svc.upload_folder, filename), metadata, previous, svc.profile_chunk_rows)
+    with metadata_update_lock:
+        metadata = load_metadata(svc.upload_folder, filename)
+        if metadata is None or metadata['sha256'] != sha256:
+            return None
+        save_rollups(svc.upload_folder, filename, rollups)
+    return {'filename': filename, 'sha256': sha256, 'incremental': rollups['incremental']}
+
+def schedule_spatial_index(svc, filename, sha256):
+    """Queue a spatial index build for an upload unless one for this content is already pending"""
+    return schedule_derived(svc, 'spatial', build_file_spatial_index, filename, sha256)
+
+def build_file_spatial_index(svc, filename, sha256):
+    """Background job body: parse an upload's coordinates and districts into its grid index"""
+    from metadata_store import load_metadata
+    from metadata_store import update_lock as metadata_update_lock
+    from spatial import build_spatial_index, save_spatial_index
+
+    metadata = load_metadata(svc.upload_folder, filename)
+    if metadata is None or metadata['sha256'] != sha256:
+        # Replaced or deleted before the job ran
+        return None
+    arrays = build_spatial_index(os.path.join(svc.upload_folder, filename), metadata, svc.profile_chunk_rows)
+    with metadata_update_lock:
+        metadata = load_metadata(svc.upload_folder, filename)
+        if metadata is None or metadata['sha256'] != sha256:
+            return None
+        save_spatial_index(svc.upload_folder, filename, arrays)
+    return {'filename': filename, 'sha256': sha256, 'located': len(arrays['x'])}
+
+def ensure_metadata(svc, filename):
+    """Return the sidecar metadata for an uploaded file, rebuilding it if missing or stale"""
+    from csv_ingest import summarize_csv
+    from metadata_store import load_metadata, save_metadata
+    from serialization import clean_nan_values, frame_records
+
+    metadata = load_metadata(svc.upload_folder, filename)
+    if metadata is None:
+        # Files uploaded before the metadata store existed, or changed on disk
+        ingest = summarize_csv(os.path.join(svc.upload_folder, filename))
+        metadata = build_file_metadata(svc, filename, ingest, frame_records(ingest['sample']))
+        metadata = save_metadata(svc.upload_folder, filename, clean_nan_values(metadata))
+        svc.upload_catalog.record(metadata)
+        schedule_columnar_copy(svc, filename, metadata['sha256'])
+        schedule_rollups(svc, filename, metadata['sha256'])
+        schedule_spatial_index(svc, filename, metadata['sha256'])
+    return metadata
+
+# Rule-based fallback descriptions, driven by column_rules.json plus any city
+# vocabularies dropped into COLUMN_RULES_DIR
+
+def human_column_description(svc, col):
+    fallback_descriptions.inc()
+    return svc.column_rules.describe(col)
@@ -0,0 +1,207 @@
+"""
+Schema similarity index over the upload catalog
+
+Recurring datasets arrive as monthly snapshots whose columns drift a little
+(one added, one renamed). Each upload's schema is fingerprinted from its
+normalized column names and a signature of each column's values (sniffed
+type plus the shapes of the sampled values, e.g. ``9999-99-99``). The
+fingerprint is summarized with MinHash and filed under LSH band buckets in
+the catalog's SQLite database, so the nearest stored schema is found by
+looking up a handful of buckets, not by comparing against every upload.
+Columns that match by name and signature can then inherit what was learned
+about them, such as their annotations.
+"""
+
+import hashlib
+import json
+import random
+import re
+
+import numpy as np
+
+NUM_PERMUTATIONS = 64
+ROWS_PER_BAND = 4
+# Two schemas share a bucket with good odds from about this Jaccard similarity
+MIN_SIMILARITY = 0.5
+# Candidates ranked by MinHash agreement before exact similarity picks one
+MAX_CANDIDATES = 20
+MAX_SHAPES = 5
+MAX_SHAPE_CHARS = 24
+# Mersenne prime 2**31 - 1: (a * h + b) stays below 2**64 for 32-bit feature hashes
+PRIME = (1 << 31) - 1
+
+_permutations = random.Random(20240601)
+HASH_A = np.array([_permutations.randrange(1, PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+HASH_B = np.array([_permutations.randrange(0, PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+
+
+def normalize_name(name):
+    """``LastEditedDate``, ``last_edited_date`` and ``Last Edited Date`` all become ``last_edited_date``"""
+    spaced = re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', str(name))
+    return '_'.join(token for token in re.split(r'[^a-z0-9]+', spaced.lower()) if token)
+
+
+def value_shape(value):
+    """Digits become 9 and words (with the spaces between them) a, so ``2023-01-05`` is ``9-9-9``"""
+    text = re.sub(r'[A-Za-z]+(?:\s+[A-Za-z]+)*', 'a', str(value).strip())
+    return re.sub(r'\d+', '9', text)[:MAX_SHAPE_CHARS]
+
+
+def column_signatures(columns, sample, column_types):
+    """Per-column fingerprint parts: normalized name, sniffed kind and the shapes of sampled values"""
+    signatures = {}
+    for col in columns:
+        shapes = set()
+        for row in sample:
+            value = row.get(col)
+            if value is not None and str(value).strip() != '':
+                shapes.add(value_shape(value))
+        signatures[str(col)] = {
+            'name': normalize_name(col),
+            'kind': column_types.get(str(col), 'empty'),
+            'shapes': sorted(shapes)[:MAX_SHAPES]
+        }
+    return signatures
+
+
+def metadata_signatures(metadata):
+    return column_signatures(metadata['columns'], metadata.get('sample') or [],
+                             (metadata.get('dialect') or {}).get('column_types') or {})
+
+
+def schema_features(signatures):
+    """The set MinHash summarizes: every column's name, and its name with its value signature"""
+    features = set()
+    for signature in signatures.values():
+        features.add(f"name:{signature['name']}")
+        features.add(f"column:{signature['name']}:{signature['kind']}:{'|'.join(signature['shapes'])}")
+    return features
+
+
+def minhash(features):
+    hashes = np.array([int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=4).digest(), 'big')
+                       for feature in features] or [0], dtype=np.uint64)
+    return ((np.outer(HASH_A, hashes) + HASH_B[:, None]) % PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_buckets(signature):
+    """One (band, bucket) pair per band of ``ROWS_PER_BAND`` MinHash values"""
+    buckets = []
+    for band in range(NUM_PERMUTATIONS // ROWS_PER_BAND):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+        # SQLite integers are signed 64-bit
+        buckets.append((band, int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), 'big') >> 1))
+    return buckets
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def compatible(new, old):
+    """Same kind of values (or no sampled values on one side); text must also share a value shape"""
+    if 'empty' in (new['kind'], old['kind']):
+        return True
+    if new['kind'] != old['kind']:
+        return False
+    return new['kind'] != 'string' or not new['shapes'] or not old['shapes'] or bool(set(new['shapes']) & set(old['shapes']))
+
+
+def match_columns(new, old):
+    """Map each new column to the old column it continues: same name (exact, else normalized) and compatible values
+
+    Renamed columns and columns whose values changed kind are left out, so
+    they are treated as new.
+    """
+    by_name = {}
+    for col, signature in old.items():
+        by_name.setdefault(signature['name'], col)
+    matches = {}
+    for col, signature in new.items():
+        old_col = col if col in old else by_name.get(signature['name'])
+        if old_col is not None and compatible(signature, old[old_col]):
+            matches[col] = old_col
+    return matches
+
+
+class SchemaIndex:
+    """MinHash fingerprints and LSH buckets of catalogued schemas, kept in the catalog's database"""
+
+    def __init__(self, db, lock):
+        self.db = db
+        self.lock = lock
+        with self.lock:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS schema_fingerprints ('
+                'filename TEXT PRIMARY KEY, minhash BLOB NOT NULL, columns TEXT NOT NULL)'
+            )
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS schema_buckets ('
+                'band INTEGER NOT NULL, bucket INTEGER NOT NULL, filename TEXT NOT NULL)'
+            )
+            self.db.execute('CREATE INDEX IF NOT EXISTS schema_buckets_bucket ON schema_buckets (band, bucket)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS schema_buckets_filename ON schema_buckets (filename)')
+            self.db.commit()
+
+    def add(self, filename, signatures):
+        """File (or refile) a schema under its buckets"""
+        signature = minhash(schema_features(signatures))
+        with self.lock:
+            self.db.execute('DELETE FROM schema_buckets WHERE filename = ?', (filename,))
+            self.db.execute(
+                'INSERT OR REPLACE INTO schema_fingerprints (filename, minhash, columns) VALUES (?, ?, ?)',
+                (filename, signature.tobytes(), json.dumps(signatures, separators=(',', ':')))
+            )
+            self.db.executemany(
+                'INSERT INTO schema_buckets (band, bucket, filename) VALUES (?, ?, ?)',
+                [(band, bucket, filename) for band, bucket in band_buckets(signature)]
+            )
+            self.db.commit()
+
+    def remove(self, filenames):
+        with self.lock:
+            for table in ('schema_buckets', 'schema_fingerprints'):
+                self.db.executemany(f'DELETE FROM {table} WHERE filename = ?', [(name,) for name in filenames])
+            self.db.commit()
+
+    def missing(self):
+        """Catalogued filenames with no fingerprint, such as uploads from before the index existed"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT filename FROM uploads WHERE filename NOT IN (SELECT filename FROM schema_fingerprints)'
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def nearest(self, signatures, exclude=(), min_similarity=MIN_SIMILARITY):
+        """Return the most similar stored schema as {filename, sha256, similarity, columns}, or None
+
+        Candidates share at least one LSH bucket; the few with the most MinHash
+        agreement are compared exactly, and ties go to the newest upload.
+        """
+        features = schema_features(signatures)
+        signature = minhash(features)
+        buckets = band_buckets(signature)
+        condition = ' OR '.join(['(b.band = ? AND b.bucket = ?)'] * len(buckets))
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT f.filename, f.minhash, f.columns, u.mtime, u.sha256 FROM schema_fingerprints f '
+                'JOIN uploads u ON u.filename = f.filename '
+                f'WHERE f.filename IN (SELECT b.filename FROM schema_buckets b WHERE {condition})',
+                [value for bucket in buckets for value in bucket]
+            ).fetchall()
+        rows = [row for row in rows if row[0] not in exclude]
+        if not rows:
+            return None
+        agreement = [float(np.mean(np.frombuffer(row[1], dtype=np.uint32) == signature)) for row in rows]
+        ranked = sorted(zip(agreement, rows), key=lambda item: (item[0], item[1][3]), reverse=True)[:MAX_CANDIDATES]
+        best = None
+        for _, (filename, _, columns, mtime, sha256) in ranked:
+            columns = json.loads(columns)
+            similarity = jaccard(features, schema_features(columns))
+            if best is None or (similarity, mtime) > (best['similarity'], best['mtime']):
+                best = {'filename': filename, 'sha256': sha256, 'similarity': similarity, 'columns': columns,
+                        'mtime': mtime}
+        if best is None or best['similarity'] < min_similarity:
+            return None
+        del best['mtime']
+        return best
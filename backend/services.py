@@ -0,0 +1,342 @@
+"""
+Per-process services shared by every request
+
+Settings are read from the environment when the app is created, which is
+cheap. Components that open files, connections or thread pools (model
+client, annotation cache, upload catalog, job pool) are built on first use in
+the process that uses them, so pre-forked workers never share a SQLite handle
+or a socket inherited across a fork. ``warm_up()`` imports the data libraries
+and builds every component once per worker, ahead of the first request.
+"""
+
+import importlib
+import os
+import threading
+
+from metrics import RequestProfiler
+
+# Modules that import pandas, numpy or requests, loaded by warm_up()
+HEAVY_MODULES = ('csv_ingest', 'metadata_store', 'serialization', 'columnar', 'catalog',
+                 'schema_index', 'profiler', 'validator', 'exporter', 'gtfs', 'rollups', 'spatial',
+                 'model_client')
+
+CIRCUIT_STATES = {'closed': 0, 'half-open': 1, 'open': 2}
+
+
+class Services:
+    """Settings plus lazily built components for one app in one process"""
+
+    def __init__(self, overrides=None):
+        self.overrides = dict(overrides or {})
+        self.upload_folder = self.setting('UPLOAD_FOLDER', os.path.join(os.path.dirname(__file__), 'uploads'))
+        os.makedirs(self.upload_folder, exist_ok=True)
+
+        # Gemini API Configuration
+        self.gemini_api_key = self.setting('GOOGLE_API_KEY', '')
+        self.gemini_model = self.setting('GEMINI_MODEL', 'gemini-2.0-flash-exp')
+
+        # Column profiling reads stored files in chunks of this many rows
+        self.profile_chunk_rows = int(self.setting('PROFILE_CHUNK_ROWS', '100000'))
+        self.profile_workers = int(self.setting('PROFILE_WORKERS', str(os.cpu_count() or 1)))
+        # Largest request body; a single part of a chunked upload counts as one request
+        self.max_content_length = int(self.setting('MAX_CONTENT_LENGTH', str(16 * 1024 * 1024)))
+        # Largest file accepted through chunked uploads
+        self.max_upload_size = int(self.setting('MAX_UPLOAD_SIZE', str(1024 * 1024 * 1024)))
+        # Largest row window served by /api/files/<filename>/rows
+        self.max_rows_per_page = int(self.setting('MAX_ROWS_PER_PAGE', '1000'))
+        # Largest page served by /api/files
+        self.max_files_per_page = int(self.setting('MAX_FILES_PER_PAGE', '1000'))
+        # Streaming downloads read and write this many rows at a time
+        self.export_chunk_rows = int(self.setting('EXPORT_CHUNK_ROWS', '50000'))
+        # Upper bound on prompt plus expected answer size when packing columns into prompts
+        self.prompt_token_budget = int(self.setting('ANNOTATION_PROMPT_TOKENS', '8000'))
+        # Upload annotation prompts sent at once for one wide schema
+        self.annotation_shard_workers = int(self.setting('ANNOTATION_SHARD_WORKERS', '4'))
+        # Schemas at least this similar to a catalogued one inherit its unchanged columns' annotations
+        self.schema_match_similarity = float(self.setting('SCHEMA_MATCH_SIMILARITY', '0.5'))
+        # Processes parsing GTFS feed tables; a large table is split across all of them
+        self.feed_workers = int(self.setting('FEED_WORKERS', str(os.cpu_count() or 1)))
+
+        # Profile a random share of requests with cProfile; 0 disables it
+        self.request_profiler = RequestProfiler(
+            float(self.setting('REQUEST_PROFILE_SAMPLE_RATE', '0')),
+            self.setting('REQUEST_PROFILE_DIR', os.path.join(self.upload_folder, '.profiles'))
+        )
+
+        # Latest job per (kind, filename) building a derived sidecar, so repeated requests share one
+        self.derived_jobs = {}
+
+        self.ready = threading.Event()
+        self.draining = False
+        self.warm_up_error = None
+        self._reset()
+
+    def setting(self, name, default):
+        return str(self.overrides[name]) if name in self.overrides else os.getenv(name, default)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+        self._components = {}
+
+    def _component(self, name, build):
+        if self._pid != os.getpid():
+            # Forked after components were built (e.g. a preloaded app): the
+            # child builds its own instead of sharing handles with the parent
+            self._reset()
+            self.ready.clear()
+        component = self._components.get(name)
+        if component is None:
+            with self._lock:
+                component = self._components.get(name)
+                if component is None:
+                    component = self._components[name] = build()
+        return component
+
+    def _built(self, name):
+        """Return a component only if this process has already built it"""
+        return self._components.get(name) if self._pid == os.getpid() else None
+
+    @property
+    def gemini_client(self):
+        # One pooled, rate-limited client per process; every model call goes through it
+        def build():
+            from model_client import GEMINI_BASE_URL, GeminiClient
+            return GeminiClient(
+                self.gemini_api_key,
+                self.gemini_model,
+                base_url=self.setting('GEMINI_BASE_URL', GEMINI_BASE_URL),
+                timeout=float(self.setting('GEMINI_TIMEOUT', '30')),
+                pool_size=int(self.setting('GEMINI_POOL_SIZE', '10')),
+                max_concurrency=int(self.setting('GEMINI_MAX_CONCURRENCY', '4')),
+                max_retries=int(self.setting('GEMINI_MAX_RETRIES', '3')),
+                rate_limit=float(self.setting('GEMINI_RATE_LIMIT', '5')),
+                burst=int(self.setting('GEMINI_RATE_BURST', '10')),
+                failure_threshold=int(self.setting('GEMINI_BREAKER_THRESHOLD', '5')),
+                reset_timeout=float(self.setting('GEMINI_BREAKER_RESET', '30'))
+            )
+        return self._component('gemini_client', build)
+
+    @property
+    def rollup_cache(self):
+        # Decoded rollups of the most recently queried files, so a query does not re-read its sidecar
+        def build():
+            from metadata_store import SidecarCache
+            from rollups import load_rollup_cells
+            return SidecarCache(load_rollup_cells, int(self.setting('ROLLUP_CACHE_FILES', '8')))
+        return self._component('rollup_cache', build)
+
+    @property
+    def spatial_cache(self):
+        # Loaded grid indexes of the most recently queried files
+        def build():
+            from metadata_store import SidecarCache
+            from spatial import load_spatial_index
+            return SidecarCache(load_spatial_index, int(self.setting('SPATIAL_CACHE_FILES', '8')))
+        return self._component('spatial_cache', build)
+
+    @property
+    def upload_catalog(self):
+        # Index of stored uploads behind /api/files; filled from the folder on first use
+        def build():
+            from catalog import UploadCatalog
+            from metadata_store import META_DIRNAME
+            catalog = UploadCatalog(self.setting(
+                'UPLOAD_CATALOG_PATH', os.path.join(self.upload_folder, META_DIRNAME, 'catalog.sqlite3')))
+            if catalog.is_empty():
+                catalog.sync(self.upload_folder)
+            else:
+                catalog.index_schemas(self.upload_folder)
+            return catalog
+        return self._component('upload_catalog', build)
+
+    @property
+    def chunked_uploads(self):
+        # Resumable uploads: sessions and their staging files live next to the blobs
+        def build():
+            from chunked_uploads import ChunkedUploads
+            return ChunkedUploads(
+                self.upload_folder,
+                default_part_size=int(self.setting('UPLOAD_PART_SIZE', str(8 * 1024 * 1024))),
+                ttl_seconds=int(self.setting('UPLOAD_SESSION_TTL', str(24 * 3600))),
+                max_part_size=self.max_content_length,
+                max_size=self.max_upload_size
+            )
+        return self._component('chunked_uploads', build)
+
+    @property
+    def column_rules(self):
+        # Compiled once; lookups are memoized per column name
+        def build():
+            from column_rules import load_rule_engine
+            return load_rule_engine(self.setting('COLUMN_RULES_DIR', None))
+        return self._component('column_rules', build)
+
+    @property
+    def parse_gate(self):
+        # Parsing, profiling and validating hold a file's chunks in memory;
+        # this bounds how many run at once in this worker
+        def build():
+            from admission import AdmissionGate
+            return AdmissionGate(
+                'parse',
+                max_concurrent=int(self.setting('PARSE_CONCURRENCY', '2')),
+                max_queue=int(self.setting('PARSE_QUEUE', '8')),
+                queue_timeout=float(self.setting('ADMISSION_QUEUE_TIMEOUT', '10'))
+            )
+        return self._component('parse_gate', build)
+
+    @property
+    def annotate_gate(self):
+        # Requests waiting on the model; each holds a thread for the call's duration
+        def build():
+            from admission import AdmissionGate
+            return AdmissionGate(
+                'annotate',
+                max_concurrent=int(self.setting('ANNOTATE_CONCURRENCY', '4')),
+                max_queue=int(self.setting('ANNOTATE_QUEUE', '16')),
+                queue_timeout=float(self.setting('ADMISSION_QUEUE_TIMEOUT', '10'))
+            )
+        return self._component('annotate_gate', build)
+
+    @property
+    def annotation_cache(self):
+        # Model answers keyed on (columns, sample values, model), in memory and on disk
+        def build():
+            from annotation_cache import AnnotationCache
+            return AnnotationCache(
+                self.setting('ANNOTATION_CACHE_PATH',
+                             os.path.join(self.upload_folder, '.cache', 'annotations.sqlite3')),
+                max_entries=int(self.setting('ANNOTATION_CACHE_SIZE', '1024')),
+                ttl_seconds=int(self.setting('ANNOTATION_CACHE_TTL', str(7 * 24 * 3600)))
+            )
+        return self._component('annotation_cache', build)
+
+    @property
+    def job_runner(self):
+        # Bounded pool for work that runs after the response is sent; status is shared with other workers
+        def build():
+            from jobs import JobRunner
+            from metadata_store import META_DIRNAME
+            return JobRunner(
+                max_workers=int(self.setting('ANNOTATION_WORKERS', '4')),
+                db_path=self.setting('JOB_STORE_PATH', os.path.join(self.upload_folder, META_DIRNAME, 'jobs.sqlite3'))
+            )
+        return self._component('job_runner', build)
+
+    @property
+    def process_pool(self):
+        # CPU-bound feed parsing; only built once a feed is uploaded. Workers
+        # are spawned rather than forked, so they copy none of this process's
+        # threads or open handles
+        def build():
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            return ProcessPoolExecutor(max_workers=self.feed_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._component('process_pool', build)
+
+    def warm_up(self):
+        """Import the data libraries and build every component, then mark the process ready"""
+        try:
+            for module in HEAVY_MODULES:
+                importlib.import_module(module)
+            for name in ('column_rules', 'upload_catalog', 'chunked_uploads', 'annotation_cache',
+                         'gemini_client', 'job_runner', 'parse_gate', 'annotate_gate'):
+                getattr(self, name)
+        except Exception as e:
+            self.warm_up_error = str(e)
+            print(f"Warm-up failed: {str(e)}")
+            return False
+        self.warm_up_error = None
+        self.ready.set()
+        return True
+
+    def start_warm_up(self):
+        """Warm up on a background thread so liveness checks are answered meanwhile"""
+        thread = threading.Thread(target=self.warm_up, name='warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def readiness(self):
+        """Return (ready, checks) for the readiness endpoint"""
+        checks = {
+            'warmed_up': self.ready.is_set(),
+            'draining': self.draining,
+            'upload_folder_writable': os.access(self.upload_folder, os.W_OK)
+        }
+        if self.warm_up_error:
+            checks['warm_up_error'] = self.warm_up_error
+        if checks['warmed_up']:
+            try:
+                self.upload_catalog.is_empty()
+                checks['catalog'] = 'ok'
+            except Exception as e:
+                checks['catalog'] = str(e)
+            # The model is not required: fallback descriptions keep uploads working
+            checks['model_configured'] = bool(self.gemini_api_key)
+            checks['model_circuit'] = self.gemini_client.stats()['circuit']
+        ready = (checks['warmed_up'] and not checks['draining'] and checks['upload_folder_writable']
+                 and checks.get('catalog') == 'ok')
+        return ready, checks
+
+    def shutdown(self, wait=True):
+        """Finish background jobs and close handles; readiness fails from here on"""
+        self.draining = True
+        self.ready.clear()
+        job_runner = self._built('job_runner')
+        if job_runner is not None:
+            job_runner.shutdown(wait=wait)
+        process_pool = self._built('process_pool')
+        if process_pool is not None:
+            process_pool.shutdown(wait=wait, cancel_futures=not wait)
+        for name in ('gemini_client', 'annotation_cache', 'upload_catalog'):
+            component = self._built(name)
+            if component is not None:
+                component.close()
+
+    def collect_metrics(self):
+        """Metric families read from component stats; components not built yet are skipped"""
+        families = []
+        gemini_client = self._built('gemini_client')
+        if gemini_client is not None:
+            gemini = gemini_client.stats()
+            families += [
+                ('gemini_calls_total', 'counter', 'Model calls requested', [({}, gemini['calls'])]),
+                ('gemini_attempts_total', 'counter', 'HTTP attempts made to the model API',
+                 [({}, gemini['attempts'])]),
+                ('gemini_retries_total', 'counter', 'Model API retries', [({}, gemini['retries'])]),
+                ('gemini_failures_total', 'counter', 'Model calls that failed after retries',
+                 [({}, gemini['failures'])]),
+                ('gemini_short_circuited_total', 'counter', 'Model calls refused by the open circuit breaker',
+                 [({}, gemini['short_circuited'])]),
+                ('gemini_circuit_state', 'gauge', 'Circuit breaker state (0 closed, 1 half-open, 2 open)',
+                 [({}, CIRCUIT_STATES.get(gemini['circuit'], 0))])
+            ]
+        annotation_cache = self._built('annotation_cache')
+        if annotation_cache is not None:
+            cache = annotation_cache.stats()
+            families += [
+                ('annotation_cache_lookups_total', 'counter', 'Annotation cache lookups by result',
+                 [({'result': 'memory_hit'}, cache['hits'] - cache['disk_hits']),
+                  ({'result': 'disk_hit'}, cache['disk_hits']),
+                  ({'result': 'miss'}, cache['misses'])]),
+                ('annotation_cache_evictions_total', 'counter', 'Entries evicted from the in-memory annotation cache',
+                 [({}, cache['evictions'])]),
+                ('annotation_cache_entries', 'gauge', 'Cached annotations by tier',
+                 [({'tier': 'memory'}, cache['memory_entries']), ({'tier': 'disk'}, cache['disk_entries'])])
+            ]
+        gates = [self._built(name) for name in ('parse_gate', 'annotate_gate')]
+        gates = [gate.stats() | {'name': gate.name} for gate in gates if gate is not None]
+        if gates:
+            families += [
+                ('admission_active', 'gauge', 'Requests holding an admission slot',
+                 [({'gate': gate['name']}, gate['active']) for gate in gates]),
+                ('admission_waiting', 'gauge', 'Requests queued for an admission slot',
+                 [({'gate': gate['name']}, gate['waiting']) for gate in gates]),
+                ('admission_rejected_total', 'counter', 'Requests refused by admission control',
+                 [({'gate': gate['name'], 'reason': reason}, count)
+                  for gate in gates for reason, count in gate['rejected'].items()])
+            ]
+        families.append(('ready', 'gauge', 'Whether this worker has finished warming up and is not draining',
+                         [({}, int(self.ready.is_set() and not self.draining))]))
+        return families
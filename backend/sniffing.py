@@ -0,0 +1,139 @@
+"""
+CSV dialect sniffing
+
+City exports are not always UTF-8 and comma-separated: Latin-1/Windows-1252
+files and semicolon or tab delimiters are common. The dialect is worked out
+once, from the first few KB of an upload, and stored in its metadata so every
+later read (pandas, Arrow, the csv module and the byte scanner) parses the
+file the same way. The dialect also carries per-column type hints from the
+sample, so Arrow does not guess a column's type from one block and fail on a
+later one.
+"""
+
+import codecs
+import csv
+import io
+
+import pandas as pd
+
+SNIFF_BYTES = 64 * 1024
+DELIMITERS = (',', ';', '\t', '|')
+QUOTECHARS = ('"', "'")
+# Dialect sidecars written before sniffing existed are read as this
+DEFAULT_DIALECT = {'encoding': 'utf-8', 'delimiter': ',', 'quotechar': '"', 'column_types': {}}
+
+
+class UnsupportedEncoding(ValueError):
+    """Raised for encodings whose bytes the row scanner cannot split, such as UTF-16"""
+
+
+class Utf8Check:
+    """Fed a file chunk by chunk; ``valid`` turns False at the first byte that is not UTF-8"""
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.valid = True
+
+    def update(self, chunk):
+        if self.valid:
+            try:
+                self.decoder.decode(chunk)
+            except UnicodeDecodeError:
+                self.valid = False
+
+
+def detect_encoding(head):
+    """Pick an encoding from a BOM, else UTF-8 if the bytes decode, else Windows-1252 or Latin-1"""
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        raise UnsupportedEncoding('UTF-16 files are not supported; save the file as UTF-8')
+    try:
+        # A multi-byte character cut off at the end of the sample is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        head.decode('cp1252')
+        return 'cp1252'
+    except UnicodeDecodeError:
+        # Latin-1 decodes any byte
+        return 'latin-1'
+
+
+def fallback_encoding(encoding):
+    """Encoding to use once bytes later in the file turn out not to be UTF-8
+
+    A file with a UTF-8 BOM keeps it; its stray bytes are replaced on read.
+    """
+    return 'cp1252' if encoding == 'utf-8' else encoding
+
+
+def detect_format(text):
+    """Return (delimiter, quotechar) giving the header's field count on the most rows
+
+    Each candidate pair parses the sample; the winner has the most rows
+    matching the header's field count, then the most fields. A file where no
+    candidate splits the header is treated as a single comma-separated column.
+    """
+    best, best_score = (',', '"'), None
+    for quotechar in QUOTECHARS:
+        for delimiter in DELIMITERS:
+            counts = [len(row) for row in csv.reader(io.StringIO(text), delimiter=delimiter, quotechar=quotechar)
+                      if row]
+            if not counts or counts[0] < 2:
+                continue
+            consistency = sum(count == counts[0] for count in counts) / len(counts)
+            score = (consistency, counts[0])
+            if best_score is None or score > best_score:
+                best, best_score = (delimiter, quotechar), score
+    return best
+
+
+def column_kind(values):
+    """Type hint for one sampled column: integer, float, boolean, string or empty"""
+    if values.isna().all():
+        return 'empty'
+    dtype = values.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'integer'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'float'
+    return 'string'
+
+
+def sniff_dialect(filepath, sample_bytes=SNIFF_BYTES):
+    """Read the start of a file and return its dialect as a dict"""
+    with open(filepath, 'rb') as f:
+        head = f.read(sample_bytes)
+    encoding = detect_encoding(head)
+    text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(head)
+    if len(head) == sample_bytes and '\n' in text:
+        # Only whole lines; the last one is probably cut off
+        text = text[:text.rindex('\n') + 1]
+    delimiter, quotechar = detect_format(text)
+    dialect = {'encoding': encoding, 'delimiter': delimiter, 'quotechar': quotechar, 'column_types': {}}
+    try:
+        sample = pd.read_csv(io.StringIO(text), **pandas_options(dialect, encoding=False))
+    except (ValueError, pd.errors.ParserError):
+        return dialect
+    dialect['column_types'] = {str(col): column_kind(sample[col]) for col in sample.columns}
+    return dialect
+
+
+def resolve_dialect(filepath, dialect=None):
+    """Return ``dialect`` if known, else sniff it from the file"""
+    return dialect if dialect else sniff_dialect(filepath)
+
+
+def pandas_options(dialect, encoding=True):
+    """Keyword arguments for ``pd.read_csv`` matching a dialect"""
+    options = {'sep': dialect['delimiter'], 'quotechar': dialect['quotechar']}
+    if encoding:
+        options['encoding'] = dialect['encoding']
+        # A stray byte in an otherwise readable file must not fail the whole read
+        options['encoding_errors'] = 'replace'
+    return options
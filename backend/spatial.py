@@ -0,0 +1,514 @@
+"""
+Spatial grid index of uploads with coordinate columns
+
+Coordinates come from a latitude/longitude (or X/Y) column pair, or from one
+text column holding both, such as a Google Maps link
+(``.../place/29.58229225N 098.42891563W``), ``POINT (lon lat)`` or
+``(lat, lon)``. After upload they are parsed once and bucketed into a fixed
+grid over the data's extent. Points are stored sorted by grid cell, with the
+offset where each cell starts, so a bounding box is answered from the counts
+of the cells it covers whole plus an exact test of the points in its edge
+cells. Longitude/latitude is indexed as Web Mercator (y is the Mercator
+ordinate in degrees), so heatmap tiles bin linearly. The index is a set of
+NumPy arrays in one ``.npz`` file.
+"""
+
+import json
+import math
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from csv_ingest import CHUNK_ROWS, iter_chunks
+from metadata_store import META_DIRNAME
+from sniffing import pandas_options
+
+GRID_SIZE = 512
+SAMPLE_ROWS = 1000
+# Share of a sample's non-empty values that must parse for a column to hold coordinates
+MIN_PARSED_SHARE = 0.9
+MAX_DISTRICTS = 1000
+TILE_BINS = 64
+MAX_TILE_BINS = 256
+MAX_ZOOM = 24
+# Tiles whose bins span this many grid cells are binned from cell counts, not points
+COARSE_CELLS_PER_BIN = 4
+# Web Mercator is undefined at the poles; tiles stop at this latitude
+MAX_LATITUDE = 85.0511287798
+
+LAT_PATTERN = re.compile(r'latitude|(^|[^a-z])lat([^a-z]|$)', re.I)
+LON_PATTERN = re.compile(r'longitude|(^|[^a-z])(lon|lng|long)([^a-z]|$)', re.I)
+X_PATTERN = re.compile(r'^(x|x[\s_]?coord(inate)?|easting|point[\s_]?x)$', re.I)
+Y_PATTERN = re.compile(r'^(y|y[\s_]?coord(inate)?|northing|point[\s_]?y)$', re.I)
+DISTRICT_PATTERN = re.compile(r'district|ward|precinct', re.I)
+# Two decimal numbers, each with an optional hemisphere letter
+COORDINATE_PATTERN = re.compile(
+    r'(?P<a>[-+]?\d{1,3}\.\d+)\s*(?P<ah>[NSEWnsew])?\s*[,\s]\s*(?P<b>[-+]?\d{1,3}\.\d+)\s*(?P<bh>[NSEWnsew])?'
+)
+
+
+class SpatialQueryError(ValueError):
+    """Raised for a bounding box or tile the index cannot answer"""
+
+
+def parse_bbox(text):
+    """Parse a ``west,south,east,north`` query parameter; None when it is absent"""
+    if not text:
+        return None
+    try:
+        bbox = tuple(float(value) for value in text.split(','))
+    except ValueError:
+        bbox = ()
+    if len(bbox) != 4 or not all(math.isfinite(value) for value in bbox):
+        raise SpatialQueryError('bbox must be four numbers: west,south,east,north')
+    return bbox
+
+
+def spatial_path(upload_folder, filename):
+    return os.path.join(upload_folder, META_DIRNAME, f'{filename}.spatial.npz')
+
+
+def mercator_y(lat):
+    """Web Mercator ordinate of a latitude, scaled to degrees so it spans -180..180 like longitude"""
+    lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+    return np.degrees(np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)))
+
+
+def mercator_lat(y):
+    return np.degrees(2 * np.arctan(np.exp(np.radians(y))) - np.pi / 2)
+
+
+def parse_coordinate_text(values):
+    """Return (lon, lat) float arrays parsed from text such as a map link; NaN where nothing parses
+
+    Hemisphere letters decide which number is which, and S/W make it
+    negative. ``POINT (x y)`` is longitude first; otherwise latitude comes
+    first unless it is out of range.
+    """
+    parts = values.str.extract(COORDINATE_PATTERN)
+    a = pd.to_numeric(parts['a'], errors='coerce').to_numpy(dtype=np.float64)
+    b = pd.to_numeric(parts['b'], errors='coerce').to_numpy(dtype=np.float64)
+    ah = parts['ah'].fillna('').str.upper().to_numpy(dtype=object)
+    bh = parts['bh'].fillna('').str.upper().to_numpy(dtype=object)
+    wkt = values.str.contains('point', case=False, regex=False).to_numpy(dtype=bool)
+    lon_first = np.isin(ah, ['E', 'W']) | np.isin(bh, ['N', 'S']) | wkt | (np.abs(a) > 90)
+    lat = np.where(lon_first, b, a)
+    lon = np.where(lon_first, a, b)
+    lat = np.where(np.where(lon_first, bh, ah) == 'S', -np.abs(lat), lat)
+    lon = np.where(np.where(lon_first, ah, bh) == 'W', -np.abs(lon), lon)
+    return lon, lat
+
+
+def valid_lonlat(lon, lat):
+    """Longitude/latitude in range; (0, 0) is taken as a missing location, not a point in the ocean"""
+    with np.errstate(invalid='ignore'):
+        return (np.abs(lon) <= 180) & (np.abs(lat) <= 90) & ((lon != 0) | (lat != 0))
+
+
+def _numbers(sample, col):
+    values = sample[col].str.strip()
+    values = values[values != '']
+    return values, pd.to_numeric(values, errors='coerce')
+
+
+def _parses(values, parsed):
+    return not values.empty and parsed.notna().mean() >= MIN_PARSED_SHARE
+
+
+def plan_spatial(filepath, dialect):
+    """Pick the coordinate and district columns from a sample of the file
+
+    A latitude/longitude pair wins over a text column of coordinates, which
+    wins over an X/Y pair. X/Y values outside longitude/latitude ranges are
+    indexed as they are, in the file's projected units.
+    """
+    sample = pd.read_csv(filepath, nrows=SAMPLE_ROWS, dtype=str, keep_default_na=False, **pandas_options(dialect))
+    columns = list(sample.columns)
+
+    def numeric(pattern, limit):
+        for col in columns:
+            if pattern.search(str(col)):
+                values, parsed = _numbers(sample, col)
+                if _parses(values, parsed) and (limit is None or (parsed.dropna().abs() <= limit).all()):
+                    return col
+        return None
+
+    coordinates = None
+    lat, lon = numeric(LAT_PATTERN, 90), numeric(LON_PATTERN, 180)
+    if lat and lon and lat != lon:
+        coordinates = {'x': lon, 'y': lat, 'text': None, 'geographic': True}
+    if coordinates is None:
+        for col in columns:
+            values = sample[col].str.strip()
+            values = values[values != '']
+            if values.empty:
+                continue
+            lon_values, lat_values = parse_coordinate_text(values)
+            if valid_lonlat(lon_values, lat_values).mean() >= MIN_PARSED_SHARE:
+                coordinates = {'x': None, 'y': None, 'text': col, 'geographic': True}
+                break
+    if coordinates is None:
+        x, y = numeric(X_PATTERN, None), numeric(Y_PATTERN, None)
+        if x and y:
+            xs, ys = _numbers(sample, x)[1], _numbers(sample, y)[1]
+            coordinates = {'x': x, 'y': y, 'text': None,
+                           'geographic': bool(valid_lonlat(xs.to_numpy(), ys.to_numpy()).all())}
+
+    district = None
+    for col in columns:
+        if DISTRICT_PATTERN.search(str(col)):
+            values = sample[col].str.strip()
+            values = values[values != '']
+            if not values.empty and values.nunique() <= MAX_DISTRICTS:
+                district = col
+                break
+    return {'coordinates': coordinates, 'district': district}
+
+
+def needed_columns(plan):
+    coordinates = plan['coordinates'] or {}
+    columns = [col for col in (coordinates.get('text'), coordinates.get('x'), coordinates.get('y'), plan['district'])
+               if col]
+    return list(dict.fromkeys(columns))
+
+
+def chunk_points(chunk, coordinates):
+    """Return (x, y, located) for a chunk of text values, in index space"""
+    if coordinates['text']:
+        x, y = parse_coordinate_text(chunk[coordinates['text']])
+    else:
+        x = pd.to_numeric(chunk[coordinates['x']].str.strip(), errors='coerce').to_numpy(dtype=np.float64)
+        y = pd.to_numeric(chunk[coordinates['y']].str.strip(), errors='coerce').to_numpy(dtype=np.float64)
+    if coordinates['geographic']:
+        located = valid_lonlat(x, y)
+        y = mercator_y(np.where(located, y, 0.0))
+    else:
+        located = np.isfinite(x) & np.isfinite(y)
+    return x, y, located
+
+
+class DistrictCodes:
+    """Give each district value a small integer code, consistently across chunks"""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, values):
+        values = values.str.strip()
+        codes, uniques = pd.factorize(values.where(values != ''))
+        # Empty values factorize to -1, which picks the trailing -1
+        lookup = np.array([self.codes.setdefault(value, len(self.codes)) for value in uniques] + [-1], dtype=np.int32)
+        return lookup[codes]
+
+    @property
+    def names(self):
+        return list(self.codes)
+
+
+def build_spatial_index(filepath, metadata, chunksize=CHUNK_ROWS, grid_size=GRID_SIZE):
+    """Parse a file's coordinates and district once and return the index arrays"""
+    dialect = metadata.get('dialect')
+    plan = plan_spatial(filepath, dialect)
+    coordinates = plan['coordinates']
+    xs, ys, district_parts = [], [], []
+    districts = DistrictCodes()
+    rows = 0
+    needed = needed_columns(plan)
+    if needed:
+        for chunk in iter_chunks(filepath, columns=needed, chunksize=chunksize, dialect=dialect, as_text=True):
+            rows += len(chunk)
+            codes = (districts.encode(chunk[plan['district']]) if plan['district']
+                     else np.full(len(chunk), -1, dtype=np.int32))
+            if coordinates:
+                x, y, located = chunk_points(chunk, coordinates)
+                # Located points only, except that district counts take every row
+                xs.append(x[located])
+                ys.append(y[located])
+                district_parts.append((codes, located))
+            else:
+                district_parts.append((codes, np.zeros(len(chunk), dtype=bool)))
+            if len(districts.codes) > MAX_DISTRICTS:
+                # Not a district column after all; keep the coordinates
+                plan['district'] = None
+                districts = DistrictCodes()
+                district_parts = [(np.full(len(codes), -1, dtype=np.int32), located)
+                                  for codes, located in district_parts]
+    else:
+        rows = metadata.get('num_rows', 0)
+
+    all_codes = np.concatenate([codes for codes, _ in district_parts]) if district_parts else np.empty(0, np.int32)
+    located = (np.concatenate([located for _, located in district_parts]) if district_parts
+               else np.empty(0, dtype=bool))
+    codes = all_codes[located]
+    # Kept in float64 so edge tests give the same counts as the source values
+    x = np.concatenate(xs) if xs else np.empty(0)
+    y = np.concatenate(ys) if ys else np.empty(0)
+
+    if len(x):
+        x0, y0 = float(x.min()), float(y.min())
+        cell_width = (float(x.max()) - x0 or 1.0) / grid_size
+        cell_height = (float(y.max()) - y0 or 1.0) / grid_size
+        gx = np.clip(np.floor((x - x0) / cell_width), 0, grid_size - 1).astype(np.int64)
+        gy = np.clip(np.floor((y - y0) / cell_height), 0, grid_size - 1).astype(np.int64)
+        cells = gy * grid_size + gx
+    else:
+        x0 = y0 = 0.0
+        cell_width = cell_height = 1.0
+        cells = np.empty(0, dtype=np.int64)
+    order = np.argsort(cells, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=grid_size * grid_size))])
+
+    names = districts.names
+    district_rows = np.bincount(all_codes[all_codes >= 0], minlength=len(names))
+    stats = np.full((len(names), 6), np.nan)
+    district_located = np.zeros(len(names), dtype=np.int64)
+    if len(names) and len(codes):
+        # Centroid and bounds in the file's own units (longitude/latitude, not Mercator)
+        lon_lat_y = mercator_lat(y) if coordinates['geographic'] else y
+        frame = pd.DataFrame({'code': codes, 'x': x, 'y': lon_lat_y})
+        frame = frame[frame['code'] >= 0]
+        grouped = frame.groupby('code')[['x', 'y']].agg(['mean', 'min', 'max'])
+        index = grouped.index.to_numpy()
+        stats[index] = grouped[[('x', 'mean'), ('y', 'mean'), ('x', 'min'), ('y', 'min'), ('x', 'max'),
+                                ('y', 'max')]].to_numpy()
+        district_located = np.bincount(frame['code'], minlength=len(names))
+
+    info = {
+        'sha256': metadata['sha256'],
+        'plan': plan,
+        'rows': int(rows),
+        'located': int(len(x)),
+        'grid': [x0, y0, cell_width, cell_height, grid_size]
+    }
+    return {
+        'info': np.array(json.dumps(info)),
+        'x': x[order],
+        'y': y[order],
+        'district': codes[order].astype(np.int32),
+        'offsets': offsets.astype(np.int64),
+        'district_names': np.array(names, dtype=str),
+        'district_rows': district_rows.astype(np.int64),
+        'district_located': district_located.astype(np.int64),
+        'district_stats': stats
+    }
+
+
+def save_spatial_index(upload_folder, filename, arrays):
+    path = spatial_path(upload_folder, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # np.savez adds .npz to any other name
+    tmp_path = f'{path}.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_spatial_index(upload_folder, filename):
+    """Loader for a SidecarCache: the stored index of a file as a SpatialIndex"""
+    try:
+        with np.load(spatial_path(upload_folder, filename), allow_pickle=False) as stored:
+            index = SpatialIndex({name: stored[name] for name in stored.files})
+    except (OSError, ValueError, KeyError):
+        return None
+    return index.sha256, index
+
+
+def expand_ranges(starts, ends):
+    """Concatenate ``arange(start, end)`` for every pair, without a Python loop"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+
+
+class SpatialIndex:
+    """Bounding-box counts, district aggregates and heatmap tiles over a stored grid index"""
+
+    def __init__(self, arrays):
+        info = json.loads(str(arrays['info']))
+        self.sha256 = info['sha256']
+        self.plan = info['plan']
+        self.rows = info['rows']
+        self.located = info['located']
+        self.x0, self.y0, self.cell_width, self.cell_height, self.size = info['grid']
+        self.geographic = bool(self.plan['coordinates'] and self.plan['coordinates']['geographic'])
+        if arrays['x'].dtype != np.float64:
+            # Indexes from before coordinates were kept exact are rebuilt
+            raise ValueError('Spatial index stores rounded coordinates')
+        self.x = arrays['x']
+        self.y = arrays['y']
+        self.district = arrays['district']
+        self.offsets = arrays['offsets']
+        self.district_names = arrays['district_names'].tolist()
+        self.district_rows = arrays['district_rows']
+        self.district_located = arrays['district_located']
+        self.district_stats = arrays['district_stats']
+        counts = np.diff(self.offsets).reshape(self.size, self.size)
+        self.cell_counts = counts
+        # Summed-area table: any block of cells is counted with four lookups
+        self.table = np.zeros((self.size + 1, self.size + 1), dtype=np.int64)
+        self.table[1:, 1:] = counts.cumsum(axis=0).cumsum(axis=1)
+
+    def to_index_box(self, bbox):
+        """Turn (west, south, east, north) in the file's units into index space"""
+        west, south, east, north = bbox
+        if west > east or south > north:
+            raise SpatialQueryError('bbox must be west,south,east,north with west <= east and south <= north')
+        if self.geographic:
+            south, north = float(mercator_y(south)), float(mercator_y(north))
+        return west, south, east, north
+
+    def bounds(self):
+        """Extent of the located points as (west, south, east, north) in the file's units"""
+        if not self.located:
+            return None
+        south = self.y0
+        north = self.y0 + self.cell_height * self.size
+        if self.geographic:
+            # Padded a hair, so the bounds used as a bbox still hold the extreme points after the round trip
+            south, north = float(mercator_lat(south)) - 1e-9, float(mercator_lat(north)) + 1e-9
+        return [self.x0, south, self.x0 + self.cell_width * self.size, north]
+
+    def _cells(self, box):
+        """Cell ranges a box touches and fully covers, or None when it misses the grid
+
+        A cell counts as covered only when every value that falls in it is
+        strictly inside the box after the same arithmetic, so covered cells
+        never need a per-point test.
+        """
+        west, south, east, north = box
+        u0, u1 = (west - self.x0) / self.cell_width, (east - self.x0) / self.cell_width
+        v0, v1 = (south - self.y0) / self.cell_height, (north - self.y0) / self.cell_height
+        last = self.size - 1
+        if not self.located or u1 < 0 or v1 < 0 or u0 > self.size or v0 > self.size:
+            return None
+
+        def touched(low, high):
+            return min(max(math.floor(low), 0), last), min(max(math.floor(high), 0), last)
+
+        def covered(low, high):
+            # The last cell also holds values exactly at the maximum
+            return max(math.floor(low) + 1, 0), last if high > self.size else min(math.floor(high) - 1, last - 1)
+
+        return touched(u0, u1), touched(v0, v1), covered(u0, u1), covered(v0, v1)
+
+    def _edge_points(self, cells, box):
+        """Indices of the points in touched but not covered cells that lie inside the box"""
+        (gx0, gx1), (gy0, gy1), (ix0, ix1), (iy0, iy1) = cells
+        rows = np.arange(gy0, gy1 + 1)
+        inner = (rows >= iy0) & (rows <= iy1) if ix0 <= ix1 else np.zeros(len(rows), dtype=bool)
+        outer_rows, inner_rows = rows[~inner] * self.size, rows[inner] * self.size
+        # Whole rows above and below the covered block, and its left and right margins
+        starts = np.concatenate([outer_rows + gx0, inner_rows + gx0, inner_rows + ix1 + 1])
+        ends = np.concatenate([outer_rows + gx1 + 1, inner_rows + ix0, inner_rows + gx1 + 1])
+        candidates = expand_ranges(self.offsets[starts], self.offsets[ends])
+        x, y = self.x[candidates], self.y[candidates]
+        west, south, east, north = box
+        return candidates[(x >= west) & (x <= east) & (y >= south) & (y <= north)]
+
+    def _covered_points(self, cells):
+        _, _, (ix0, ix1), (iy0, iy1) = cells
+        if ix0 > ix1 or iy0 > iy1:
+            return np.empty(0, dtype=np.int64)
+        rows = np.arange(iy0, iy1 + 1) * self.size
+        return expand_ranges(self.offsets[rows + ix0], self.offsets[rows + ix1 + 1])
+
+    def count(self, bbox):
+        """Number of located points inside a (west, south, east, north) box"""
+        box = self.to_index_box(bbox)
+        cells = self._cells(box)
+        if cells is None:
+            return 0
+        _, _, (ix0, ix1), (iy0, iy1) = cells
+        covered = 0
+        if ix0 <= ix1 and iy0 <= iy1:
+            table = self.table
+            covered = int(table[iy1 + 1, ix1 + 1] - table[iy0, ix1 + 1] - table[iy1 + 1, ix0] + table[iy0, ix0])
+        return covered + len(self._edge_points(cells, box))
+
+    def select(self, box):
+        """Indices of the points inside a box already in index space"""
+        cells = self._cells(box)
+        if cells is None:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self._covered_points(cells), self._edge_points(cells, box)])
+
+    def districts(self, bbox=None):
+        """Per-district row counts, located counts, centroid and bounds; with ``bbox``, also the count inside it"""
+        inside = None
+        if bbox is not None:
+            codes = self.district[self.select(self.to_index_box(bbox))]
+            inside = np.bincount(codes[codes >= 0], minlength=len(self.district_names))
+        result = []
+        for code, name in enumerate(self.district_names):
+            cx, cy, west, south, east, north = self.district_stats[code].tolist()
+            entry = {
+                'district': name,
+                'rows': int(self.district_rows[code]),
+                'located': int(self.district_located[code]),
+                'centroid': None if math.isnan(cx) else [cx, cy],
+                'bounds': None if math.isnan(cx) else [west, south, east, north]
+            }
+            if inside is not None:
+                entry['in_bbox'] = int(inside[code])
+            result.append(entry)
+        return result
+
+    def tile_box(self, z, tx, ty):
+        """Index-space box of tile z/x/y: Web Mercator tiles, or tiles of the data's square extent"""
+        if not 0 <= z <= MAX_ZOOM or not (0 <= tx < 2 ** z and 0 <= ty < 2 ** z):
+            raise SpatialQueryError(f'No tile {z}/{tx}/{ty}')
+        if self.geographic:
+            left, top, side = -180.0, 180.0, 360.0
+        else:
+            side = max(self.cell_width, self.cell_height) * self.size
+            left, top = self.x0, self.y0 + side
+        step = side / 2 ** z
+        return left + tx * step, top - (ty + 1) * step, left + (tx + 1) * step, top - ty * step
+
+    def tile(self, z, tx, ty, bins=TILE_BINS):
+        """Point counts of a heatmap tile as ``bins`` x ``bins`` cells, row 0 at the top
+
+        Tiles much coarser than the grid are binned from the grid's cell
+        counts at cell centres; finer ones from the points themselves.
+        """
+        box = self.tile_box(z, tx, ty)
+        west, south, east, north = box
+        bin_size = (east - west) / bins
+        coarse = bin_size >= COARSE_CELLS_PER_BIN * max(self.cell_width, self.cell_height)
+        cells = self._cells(box)
+        grid = np.zeros(bins * bins, dtype=np.int64)
+        if cells is not None and coarse:
+            (gx0, gx1), (gy0, gy1), _, _ = cells
+            counts = self.cell_counts[gy0:gy1 + 1, gx0:gx1 + 1]
+            rows, cols = np.nonzero(counts)
+            x = self.x0 + (cols + gx0 + 0.5) * self.cell_width
+            y = self.y0 + (rows + gy0 + 0.5) * self.cell_height
+            weights = counts[rows, cols]
+        elif cells is not None:
+            points = self.select(box)
+            x, y = self.x[points], self.y[points]
+            weights = None
+        if cells is not None:
+            # Tiles are half-open so a point on a shared edge is in one of them; the frame's edges are closed
+            last = 2 ** z - 1
+            keep = (x >= west) & ((x < east) | (tx == last)) & (y <= north) & ((y > south) | (ty == last))
+            col = np.clip(((x[keep] - west) / bin_size).astype(np.int64), 0, bins - 1)
+            row = np.clip(((north - y[keep]) / bin_size).astype(np.int64), 0, bins - 1)
+            grid = np.bincount(row * bins + col, weights=None if weights is None else weights[keep],
+                               minlength=bins * bins).astype(np.int64)
+        nonzero = np.flatnonzero(grid)
+        if self.geographic:
+            south, north = float(mercator_lat(south)), float(mercator_lat(north))
+        return {
+            'z': z, 'x': tx, 'y': ty,
+            'bins': bins,
+            'bounds': [west, south, east, north],
+            'approximate': bool(coarse),
+            'total': int(grid.sum()),
+            'max': int(grid.max()) if len(nonzero) else 0,
+            # Sparse [column, row, count] triples
+            'cells': np.column_stack([nonzero % bins, nonzero // bins, grid[nonzero]]).tolist()
+        }
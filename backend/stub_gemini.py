@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gemini generateContent API with configurable latency and error rate
+
+Point the backend at it with GEMINI_BASE_URL=http://127.0.0.1:<port>/v1beta
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COLUMNS_PATTERN = re.compile(r'has these column headers:\s*\n\s*\n(.*?)\n', re.S)
+COLUMN_PATTERN = re.compile(r'column named "(.*?)"')
+
+
+def stub_answer(prompt):
+    """Build a plausible answer for the prompts the backend sends"""
+    match = COLUMNS_PATTERN.search(prompt)
+    if match:
+        columns = [col.strip() for col in match.group(1).split(', ') if col.strip()]
+        return json.dumps({col: f'Stub description of {col}.' for col in columns})
+    match = COLUMN_PATTERN.search(prompt)
+    if match:
+        return f'Stub description of {match.group(1)}.'
+    return 'Stub response.'
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        config = self.server.config
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        with self.server.lock:
+            self.server.requests_served += 1
+
+        latency = config['latency']
+        if latency:
+            time.sleep(max(0.0, random.gauss(latency, latency * config['jitter'])))
+
+        if random.random() < config['error_rate']:
+            self._send(config['error_status'], {'error': {'message': 'Stub error'}},
+                       {'Retry-After': '0'} if config['error_status'] == 429 else None)
+            return
+
+        if config['answer'] is not None:
+            self._send(200, config['answer'])
+            return
+        prompt = body.get('contents', [{}])[0].get('parts', [{}])[0].get('text', '')
+        self._send(200, {'candidates': [{'content': {'parts': [{'text': stub_answer(prompt)}]}}]})
+
+    def _send(self, status, payload, headers=None):
+        encoded = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        if self.server.config['verbose']:
+            super().log_message(format, *args)
+
+
+def start_stub_server(host='127.0.0.1', port=0, latency=0.0, jitter=0.2, error_rate=0.0,
+                      error_status=503, verbose=False, answer=None):
+    """Start the stub on a daemon thread and return the server; ``server.base_url`` is the API root
+
+    ``answer`` replaces every successful response body (a JSON-ready value, or
+    raw bytes), e.g. to serve a malformed answer. ``server.config`` can be
+    changed while the server runs.
+    """
+    server = ThreadingHTTPServer((host, port), StubGeminiHandler)
+    server.daemon_threads = True
+    server.config = {
+        'latency': latency,
+        'jitter': jitter,
+        'error_rate': error_rate,
+        'error_status': error_status,
+        'verbose': verbose,
+        'answer': answer
+    }
+    server.lock = threading.Lock()
+    server.requests_served = 0
+    server.base_url = f'http://{host}:{server.server_address[1]}/v1beta'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local Gemini API stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.2, help='latency standard deviation as a fraction of the mean')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    args = parser.parse_args()
+
+    server = start_stub_server(args.host, args.port, args.latency, args.jitter,
+                               args.error_rate, args.error_status, verbose=True)
+    print(f"Gemini stub listening on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import sqlite3
+
+import annotation_cache
+from annotation_cache import AnnotationCache
+
+
+def test_disk_entries_survive_a_new_process(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = AnnotationCache(path)
+    cache.put('a', {'description': 'x'})
+    cache.close()
+    reopened = AnnotationCache(path)
+    assert reopened.get('a') == {'description': 'x'}
+    assert reopened.stats()['disk_hits'] == 1
+    reopened.close()
+
+
+def test_database_uses_wal_and_an_access_time_index(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    AnnotationCache(path).close()
+    db = sqlite3.connect(path)
+    assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    plan = db.execute('EXPLAIN QUERY PLAN SELECT key FROM annotations ORDER BY accessed_at LIMIT 1').fetchall()
+    assert any('annotations_accessed_at' in row[-1] for row in plan)
+    db.close()
+
+
+def test_prune_keeps_the_most_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(annotation_cache, 'PRUNE_EVERY', 1)
+    cache = AnnotationCache(str(tmp_path / 'cache.sqlite'), max_entries=1, max_disk_entries=3)
+    for key in 'abcd':
+        cache.put(key, key)
+    cache.get('b')
+    cache.put('e', 'e')
+    assert cache.stats()['disk_entries'] == 3
+    assert [cache.get(key) for key in 'bde'] == ['b', 'd', 'e']
+    assert cache.get('a') is None and cache.get('c') is None
+    cache.close()
+
+
+def test_disk_hits_do_not_write_until_a_batch_is_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(annotation_cache, 'TOUCH_BATCH', 3)
+    path = str(tmp_path / 'cache.sqlite')
+    cache = AnnotationCache(path, max_entries=1)
+    for key in 'abc':
+        cache.put(key, key)
+    accessed_at = dict(sqlite3.connect(path).execute('SELECT key, accessed_at FROM annotations'))
+    cache.get('a')
+    cache.get('b')
+    assert dict(sqlite3.connect(path).execute('SELECT key, accessed_at FROM annotations')) == accessed_at
+    cache.get('a')
+    cache.get('c')
+    assert cache.touched == {}
+    touched = dict(sqlite3.connect(path).execute('SELECT key, accessed_at FROM annotations'))
+    assert all(touched[key] > accessed_at[key] for key in 'abc')
+    cache.close()
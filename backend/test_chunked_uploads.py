@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from chunked_uploads import ChunkedUploads, SessionNotFound, UploadConflict, UploadError
+
+PART = 4
+
+
+def content(size):
+    return bytes(i % 251 for i in range(size))
+
+
+def test_parts_from_two_workers_are_all_recorded(tmp_path):
+    data = content(PART * 64)
+    workers = [ChunkedUploads(str(tmp_path), default_part_size=PART) for _ in range(2)]
+    session = workers[0].create('data.csv', len(data))
+
+    def send(worker, indexes):
+        for index in indexes:
+            worker.write_part(session['upload_id'], index, data[index * PART:(index + 1) * PART])
+
+    threads = [threading.Thread(target=send, args=(workers[n % 2], range(n, 64, 8))) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert workers[1].missing_parts(workers[1].get(session['upload_id'])) == []
+    _, staged_path, sha256 = workers[1].finish(session['upload_id'])
+    assert sha256 == hashlib.sha256(data).hexdigest()
+    with open(staged_path, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(workers[0].parts_path(session['upload_id']))
+
+
+def test_missing_parts_keep_the_session_open(tmp_path):
+    uploads = ChunkedUploads(str(tmp_path), default_part_size=PART)
+    data = content(PART * 3 - 1)
+    session = uploads.create('data.csv', len(data), sha256=hashlib.sha256(data).hexdigest())
+    uploads.write_part(session['upload_id'], 0, data[:PART])
+    with pytest.raises(UploadError, match=r'Missing parts: \[1, 2\]'):
+        uploads.finish(session['upload_id'])
+    for index in (1, 2):
+        uploads.write_part(session['upload_id'], index, data[index * PART:(index + 1) * PART])
+    assert uploads.finish(session['upload_id'])[2] == session['sha256']
+    with pytest.raises(SessionNotFound):
+        uploads.get(session['upload_id'])
+
+
+def test_bad_parts_are_rejected(tmp_path):
+    uploads = ChunkedUploads(str(tmp_path), default_part_size=PART)
+    session = uploads.create('data.csv', PART * 2)
+    with pytest.raises(UploadError, match='between 0 and 1'):
+        uploads.write_part(session['upload_id'], 2, b'x' * PART)
+    with pytest.raises(UploadError, match='must be 4 bytes'):
+        uploads.write_part(session['upload_id'], 0, b'x')
+    with pytest.raises(UploadError, match='Checksum mismatch'):
+        uploads.write_part(session['upload_id'], 0, b'x' * PART, checksum='0' * 64)
+    assert uploads.get(session['upload_id'])['parts'] == {}
+
+
+def test_only_one_finish_wins(tmp_path):
+    uploads = ChunkedUploads(str(tmp_path), default_part_size=PART)
+    session = uploads.create('data.csv', PART)
+    uploads.write_part(session['upload_id'], 0, b'abcd')
+    os.rename(uploads._state_path(session['upload_id']), uploads._claimed_path(session['upload_id']))
+    with pytest.raises(UploadConflict):
+        uploads.finish(session['upload_id'])
+
+
+def test_session_from_before_part_markers_resumes(tmp_path):
+    uploads = ChunkedUploads(str(tmp_path), default_part_size=PART)
+    session = uploads.create('data.csv', PART * 2)
+    upload_id = session['upload_id']
+    os.rmdir(uploads.parts_path(upload_id))
+    with open(uploads._state_path(upload_id), 'w', encoding='utf-8') as f:
+        json.dump(dict(session, parts={'0': hashlib.sha256(b'abcd').hexdigest()}), f)
+    with open(uploads.data_path(upload_id), 'r+b') as f:
+        f.write(b'abcd')
+    assert uploads.missing_parts(uploads.get(upload_id)) == [1]
+    uploads.write_part(upload_id, 1, b'efgh')
+    assert uploads.finish(upload_id)[2] == hashlib.sha256(b'abcdefgh').hexdigest()
+
+
+def test_expire_keeps_sessions_that_are_still_receiving_parts(tmp_path):
+    uploads = ChunkedUploads(str(tmp_path), default_part_size=PART, ttl_seconds=60)
+    idle = uploads.create('idle.csv', PART)
+    active = uploads.create('active.csv', PART * 2)
+    old = time.time() - 120
+    for upload_id in (idle['upload_id'], active['upload_id']):
+        for path in (uploads._state_path(upload_id), uploads.data_path(upload_id), uploads.parts_path(upload_id)):
+            os.utime(path, (old, old))
+    uploads.write_part(active['upload_id'], 0, b'abcd')
+    uploads.expire()
+    assert sorted(os.listdir(uploads.directory)) == sorted(
+        f"{active['upload_id']}{suffix}" for suffix in ('.json', '.data', '.parts'))
+
+
+def test_resumable_upload_through_the_api(client):
+    data = b'id,name\n' + b''.join(b'%d,n%d\n' % (i, i) for i in range(100))
+    created = client.post('/api/uploads', json={'filename': 'big.csv', 'size': len(data), 'part_size': 256,
+                                                'sha256': hashlib.sha256(data).hexdigest()})
+    assert created.status_code == 201
+    session = created.get_json()
+    upload_id = session['upload_id']
+    for index in session['missing_parts'][1:]:
+        part = data[index * 256:(index + 1) * 256]
+        response = client.put(f'/api/uploads/{upload_id}/parts/{index}', data=part,
+                              headers={'X-Part-SHA256': hashlib.sha256(part).hexdigest()})
+        assert response.status_code == 200
+    assert client.post(f'/api/uploads/{upload_id}/complete').status_code == 400
+    assert client.get(f'/api/uploads/{upload_id}').get_json()['missing_parts'] == [0]
+    client.put(f'/api/uploads/{upload_id}/parts/0', data=data[:256])
+    completed = client.post(f'/api/uploads/{upload_id}/complete')
+    assert completed.status_code == 200
+    assert client.get('/api/files/big.csv').get_json()['file_info']['total_rows'] == 100
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 404
@@ -0,0 +1,78 @@
+import hashlib
+
+import pandas as pd
+import pytest
+
+from conftest import upload
+from csv_ingest import read_rows, scan_rows, summarize_csv
+
+INCH_MARKS = 'id,desc\n1,12" pipe\n2,plain\n3,4" tube\n4,x\n'
+
+CASES = [
+    INCH_MARKS,
+    'id,size\n1,12"\n2,3"\n3,x\n',
+    'a,b\n1,5" x 3"\n2,"quoted, with comma"\n',
+    'a,b\n1,"line\nbreak"\n2,"say ""hi"""\n3,""""\n',
+    'a,b\r\n1,"x\r\ny"\r\n\r\n2,z\r\n',
+    'a,b\n1,"unterminated at end of file',
+]
+
+
+def write(tmp_path, text, name='data.csv'):
+    path = tmp_path / name
+    path.write_bytes(text.encode('utf-8'))
+    return str(path)
+
+
+@pytest.mark.parametrize('text', CASES)
+@pytest.mark.parametrize('chunk_bytes', [1, 2, 5, 4096])
+def test_scan_counts_rows_like_pandas(tmp_path, text, chunk_bytes):
+    path = write(tmp_path, text)
+    try:
+        expected = len(pd.read_csv(path, dtype=str, keep_default_na=False))
+    except pd.errors.ParserError:
+        pytest.skip('pandas rejects this file')
+    assert scan_rows(path, chunk_bytes=chunk_bytes)[0] == expected
+
+
+def test_inch_marks_do_not_open_quoting(tmp_path):
+    assert scan_rows(write(tmp_path, INCH_MARKS))[0] == 4
+
+
+def test_checkpoints_seek_to_every_row(tmp_path):
+    text = 'id,desc\n' + ''.join(f'{i},{i % 7}" pipe\n' if i % 3 else f'{i},"a\nb"\n' for i in range(50))
+    path = write(tmp_path, text)
+    summary = summarize_csv(path, checkpoint_every=4)
+    assert summary['num_rows'] == 50
+    for offset in (0, 3, 4, 17, 49):
+        window = read_rows(path, summary['columns'], summary['checkpoints'], 4, offset, 1,
+                           dialect=summary['dialect'])
+        assert int(window.iloc[0]['id']) == offset
+
+
+def test_summary_hash_matches_content(tmp_path):
+    path = write(tmp_path, INCH_MARKS)
+    assert summarize_csv(path)['sha256'] == hashlib.sha256(INCH_MARKS.encode('utf-8')).hexdigest()
+
+
+def test_file_info_and_rows_agree_on_inch_marks(client):
+    assert upload(client, 'quote.csv', INCH_MARKS).status_code == 200
+    info = client.get('/api/files/quote.csv').get_json()['file_info']
+    assert info['total_rows'] == 4
+    page = client.get('/api/files/quote.csv/rows?offset=0&limit=10').get_json()
+    assert page['total_rows'] == 4
+    assert [row['id'] for row in page['rows']] == [1, 2, 3, 4]
+    assert page['rows'][0]['desc'] == '12" pipe'
+
+
+def test_summary_reuses_a_known_hash(tmp_path):
+    assert summarize_csv(write(tmp_path, INCH_MARKS), sha256='f' * 64)['sha256'] == 'f' * 64
+
+
+def test_upload_is_stored_under_its_content_hash(client, services):
+    from metadata_store import load_metadata
+
+    assert upload(client, 'quote.csv', INCH_MARKS).status_code == 200
+    digest = hashlib.sha256(INCH_MARKS.encode('utf-8')).hexdigest()
+    assert load_metadata(services.upload_folder, 'quote.csv')['sha256'] == digest
+    assert services.upload_catalog.get_sha256('quote.csv') == digest
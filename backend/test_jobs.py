@@ -0,0 +1,50 @@
+import threading
+
+from conftest import upload, wait_for_job
+from jobs import JobRunner
+
+
+def test_jobs_are_visible_to_another_runner(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    release = threading.Event()
+    submitter, other = JobRunner(db_path=path), JobRunner(db_path=path, poll_interval=0.01)
+    job_id = submitter.submit('test', lambda: release.wait(5) and {'columns': ['a']})
+    assert other.get(job_id)['status'] in ('queued', 'running')
+    running = other.wait(job_id, last_status='queued', timeout=5)
+    assert running['status'] == 'running'
+    release.set()
+    done = other.wait(job_id, last_status='running', timeout=5)
+    assert done['status'] == 'done' and done['result'] == {'columns': ['a']}
+    submitter.shutdown()
+    other.shutdown()
+
+
+def test_failed_job_is_stored_with_its_error(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    runner = JobRunner(db_path=path)
+    job_id = runner.submit('test', lambda: 1 / 0)
+    runner.shutdown()
+    job = JobRunner(db_path=path).get(job_id)
+    assert job['status'] == 'failed' and 'division' in job['error']
+
+
+def test_finished_jobs_are_pruned_from_the_store(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    runner = JobRunner(max_workers=1, db_path=path)
+    job_ids = [runner.submit('test', lambda value=value: value) for value in range(4)]
+    runner.shutdown()
+    pruning = JobRunner(max_finished=2, db_path=path)
+    pruning.submit('test', lambda: None)
+    pruning.shutdown()
+    reader = JobRunner(db_path=path)
+    assert reader.get(job_ids[0]) is None
+    assert reader.get(job_ids[3])['result'] == 3
+
+
+def test_job_polled_on_another_worker(make_app):
+    first = make_app()
+    second = make_app()
+    response = upload(first.test_client(), 'data.csv', 'id,name\n1,a\n', query='?async=1')
+    job_id = response.get_json()['annotation_job']['id']
+    job = wait_for_job(second.test_client(), job_id)
+    assert job['status'] == 'done'
@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+from model_client import GeminiClient, ModelUnavailable, TokenBucket
+
+
+def make_client(stub, **options):
+    options = dict({'timeout': 2, 'max_retries': 0, 'backoff_base': 0.01, 'backoff_max': 0.05}, **options)
+    return GeminiClient('test-key', 'stub-model', base_url=stub.base_url, **options)
+
+
+def recover_after_backoff(client, stub, delays):
+    """Record each backoff and let the stub answer from the next attempt on"""
+    def backoff(attempt, retry_after=None):
+        delays.append((attempt, retry_after))
+        stub.config['error_rate'] = 0.0
+    client._backoff = backoff
+
+
+def test_answer_text(stub):
+    client = make_client(stub)
+    assert client.generate('a column named "zip"') == 'Stub description of zip.'
+    assert client.stats()['attempts'] == 1
+
+
+@pytest.mark.parametrize('status, retry_after', [(429, '0'), (500, None), (503, None)])
+def test_retries_a_retryable_status(stub, status, retry_after):
+    stub.config.update(error_rate=1.0, error_status=status)
+    client = make_client(stub, max_retries=2)
+    delays = []
+    recover_after_backoff(client, stub, delays)
+    assert client.generate('a column named "zip"') == 'Stub description of zip.'
+    assert delays == [(0, retry_after)]
+    assert client.stats()['retries'] == 1 and client.stats()['failures'] == 0
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.config.update(error_rate=1.0, error_status=503)
+    client = make_client(stub, max_retries=2)
+    with pytest.raises(ModelUnavailable, match='after 3 attempts'):
+        client.generate('prompt')
+    assert stub.requests_served == 3
+
+
+def test_does_not_retry_a_client_error(stub):
+    stub.config.update(error_rate=1.0, error_status=400)
+    client = make_client(stub, max_retries=2)
+    with pytest.raises(ModelUnavailable, match='400'):
+        client.generate('prompt')
+    assert stub.requests_served == 1
+
+
+def test_backoff_grows_and_is_capped(monkeypatch):
+    slept = []
+    monkeypatch.setattr('model_client.random.uniform', lambda low, high: high)
+    monkeypatch.setattr('model_client.time.sleep', slept.append)
+    client = GeminiClient('test-key', 'stub-model', backoff_base=0.5, backoff_max=3.0)
+    for attempt in range(4):
+        client._backoff(attempt)
+    client._backoff(0, retry_after='2')
+    assert slept == [0.5, 1.0, 2.0, 3.0, 2.0]
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=20, capacity=2)
+    assert bucket.acquire(0) and bucket.acquire(0)
+    assert not bucket.acquire(0)
+    started = time.monotonic()
+    assert bucket.acquire(1)
+    assert time.monotonic() - started >= 0.03
+
+
+def test_rate_limit_wait_longer_than_timeout_fails_fast(stub):
+    client = make_client(stub, rate_limit=0.1, burst=1, timeout=0.2)
+    client.generate('prompt')
+    with pytest.raises(ModelUnavailable, match='rate limit'):
+        client.generate('prompt')
+    assert stub.requests_served == 1
+
+
+def test_breaker_opens_then_lets_a_trial_through(stub):
+    stub.config.update(error_rate=1.0, error_status=503)
+    client = make_client(stub, failure_threshold=2, reset_timeout=0.2)
+    for _ in range(2):
+        with pytest.raises(ModelUnavailable):
+            client.generate('prompt')
+    assert client.stats()['circuit'] == 'open'
+    with pytest.raises(ModelUnavailable, match='circuit breaker'):
+        client.generate('prompt')
+    assert stub.requests_served == 2 and client.stats()['short_circuited'] == 1
+
+    time.sleep(0.25)
+    assert client.stats()['circuit'] == 'half-open'
+    stub.config['error_rate'] = 0.0
+    assert client.generate('prompt') == 'Stub response.'
+    assert client.stats()['circuit'] == 'closed'
+
+
+@pytest.mark.parametrize('answer', [
+    b'not json',
+    {},
+    {'candidates': []},
+    {'candidates': [{'finishReason': 'SAFETY'}]},
+    {'candidates': [{'content': {'parts': []}}]},
+    {'candidates': [{'content': {'parts': [{'text': 5}]}}]},
+    ['candidates'],
+])
+def test_unreadable_answer_is_model_unavailable(stub, answer):
+    stub.config['answer'] = answer
+    client = make_client(stub, failure_threshold=1)
+    with pytest.raises(ModelUnavailable):
+        client.generate('prompt')
+    assert client.stats()['failures'] == 1 and client.stats()['circuit'] == 'open'
+
+
+def test_connection_error_is_model_unavailable():
+    client = GeminiClient('test-key', 'stub-model', base_url='http://127.0.0.1:1/v1beta', max_retries=0)
+    with pytest.raises(ModelUnavailable):
+        client.generate('prompt')
+
+
+def test_open_breaker_falls_back_to_rule_descriptions(make_app, stub):
+    from routes import human_column_description
+
+    stub.config.update(error_rate=1.0, error_status=503)
+    app = make_app(GEMINI_BASE_URL=stub.base_url, GEMINI_BREAKER_THRESHOLD='1', GEMINI_BREAKER_RESET='60')
+    client = app.test_client()
+    services = app.extensions['csv_analyzer']
+    for _ in range(2):
+        response = client.post('/api/get_column_description', json={'column_name': 'zip_code', 'sample_data': []})
+        assert response.status_code == 200
+        with app.app_context():
+            assert response.get_json()['description'] == human_column_description(services, 'zip_code')
+    assert services.gemini_client.stats()['circuit'] == 'open'
+    assert stub.requests_served == 1
@@ -0,0 +1,76 @@
+import random
+
+import pandas as pd
+import pytest
+
+from conftest import get_when_built, upload
+from csv_ingest import summarize_csv
+from rollups import build_rollups, previous_cells, query_rollups
+
+
+def calls_csv(count, seed=7):
+    rng = random.Random(seed)
+    lines = ['id,opened,closed,district']
+    for i in range(count):
+        opened = pd.Timestamp('2024-01-01') + pd.Timedelta(minutes=rng.randrange(60 * 24 * 120))
+        closed = opened + pd.Timedelta(minutes=rng.randrange(1, 60 * 48))
+        lines.append(f"{i},{opened:%Y-%m-%d %H:%M},{closed:%Y-%m-%d %H:%M},D{rng.randrange(3)}")
+    return '\n'.join(lines) + '\n'
+
+
+def build(tmp_path, text, previous=None):
+    path = tmp_path / 'calls.csv'
+    path.write_text(text)
+    return build_rollups(str(path), summarize_csv(str(path)), previous=previous, chunksize=97)
+
+
+# Weeks ending on Sunday start on Monday, as rollup weeks do
+@pytest.mark.parametrize('grain, freq', [('day', 'D'), ('week', 'W-SUN'), ('month', 'M')])
+def test_counts_match_pandas(tmp_path, grain, freq):
+    text = calls_csv(500)
+    rollups = build(tmp_path, text)
+    rows = query_rollups(previous_cells(rollups), 'opened', grain)
+
+    opened = pd.to_datetime(pd.read_csv(tmp_path / 'calls.csv')['opened'])
+    expected = opened.dt.to_period(freq).dt.start_time.dt.strftime('%Y-%m-%d').value_counts().sort_index()
+    assert dict(zip(rows['period'], rows['count'])) == expected.to_dict()
+
+
+def test_durations_and_categories(tmp_path):
+    rows = (['2024-01-01 00:00,2024-01-01 02:00,A'] * 3 + ['2024-01-02 00:00,2024-01-02 04:00,B'] * 3
+            + ['2024-02-01 00:00,2024-02-01 01:00,A'] * 4)
+    rollups = build(tmp_path, 'id,opened,closed,district\n' + ''.join(f'{i},{row}\n' for i, row in enumerate(rows)))
+    assert rollups['plan']['category_columns'] == ['district']
+    cells = previous_cells(rollups)
+    january = query_rollups(cells, 'opened', 'month').iloc[0]
+    assert january['count'] == 6 and january['duration_mean_hours'] == pytest.approx(3.0)
+    by_district = query_rollups(cells, 'opened', 'month', 'district', ['A'])
+    assert by_district[['period', 'count']].values.tolist() == [['2024-01-01', 3], ['2024-02-01', 4]]
+    assert query_rollups(cells, 'opened', 'month', start='2024-02-01')['count'].tolist() == [4]
+
+
+def test_appended_rows_reuse_previous_cells(tmp_path):
+    text = calls_csv(300)
+    head = text[:text.index('\n', len(text) // 2) + 1]
+    previous = build(tmp_path, head)
+    appended = build(tmp_path, text, previous=previous)
+    full = build(tmp_path, text)
+    assert appended['incremental'] and not full['incremental']
+    pd.testing.assert_frame_equal(query_rollups(previous_cells(appended), 'opened', 'week').reset_index(drop=True),
+                                  query_rollups(previous_cells(full), 'opened', 'week').reset_index(drop=True))
+
+
+def test_changed_rows_are_not_reused(tmp_path):
+    text = calls_csv(100)
+    previous = build(tmp_path, text)
+    assert not build(tmp_path, text.replace('D1', 'D2') + '100,2024-01-01 00:00,,D0\n', previous=previous)['incremental']
+
+
+def test_rollups_route(client):
+    upload(client, 'calls.csv', calls_csv(200))
+    response = get_when_built(client, '/api/files/calls.csv/rollups?grain=month&category=district&values=D0')
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['available']['time_columns'] == ['opened', 'closed']
+    assert {row['category'] for row in body['rows']} == {'D0'}
+    assert client.get('/api/files/calls.csv/rollups?grain=year').status_code == 400
@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import upload
+
+FILE_ROUTES = [
+    ('get', '/api/files/{}'),
+    ('delete', '/api/files/{}'),
+    ('get', '/api/files/{}/rows'),
+    ('get', '/api/files/{}/rollups?column=date'),
+    ('get', '/api/files/{}/spatial'),
+    ('get', '/api/files/{}/spatial/districts'),
+    ('get', '/api/files/{}/spatial/tiles/0/0/0'),
+    ('get', '/api/feeds/{}'),
+]
+
+
+@pytest.mark.parametrize('method, route', FILE_ROUTES)
+@pytest.mark.parametrize('name', ['..', '.meta', '.blobs'])
+def test_dot_names_are_rejected(client, method, route, name):
+    response = getattr(client, method)(route.format(name))
+    assert response.status_code == 400
+    assert 'plain' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('method, route', FILE_ROUTES[:-1])
+def test_unknown_file_is_not_found(client, method, route):
+    assert getattr(client, method)(route.format('missing.csv')).status_code == 404
+
+
+def test_delete_removes_file_and_listing(client):
+    upload(client, 'data.csv', 'id\n1\n')
+    assert client.delete('/api/files/data.csv').status_code == 200
+    assert client.get('/api/files/data.csv').status_code == 404
+    assert client.get('/api/files').get_json()['files'] == []
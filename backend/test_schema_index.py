@@ -0,0 +1,53 @@
+import pytest
+
+from conftest import upload
+from schema_index import match_columns, normalize_name, value_shape
+
+JANUARY = ('case_id,OpenedDate,District,Status\n'
+           + ''.join(f'{i},2024-01-{1 + i % 28:02d},D{i % 3},Open\n' for i in range(40)))
+FEBRUARY = ('Case ID,opened_date,District,Status,Priority\n'
+            + ''.join(f'{i},2024-02-{1 + i % 28:02d},D{i % 3},Closed,{i % 2}\n' for i in range(40)))
+
+
+@pytest.mark.parametrize('name', ['LastEditedDate', 'last_edited_date', 'Last Edited Date', ' last-edited  date '])
+def test_normalize_name(name):
+    assert normalize_name(name) == 'last_edited_date'
+
+
+def test_value_shape():
+    assert value_shape('2023-01-05') == '9-9-9'
+    assert value_shape('Main St 12') == 'a 9'
+
+
+def test_match_columns_skips_retyped_columns():
+    old = {'Zip': {'name': 'zip', 'kind': 'integer', 'shapes': ['9']},
+           'Note': {'name': 'note', 'kind': 'string', 'shapes': ['a']}}
+    new = {'ZIP': {'name': 'zip', 'kind': 'integer', 'shapes': ['9']},
+           'Note': {'name': 'note', 'kind': 'string', 'shapes': ['9-9-9']},
+           'Extra': {'name': 'extra', 'kind': 'empty', 'shapes': []}}
+    assert match_columns(new, old) == {'ZIP': 'Zip'}
+
+
+@pytest.fixture
+def model_client(make_app, stub):
+    return make_app(GEMINI_BASE_URL=stub.base_url).test_client()
+
+
+def test_snapshot_inherits_unchanged_columns(model_client, stub):
+    first = upload(model_client, 'calls_2024_01.csv', JANUARY).get_json()
+    assert first['annotations']['District'] == 'Stub description of District.'
+    asked = stub.requests_served
+
+    second = upload(model_client, 'calls_2024_02.csv', FEBRUARY).get_json()
+    assert second['schema_match']['filename'] == 'calls_2024_01.csv'
+    assert second['annotations']['Case ID'] == 'Stub description of case_id.'
+    assert second['annotations']['opened_date'] == 'Stub description of OpenedDate.'
+    assert second['annotations']['Priority'] == 'Stub description of Priority.'
+    # Only the new column went to the model
+    assert stub.requests_served == asked + 1
+
+
+def test_unrelated_schema_has_no_match(model_client):
+    upload(model_client, 'calls_2024_01.csv', JANUARY)
+    response = upload(model_client, 'trees.csv', 'species,height_m\noak,12.5\nelm,9.0\n').get_json()
+    assert 'schema_match' not in response
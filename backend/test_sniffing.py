@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import upload
+from sniffing import UnsupportedEncoding, detect_encoding, sniff_dialect
+
+
+def write(tmp_path, data):
+    path = tmp_path / 'data.csv'
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize('data, encoding', [
+    ('id;name\n1;Café\n'.encode('utf-8'), 'utf-8'),
+    (b'\xef\xbb\xbfid,name\n1,a\n', 'utf-8-sig'),
+    ('id;name\n1;Café “x”\n'.encode('cp1252'), 'cp1252'),
+    (b'id;name\n1;\x81\n', 'latin-1'),
+])
+def test_detect_encoding(data, encoding):
+    assert detect_encoding(data) == encoding
+
+
+def test_utf16_is_refused():
+    with pytest.raises(UnsupportedEncoding):
+        detect_encoding('id,name\n'.encode('utf-16'))
+
+
+@pytest.mark.parametrize('delimiter', [',', ';', '\t', '|'])
+def test_delimiter_and_column_types(tmp_path, delimiter):
+    rows = [['id', 'price', 'name', 'note'], ['1', '2.5', '"a, b"', ''], ['2', '3', 'c', '']]
+    dialect = sniff_dialect(write(tmp_path, '\n'.join(delimiter.join(row) for row in rows).encode('utf-8')))
+    assert dialect['delimiter'] == delimiter
+    assert dialect['column_types'] == {'id': 'integer', 'price': 'float', 'name': 'string', 'note': 'empty'}
+
+
+def test_single_quoted_fields(tmp_path):
+    dialect = sniff_dialect(write(tmp_path, b"id,name\n1,'a,b'\n2,'c,d'\n"))
+    assert (dialect['delimiter'], dialect['quotechar']) == (',', "'")
+
+
+def test_cut_off_sample_keeps_whole_lines(tmp_path):
+    data = b'id;name\n' + b''.join(b'%d;n%d\n' % (i, i) for i in range(1000))
+    dialect = sniff_dialect(write(tmp_path, data), sample_bytes=1000)
+    assert dialect['delimiter'] == ';' and dialect['column_types']['id'] == 'integer'
+
+
+def test_windows_1252_semicolon_upload_reads_back(client):
+    data = 'id;name;city\n1;Café;Zürich\n2;Straße;Köln\n'.encode('cp1252')
+    assert upload(client, 'legacy.csv', data).status_code == 200
+    page = client.get('/api/files/legacy.csv/rows?offset=0&limit=10').get_json()
+    assert page['columns'] == ['id', 'name', 'city']
+    assert [row['city'] for row in page['rows']] == ['Zürich', 'Köln']
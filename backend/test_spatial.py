@@ -0,0 +1,91 @@
+import random
+
+import pandas as pd
+import pytest
+
+from conftest import get_when_built, upload
+from csv_ingest import summarize_csv
+from spatial import SpatialIndex, build_spatial_index, parse_coordinate_text
+
+
+def points_csv(count, seed=3):
+    rng = random.Random(seed)
+    lines = ['id,latitude,longitude,district']
+    for i in range(count):
+        if i % 50 == 0:
+            lines.append(f'{i},,,D{i % 4}')
+        elif i % 50 == 1:
+            lines.append(f'{i},0,0,D{i % 4}')
+        else:
+            lines.append(f'{i},{29.3 + rng.random() * 0.3:.7f},{-98.7 + rng.random() * 0.4:.7f},D{i % 4}')
+    return '\n'.join(lines) + '\n'
+
+
+def index_of(tmp_path, text, grid_size=16):
+    path = tmp_path / 'points.csv'
+    path.write_text(text)
+    return SpatialIndex(build_spatial_index(str(path), summarize_csv(str(path)), chunksize=101,
+                                            grid_size=grid_size))
+
+
+def brute_force(frame, bbox):
+    west, south, east, north = bbox
+    located = frame.dropna(subset=['latitude', 'longitude'])
+    located = located[(located['latitude'] != 0) | (located['longitude'] != 0)]
+    return int(((located['longitude'] >= west) & (located['longitude'] <= east)
+                & (located['latitude'] >= south) & (located['latitude'] <= north)).sum())
+
+
+def test_bbox_counts_are_exact(tmp_path):
+    text = points_csv(1000)
+    index = index_of(tmp_path, text)
+    frame = pd.read_csv(tmp_path / 'points.csv')
+    assert index.rows == 1000 and index.located == 960
+    assert index.count(index.bounds()) == 960
+
+    rng = random.Random(11)
+    lons = frame['longitude'].dropna().tolist()
+    lats = frame['latitude'].dropna().tolist()
+    for _ in range(200):
+        # Edges on exact point coordinates test both sides of every comparison
+        west, east = sorted(rng.sample(lons, 2))
+        south, north = sorted(rng.sample(lats, 2))
+        bbox = (west, south, east, north)
+        assert index.count(bbox) == brute_force(frame, bbox), bbox
+
+
+def test_districts_count_every_row(tmp_path):
+    index = index_of(tmp_path, points_csv(400))
+    districts = {entry['district']: entry for entry in index.districts()}
+    assert sorted(districts) == ['D0', 'D1', 'D2', 'D3']
+    assert sum(entry['rows'] for entry in districts.values()) == 400
+    assert sum(entry['located'] for entry in districts.values()) == index.located
+
+
+@pytest.mark.parametrize('text, lon, lat', [
+    ('https://maps.example/place/29.58229225N 098.42891563W', -98.42891563, 29.58229225),
+    ('POINT (-98.5 29.4)', -98.5, 29.4),
+    ('(29.4, -98.5)', -98.5, 29.4),
+])
+def test_coordinate_text(text, lon, lat):
+    lons, lats = parse_coordinate_text(pd.Series([text]))
+    assert (lons[0], lats[0]) == pytest.approx((lon, lat))
+
+
+def test_projected_xy_columns(tmp_path):
+    text = 'id,X,Y\n' + ''.join(f'{i},{2100000 + i * 10},{13700000 + i * 7}\n' for i in range(100))
+    index = index_of(tmp_path, text)
+    assert not index.geographic
+    assert index.count((2100000, 13700000, 2100090, 13700063)) == 10
+
+
+def test_spatial_routes(client):
+    upload(client, 'points.csv', points_csv(300))
+    response = get_when_built(client, '/api/files/points.csv/spatial?bbox=-98.7,29.3,-98.3,29.6')
+    summary = response.get_json()
+    assert response.status_code == 200
+    assert summary['coordinates']['y'] == 'latitude' and summary['count'] == summary['located'] == 288
+    tile = client.get('/api/files/points.csv/spatial/tiles/0/0/0?bins=8').get_json()
+    assert tile['total'] == sum(count for _, _, count in tile['cells']) == 288
+    assert client.get('/api/files/points.csv/spatial?bbox=1,2,3').status_code == 400
+    assert client.get('/api/files/points.csv/spatial/tiles/1/5/0').status_code == 400
@@ -0,0 +1,57 @@
+import pytest
+
+from conftest import upload
+from validator import default_key_columns, validate_file
+
+
+def write(tmp_path, text):
+    path = tmp_path / 'data.csv'
+    path.write_text(text)
+    return str(path)
+
+
+def test_default_key_is_an_exact_id_column():
+    assert default_key_columns(['Width', 'Provider', 'video_id']) == []
+    assert default_key_columns(['name', ' ID ']) == [' ID ']
+
+
+def test_id_like_columns_are_not_checked_without_key_columns(tmp_path):
+    report = validate_file(write(tmp_path, 'Width,Provider\n1,a\n1,a\n'))
+    assert report['key_columns'] == []
+    assert report['errors']['duplicate_keys']['count'] == 0
+
+
+def test_duplicate_keys_across_batches(tmp_path):
+    text = 'id,name\n' + ''.join(f'{i % 7},n{i}\n' for i in range(20))
+    report = validate_file(write(tmp_path, text), batch_rows=3, max_samples=2)
+    duplicates = report['errors']['duplicate_keys']
+    assert duplicates['count'] == 13
+    assert duplicates['samples'] == [{'row': 8, 'key': {'id': '0'}}, {'row': 9, 'key': {'id': '1'}}]
+    assert not report['is_valid']
+
+
+def test_compound_key_and_ragged_rows_keep_row_numbers(tmp_path):
+    text = 'a,b,c\n1,x,p\n1,y,q\nbad\n1,x,r\n'
+    report = validate_file(write(tmp_path, text), key_columns=['a', 'b'])
+    assert report['errors']['ragged_rows']['count'] == 1
+    assert report['errors']['duplicate_keys']['samples'] == [{'row': 4, 'key': {'a': '1', 'b': 'x'}}]
+
+
+def test_type_violations(tmp_path):
+    text = 'n\n' + '1\n' * 40 + 'x\n'
+    report = validate_file(write(tmp_path, text))
+    assert report['errors']['type_violations']['by_column'] == {'n': 1}
+
+
+@pytest.mark.parametrize('max_samples', ['abc', None, -1])
+def test_bad_max_samples_is_a_client_error(client, max_samples):
+    upload(client, 'data.csv', 'id\n1\n1\n')
+    response = client.post('/api/validate', json={'filename': 'data.csv', 'max_samples': max_samples})
+    assert response.status_code == 400
+
+
+def test_validate_stored_upload(client):
+    upload(client, 'data.csv', 'id,name\n1,a\n1,b\n')
+    response = client.post('/api/validate', json={'filename': 'data.csv', 'max_samples': '5'})
+    validation = response.get_json()['validation']
+    assert validation['errors']['duplicate_keys']['samples'] == [{'row': 2, 'key': {'id': '1'}}]
@@ -0,0 +1,207 @@
+"""
+Streaming validation of stored uploads
+
+Rows are read with the csv module so ragged rows and undecodable bytes can be
+reported instead of aborting the parse. Well-formed rows are checked in
+batches with vectorized pandas operations against a schema inferred from the
+start of the file. Key columns are reduced to one 64-bit hash per row and
+duplicates are found by sorting those hashes once the file is read.
+"""
+
+import csv
+
+import numpy as np
+import pandas as pd
+
+from profiler import infer_schema
+from sniffing import resolve_dialect
+
+BATCH_ROWS = 50_000
+MAX_SAMPLES = 20
+# Bytes that are not valid UTF-8 decode to lone surrogates under 'surrogateescape'
+INVALID_BYTES = '[\udc80-\udcff]'
+BOOLEAN_VALUES = {'true', 'false'}
+
+
+class ErrorLog:
+    """Counts every error of one kind but keeps only the first few as samples"""
+
+    def __init__(self, max_samples):
+        self.count = 0
+        self.samples = []
+        self.max_samples = max_samples
+
+    def add(self, count, samples):
+        self.count += count
+        room = self.max_samples - len(self.samples)
+        if room > 0:
+            self.samples.extend(samples[:room])
+
+    def result(self):
+        return {'count': self.count, 'samples': self.samples}
+
+
+def default_key_columns(columns):
+    """Use a column named ``id`` (any case) as the key when the caller does not name one"""
+    for col in columns:
+        if str(col).strip().lower() == 'id':
+            return [col]
+    return []
+
+
+def type_violations(values, column_schema):
+    """Return a boolean mask of non-empty values that do not fit the column's dtype"""
+    present = values.notna() & (values != '')
+    dtype = column_schema['dtype']
+    if dtype in ('integer', 'float'):
+        numbers = pd.to_numeric(values.where(present), errors='coerce')
+        bad = numbers.isna()
+        if dtype == 'integer':
+            bad |= np.mod(numbers.fillna(0), 1) != 0
+    elif dtype == 'boolean':
+        bad = ~values.str.lower().isin(BOOLEAN_VALUES)
+    elif dtype == 'datetime':
+        bad = pd.to_datetime(values.where(present), format=column_schema['datetime_format'], errors='coerce').isna()
+    else:
+        return pd.Series(False, index=values.index)
+    return present & bad
+
+
+class FileValidator:
+    def __init__(self, header, schema, key_columns, max_samples):
+        self.header = header
+        self.schema = schema
+        self.key_columns = [col for col in key_columns if col in header]
+        # Per batch: the hash of each row's key and the row's number
+        self.key_hashes = []
+        self.key_rows = []
+        self.rows = 0
+        self.ragged = ErrorLog(max_samples)
+        self.encoding = ErrorLog(max_samples)
+        self.types = ErrorLog(max_samples)
+        self.type_counts = {}
+        self.duplicates = ErrorLog(max_samples)
+
+    def check_batch(self, rows, row_numbers):
+        frame = pd.DataFrame(rows, columns=self.header, dtype=object)
+        numbers = np.asarray(row_numbers)
+
+        for col in self.header:
+            values = frame[col]
+            bad_bytes = values.str.contains(INVALID_BYTES, regex=True, na=False)
+            if bad_bytes.any():
+                positions = np.flatnonzero(bad_bytes.to_numpy())
+                self.encoding.add(len(positions), [
+                    {'row': int(numbers[i]), 'column': col,
+                     'value': values.iloc[i].encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')}
+                    for i in positions[:MAX_SAMPLES]
+                ])
+
+            column_schema = self.schema.get(col)
+            if column_schema is None:
+                continue
+            bad = type_violations(values, column_schema) & ~bad_bytes
+            if bad.any():
+                positions = np.flatnonzero(bad.to_numpy())
+                self.type_counts[col] = self.type_counts.get(col, 0) + len(positions)
+                self.types.add(len(positions), [
+                    {'row': int(numbers[i]), 'column': col, 'value': values.iloc[i],
+                     'expected': column_schema['dtype']}
+                    for i in positions[:MAX_SAMPLES]
+                ])
+
+        if self.key_columns:
+            self.key_hashes.append(pd.util.hash_pandas_object(frame[self.key_columns], index=False).to_numpy())
+            self.key_rows.append(numbers.astype(np.int64))
+
+    def duplicate_rows(self):
+        """Row numbers whose key repeats an earlier row's, in file order"""
+        if not self.key_hashes:
+            return np.empty(0, dtype=np.int64)
+        hashes = np.concatenate(self.key_hashes)
+        rows = np.concatenate(self.key_rows)
+        self.key_hashes = self.key_rows = []
+        # Stable, so the first row with a key sorts ahead of its repeats
+        order = np.argsort(hashes, kind='stable')
+        repeats = hashes[order[1:]] == hashes[order[:-1]]
+        return np.sort(rows[order[1:][repeats]])
+
+    def result(self):
+        errors = {
+            'ragged_rows': self.ragged.result(),
+            'encoding_errors': self.encoding.result(),
+            'type_violations': dict(self.types.result(), by_column=self.type_counts),
+            'duplicate_keys': self.duplicates.result()
+        }
+        return {
+            'total_rows': self.rows,
+            'total_columns': len(self.header),
+            'schema': self.schema,
+            'key_columns': self.key_columns,
+            'is_valid': not any(error['count'] for error in errors.values()),
+            'errors': errors
+        }
+
+
+def open_rows(f, dialect):
+    """Return a csv reader over ``f`` and its header (the first non-empty row)"""
+    reader = csv.reader(f, delimiter=dialect['delimiter'], quotechar=dialect['quotechar'])
+    return reader, next((row for row in reader if row), [])
+
+
+def key_samples(filepath, dialect, key_columns, row_numbers):
+    """Re-read the file up to the last of ``row_numbers`` and return those rows' keys"""
+    wanted = set(row_numbers.tolist())
+    keys = {}
+    with open(filepath, 'r', encoding=dialect['encoding'], errors='surrogateescape', newline='') as f:
+        reader, header = open_rows(f, dialect)
+        positions = [header.index(col) for col in key_columns]
+        row_number = 0
+        for row in reader:
+            if not row:
+                continue
+            row_number += 1
+            if row_number in wanted:
+                keys[row_number] = {col: row[i] for col, i in zip(key_columns, positions)}
+                if len(keys) == len(wanted):
+                    break
+    return [{'row': number, 'key': keys[number]} for number in row_numbers.tolist()]
+
+
+def validate_file(filepath, key_columns=None, batch_rows=BATCH_ROWS, max_samples=MAX_SAMPLES, dialect=None):
+    """Stream a stored CSV and report structural, encoding, type and key problems
+
+    Without ``key_columns`` only a column named ``id`` is checked for duplicates.
+    """
+    dialect = resolve_dialect(filepath, dialect)
+    schema = infer_schema(filepath, dialect=dialect)
+    with open(filepath, 'r', encoding=dialect['encoding'], errors='surrogateescape', newline='') as f:
+        reader, header = open_rows(f, dialect)
+        if key_columns is None:
+            key_columns = default_key_columns(header)
+        validator = FileValidator(header, schema, key_columns, max_samples)
+
+        rows = []
+        row_numbers = []
+        for row in reader:
+            if not row:
+                continue
+            validator.rows += 1
+            if len(row) != len(header):
+                validator.ragged.add(1, [{'row': validator.rows, 'line': reader.line_num,
+                                          'expected_fields': len(header), 'found_fields': len(row)}])
+                continue
+            rows.append(row)
+            row_numbers.append(validator.rows)
+            if len(rows) >= batch_rows:
+                validator.check_batch(rows, row_numbers)
+                rows = []
+                row_numbers = []
+        if rows:
+            validator.check_batch(rows, row_numbers)
+
+    duplicates = validator.duplicate_rows()
+    if len(duplicates):
+        validator.duplicates.add(len(duplicates), key_samples(filepath, dialect, validator.key_columns,
+                                                              duplicates[:max(max_samples, 0)]))
+    return validator.result()
@@ -0,0 +1,12 @@
+"""
+Production entry point
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Each gunicorn worker imports this module after the fork and builds its own
+app; gunicorn.conf.py warms it up and shuts it down with the worker.
+"""
+
+from app import create_app
+
+app = create_app()
@@ -30,7 +30,12 @@ export default function CSVPreview() {
   const handleDownload = async () => {
     setIsDownloading(true);
     try {
-      await apiService.downloadCSV(csvData, fileName || 'processed_data.csv');
+      if (fileName) {
+        // The preview only holds sample rows; the server streams the full upload
+        await apiService.downloadStoredCSV(fileName);
+      } else {
+        await apiService.downloadCSV(csvData, 'processed_data.csv');
+      }
     } catch (error) {
       console.error('Download failed:', error);
       alert('Download failed. Please try again.');
@@ -21,13 +21,19 @@ export default function UploadPage() {
       setUploadError('');
       
       try {
-        const result = await apiService.uploadCSV(file);
+        const result = await apiService.uploadCSV(file, { asyncAnnotations: true });
         
         if (result.success) {
           setFileName(result.filename);
           setCsvData(result.data);
           setCsvStats(result.stats);
           setColumnDescriptions(result.column_descriptions || {});
+          if (result.annotation_job) {
+            // Descriptions arrive after the preview is already showing
+            apiService.waitForJob(result.annotation_job.id)
+              .then((job) => setColumnDescriptions(job.result || {}))
+              .catch((error) => console.error('Annotation failed:', error));
+          }
           navigate('/edit');
         } else {
           setUploadError('Upload failed. Please try again.');
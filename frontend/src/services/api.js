@@ -16,13 +16,14 @@ class ApiService {
     }
   }
 
-  // Upload CSV file
-  async uploadCSV(file) {
+  // Upload CSV file; with asyncAnnotations the response carries an annotation_job to poll
+  async uploadCSV(file, { asyncAnnotations = false } = {}) {
     try {
       const formData = new FormData();
       formData.append('file', file);
 
-      const response = await fetch(`${this.baseURL}/upload`, {
+      const query = asyncAnnotations ? '?async=1' : '';
+      const response = await fetch(`${this.baseURL}/upload${query}`, {
         method: 'POST',
         body: formData,
       });
@@ -39,6 +40,99 @@ class ApiService {
     }
   }
 
+  // Upload a large CSV in parallel parts. Interrupted uploads resume by passing
+  // the previous uploadId; files the server already has finish immediately.
+  async uploadCSVChunked(file, { partSize = 8 * 1024 * 1024, concurrency = 4, asyncAnnotations = false, uploadId = null } = {}) {
+    const toHex = (buffer) => Array.from(new Uint8Array(buffer)).map((b) => b.toString(16).padStart(2, '0')).join('');
+    // A busy server answers 429/503 with Retry-After; wait and resend a few times
+    const request = async (url, options, message, retries = 3) => {
+      let response = await fetch(url, options);
+      for (let attempt = 0; (response.status === 429 || response.status === 503) && attempt < retries; attempt++) {
+        const delay = Number(response.headers.get('Retry-After')) || 1;
+        await new Promise((resolve) => setTimeout(resolve, delay * 1000));
+        response = await fetch(url, options);
+      }
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || message);
+      }
+      return response.json();
+    };
+
+    try {
+      let session;
+      if (uploadId) {
+        session = await request(`${this.baseURL}/uploads/${uploadId}`, {}, 'Upload not found');
+      } else {
+        const sha256 = toHex(await crypto.subtle.digest('SHA-256', await file.arrayBuffer()));
+        session = await request(`${this.baseURL}/uploads`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ filename: file.name, size: file.size, part_size: partSize, sha256 }),
+        }, 'Upload failed');
+        if (session.complete) {
+          return session;
+        }
+      }
+
+      const queue = [];
+      const sendParts = async () => {
+        while (queue.length) {
+          const index = queue.shift();
+          const part = await file.slice(index * session.part_size, (index + 1) * session.part_size).arrayBuffer();
+          await request(`${this.baseURL}/uploads/${session.upload_id}/parts/${index}`, {
+            method: 'PUT',
+            headers: { 'X-Part-SHA256': toHex(await crypto.subtle.digest('SHA-256', part)) },
+            body: part,
+          }, `Part ${index} failed`);
+        }
+      };
+      // A part the server did not record (e.g. its worker restarted) is listed
+      // again as missing, so re-send until none are left before completing
+      let missing = session.missing_parts;
+      for (let round = 0; missing.length && round < 3; round++) {
+        queue.push(...missing);
+        await Promise.all(Array.from({ length: concurrency }, sendParts));
+        ({ missing_parts: missing } = await request(`${this.baseURL}/uploads/${session.upload_id}`, {}, 'Upload not found'));
+      }
+
+      const query = asyncAnnotations ? '?async=1' : '';
+      return await request(`${this.baseURL}/uploads/${session.upload_id}/complete${query}`, { method: 'POST' }, 'Upload failed');
+    } catch (error) {
+      console.error('Chunked upload failed:', error);
+      throw error;
+    }
+  }
+
+  // Get background job status
+  async getJob(jobId) {
+    try {
+      const response = await fetch(`${this.baseURL}/jobs/${encodeURIComponent(jobId)}`);
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || 'Failed to get job');
+      }
+      return await response.json();
+    } catch (error) {
+      console.error('Failed to get job:', error);
+      throw error;
+    }
+  }
+
+  // Poll a background job until it finishes and return the finished job
+  async waitForJob(jobId, intervalMs = 1000) {
+    for (;;) {
+      const { job } = await this.getJob(jobId);
+      if (job.status === 'done') {
+        return job;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Job failed');
+      }
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+  }
+
   // Analyze CSV data
   async analyzeCSV(csvData) {
     try {
@@ -62,6 +156,29 @@ class ApiService {
     }
   }
 
+  // Profile a stored upload on the server
+  async analyzeFile(filename, refresh = false) {
+    try {
+      const response = await fetch(`${this.baseURL}/analyze`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ filename, refresh }),
+      });
+
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || 'Analysis failed');
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error('Analysis failed:', error);
+      throw error;
+    }
+  }
+
   // Download CSV file
   async downloadCSV(csvData, filename = 'processed_data.csv') {
     try {
@@ -78,16 +195,7 @@ class ApiService {
         throw new Error(errorData.error || 'Download failed');
       }
 
-      // Create blob and download
-      const blob = await response.blob();
-      const url = window.URL.createObjectURL(blob);
-      const a = document.createElement('a');
-      a.href = url;
-      a.download = filename;
-      document.body.appendChild(a);
-      a.click();
-      window.URL.revokeObjectURL(url);
-      document.body.removeChild(a);
+      await this.saveResponse(response, filename);
 
       return { success: true };
     } catch (error) {
@@ -96,6 +204,46 @@ class ApiService {
     }
   }
 
+  // Download a stored upload, streamed by the server with optional edits
+  // transforms: { columns, drop, rename, filters: [{ column, op, value }] }
+  async downloadStoredCSV(filename, { transforms = {}, compression = 'none' } = {}) {
+    try {
+      const response = await fetch(`${this.baseURL}/download`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ filename, transforms, compression }),
+      });
+
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || 'Download failed');
+      }
+
+      const suffix = { gzip: '.gz', zstd: '.zst' }[compression] || '';
+      await this.saveResponse(response, `${filename}${suffix}`);
+
+      return { success: true };
+    } catch (error) {
+      console.error('Download failed:', error);
+      throw error;
+    }
+  }
+
+  // Create blob and download
+  async saveResponse(response, filename) {
+    const blob = await response.blob();
+    const url = window.URL.createObjectURL(blob);
+    const a = document.createElement('a');
+    a.href = url;
+    a.download = filename;
+    document.body.appendChild(a);
+    a.click();
+    window.URL.revokeObjectURL(url);
+    document.body.removeChild(a);
+  }
+
   // Submit feedback
   async submitFeedback(feedbackData) {
     try {
@@ -142,6 +290,30 @@ class ApiService {
     }
   }
 
+  // Validate a stored upload on the server
+  async validateFile(filename, keyColumns = null) {
+    try {
+      const body = keyColumns ? { filename, key_columns: keyColumns } : { filename };
+      const response = await fetch(`${this.baseURL}/validate`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(body),
+      });
+
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || 'Validation failed');
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error('Validation failed:', error);
+      throw error;
+    }
+  }
+
   // Login user
   async login(email, password) {
     try {
@@ -188,10 +360,16 @@ class ApiService {
     }
   }
 
-  // List uploaded files
-  async listFiles() {
+  // List uploaded files, one page at a time ({ limit, sort, order, prefix, cursor })
+  async listFiles(options = {}) {
     try {
-      const response = await fetch(`${this.baseURL}/files`);
+      const params = new URLSearchParams();
+      Object.entries(options).forEach(([key, value]) => {
+        if (value !== undefined && value !== null && value !== '') {
+          params.append(key, value);
+        }
+      });
+      const response = await fetch(`${this.baseURL}/files?${params}`);
       if (!response.ok) {
         const errorData = await response.json();
         throw new Error(errorData.error || 'Failed to list files');
@@ -203,6 +381,39 @@ class ApiService {
     }
   }
 
+  // Delete an uploaded file and everything derived from it
+  async deleteFile(filename) {
+    try {
+      const response = await fetch(`${this.baseURL}/files/${encodeURIComponent(filename)}`, {
+        method: 'DELETE',
+      });
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || 'Failed to delete file');
+      }
+      return await response.json();
+    } catch (error) {
+      console.error('Failed to delete file:', error);
+      throw error;
+    }
+  }
+
+  // Get a window of rows from an uploaded file
+  async getFileRows(filename, offset = 0, limit = 100) {
+    try {
+      const params = new URLSearchParams({ offset, limit });
+      const response = await fetch(`${this.baseURL}/files/${encodeURIComponent(filename)}/rows?${params}`);
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || 'Failed to get rows');
+      }
+      return await response.json();
+    } catch (error) {
+      console.error('Failed to get rows:', error);
+      throw error;
+    }
+  }
+
   // Get file information
   async getFileInfo(filename) {
     try {